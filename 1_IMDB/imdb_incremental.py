@@ -0,0 +1,225 @@
+"""
+Use this script to refresh the results of task 1 and task 2 incrementally from a new daily dump of title.basics.tsv.
+The title hash and the extracted keywords of each short and movie are kept in a local SQLite store together with the
+keyword counts of every result set. Only new or changed titles are tagged again; the counts are updated by removing
+the keywords of changed or deleted titles and adding the keywords of new or changed titles.
+The first run tags every title and builds the store. Example:
+python imdb_incremental.py title.basics.tsv --store imdb_keywords.sqlite
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import sys
+from collections import Counter
+
+from imdb_keywords import DEFAULT_TOP_WORDS, DEFAULT_TOP_WORDS_PER_GENRE, GENRE, GLOBAL, result_set_keywords
+from title_basics import parse_title_line
+from title_keywords import TitleKeywordsJob
+
+DEFAULT_STORE = 'imdb_keywords.sqlite'
+
+# Number of new or changed titles tagged and applied to the store together
+DEFAULT_BATCH_SIZE = 10000
+
+# Key of the global result set in the keyword_counts table, where the primary key can not contain NULL
+GLOBAL_GENRE = ''
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    tconst TEXT PRIMARY KEY,
+    hash TEXT NOT NULL,
+    title_type TEXT NOT NULL,
+    genres TEXT NOT NULL,
+    keywords TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS keyword_counts (
+    result_set TEXT NOT NULL,
+    genre TEXT NOT NULL,
+    keyword TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (result_set, genre, keyword)
+);
+CREATE INDEX IF NOT EXISTS keyword_counts_by_result ON keyword_counts (result_set, genre, count);
+"""
+
+
+def title_hash(title_type, primary_title, genre_list):
+    """
+    :return: hash of the columns the results depend on
+    """
+    return hashlib.sha1('\t'.join((title_type, primary_title, genre_list)).encode('utf-8')).hexdigest()
+
+
+def keyword_deltas(title_type, genre_list, keywords, sign):
+    """
+    :param sign: 1 to add the keywords of the title to the counts, -1 to remove them
+    :return: Counter of (result_set, genre, keyword) -> delta
+    """
+    deltas = Counter()
+    for result_set, genre, keyword in result_set_keywords(title_type, genre_list, keywords):
+        deltas[(result_set, genre if genre is not None else GLOBAL_GENRE, keyword)] += sign
+    return deltas
+
+
+class IncrementalKeywordStore:
+    """
+    The SQLite store of the titles and keyword counts
+    """
+
+    def __init__(self, path, job_args=()):
+        """
+        :param path: path of the SQLite database, created if missing
+        :param job_args: options of the keyword extraction, as on the command line of the IMDB jobs
+        """
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        self.job_args = list(job_args)
+        self.extraction = None
+        self.tagged = 0
+        self.deleted = 0
+
+    def stored_hashes(self):
+        """
+        :return: dict of tconst -> hash of the stored titles
+        """
+        return dict(self.connection.execute('SELECT tconst, hash FROM titles'))
+
+    def extract_keywords(self, titles):
+        """
+        Tags a batch of titles with the keyword extraction of the IMDB jobs, loaded on first use
+        :param titles: list of (tconst, primary_title)
+        :return: dict of tconst -> list of keywords
+        """
+        if self.extraction is None:
+            self.extraction = TitleKeywordsJob(self.job_args)
+            self.extraction.init_keyword_extraction()
+
+        keywords = {tconst: [] for tconst, _ in titles}
+        for tconst, primary_title in titles:
+            for key, keyword in self.extraction.extract_keywords(tconst, primary_title):
+                keywords[key].append(keyword)
+        for key, keyword in self.extraction.flush_keywords():
+            keywords[key].append(keyword)
+        return keywords
+
+    def apply(self, deltas):
+        """
+        Applies keyword count deltas and removes the keywords whose count drops to zero
+        :param deltas: Counter of (result_set, genre, keyword) -> delta
+        """
+        for (result_set, genre, keyword), delta in deltas.items():
+            if not delta:
+                continue
+            updated = self.connection.execute(
+                'UPDATE keyword_counts SET count = count + ? WHERE result_set = ? AND genre = ? AND keyword = ?',
+                (delta, result_set, genre, keyword)).rowcount
+            if not updated:
+                self.connection.execute('INSERT INTO keyword_counts VALUES (?, ?, ?, ?)',
+                                        (result_set, genre, keyword, delta))
+            elif delta < 0:
+                self.connection.execute('DELETE FROM keyword_counts '
+                                        'WHERE result_set = ? AND genre = ? AND keyword = ? AND count <= 0',
+                                        (result_set, genre, keyword))
+
+    def old_keyword_deltas(self, tconsts):
+        """
+        :param tconsts: stored titles which are changed or deleted
+        :return: Counter of the deltas removing their stored keywords from the counts
+        """
+        deltas = Counter()
+        for tconst in tconsts:
+            row = self.connection.execute('SELECT title_type, genres, keywords FROM titles WHERE tconst = ?',
+                                          (tconst,)).fetchone()
+            if row is not None:
+                title_type, genre_list, keywords = row
+                deltas.update(keyword_deltas(title_type, genre_list, json.loads(keywords), -1))
+        return deltas
+
+    def refresh_batch(self, rows):
+        """
+        Tags a batch of new or changed titles and applies it to the store in one transaction
+        :param rows: list of (tconst, hash, title_type, primary_title, genre_list)
+        """
+        keywords = self.extract_keywords([(tconst, primary_title) for tconst, _, _, primary_title, _ in rows])
+        with self.connection:
+            deltas = self.old_keyword_deltas([row[0] for row in rows])
+            for tconst, hash_value, title_type, _, genre_list in rows:
+                deltas.update(keyword_deltas(title_type, genre_list, keywords[tconst], 1))
+                self.connection.execute('INSERT OR REPLACE INTO titles VALUES (?, ?, ?, ?, ?)',
+                                        (tconst, hash_value, title_type, genre_list,
+                                         json.dumps(keywords[tconst])))
+            self.apply(deltas)
+        self.tagged += len(rows)
+
+    def delete(self, tconsts):
+        """
+        Removes titles which are not in the dump anymore, or are not shorts or movies anymore
+        :param tconsts: stored titles to delete
+        """
+        with self.connection:
+            self.apply(self.old_keyword_deltas(tconsts))
+            self.connection.executemany('DELETE FROM titles WHERE tconst = ?', [(tconst,) for tconst in tconsts])
+        self.deleted += len(tconsts)
+
+    def refresh(self, input_file, batch_size=DEFAULT_BATCH_SIZE):
+        """
+        Applies a full dump of title.basics.tsv to the store
+        :param input_file: path of the dump, or of the compact file written by title_basics.py
+        :param batch_size: number of new or changed titles tagged together
+        """
+        stored_hashes = self.stored_hashes()
+        batch = []
+        with open(input_file, encoding='utf-8') as f:
+            for line in f:
+                tconst, title_type, primary_title, genre_list = parse_title_line(line.rstrip('\n'))
+                if title_type not in ('short', 'movie'):
+                    continue
+
+                hash_value = title_hash(title_type, primary_title, genre_list)
+
+                # Whatever is left in stored_hashes after the scan is not in the dump anymore
+                if stored_hashes.pop(tconst, None) != hash_value:
+                    batch.append((tconst, hash_value, title_type, primary_title, genre_list))
+                    if len(batch) >= batch_size:
+                        self.refresh_batch(batch)
+                        batch = []
+
+        if batch:
+            self.refresh_batch(batch)
+        self.delete(list(stored_hashes))
+
+    def top_keywords(self, top_words=DEFAULT_TOP_WORDS, top_words_per_genre=DEFAULT_TOP_WORDS_PER_GENRE):
+        """
+        :return: generator of ((result_set, genre), (count, keyword)), in the same format as imdb_keywords.py
+        """
+        results = self.connection.execute('SELECT DISTINCT result_set, genre FROM keyword_counts '
+                                           'ORDER BY result_set DESC, genre').fetchall()
+        for result_set, genre in results:
+            limit = top_words if result_set == GLOBAL else top_words_per_genre
+            rows = self.connection.execute('SELECT count, keyword FROM keyword_counts '
+                                           'WHERE result_set = ? AND genre = ? ORDER BY count DESC LIMIT ?',
+                                           (result_set, genre, limit))
+            for count, keyword in rows:
+                yield (result_set, genre if result_set == GENRE else None), (count, keyword)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Incremental refresh of the IMDB keyword results')
+    parser.add_argument('input_file', help='daily dump of title.basics.tsv')
+    parser.add_argument('--store', default=DEFAULT_STORE, help='path of the SQLite store')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='number of new or changed titles tagged together')
+    parser.add_argument('--top-words', type=int, default=DEFAULT_TOP_WORDS)
+    parser.add_argument('--top-words-per-genre', type=int, default=DEFAULT_TOP_WORDS_PER_GENRE)
+    args, job_args = parser.parse_known_args()
+
+    store = IncrementalKeywordStore(args.store, job_args)
+    store.refresh(args.input_file, args.batch_size)
+    for result, word_count_pair in store.top_keywords(args.top_words, args.top_words_per_genre):
+        print(json.dumps(result) + '\t' + json.dumps(word_count_pair))
+    store.connection.close()
+
+    print('Tagged {} new or changed titles, deleted {} titles'.format(store.tagged, store.deleted),
+          file=sys.stderr)
@@ -0,0 +1,210 @@
+import os
+import sys
+
+from mrjob.step import MRStep
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from title_basics import parse_title_line
+from title_keywords import TitleKeywordsJob
+from top_k import TopK, top_k
+
+# Result sets of the job, used as the first part of each output key:
+# ["global", null] for the top keywords of shorts and movies (task 1),
+# ["genre", genre] for the top keywords of shorts by genre (task 2)
+GLOBAL = 'global'
+GENRE = 'genre'
+
+# Default number of most common keywords in each result set
+DEFAULT_TOP_WORDS = 50
+DEFAULT_TOP_WORDS_PER_GENRE = 15
+
+
+def result_set_keywords(title_type, genre_list, keywords):
+    """
+    Assigns the keywords of a title to the result sets the title belongs to:
+    the global result set and, for shorts, the result set of each genre
+    :param title_type: titleType column
+    :param genre_list: genres column
+    :param keywords: keywords of the primary title
+    :return: generator of (result_set, genre, keyword), genre is None for the global result set
+    """
+    genres = [genre.lower() for genre in genre_list.split(',')] if title_type == 'short' else []
+    for keyword in keywords:
+        yield GLOBAL, None, keyword
+        for genre in genres:
+            yield GENRE, genre, keyword
+
+
+class MostCommonKeyWordsAllResultsIMDB(TitleKeywordsJob):
+    """
+    Computes the results of task 1 and task 2 in a single scan of the input file:
+    each title is tokenized and tagged once and its keywords are counted for every result set it belongs to.
+    """
+
+    def configure_args(self):
+        super(MostCommonKeyWordsAllResultsIMDB, self).configure_args()
+        self.add_passthru_arg('--top-words', type=int, default=DEFAULT_TOP_WORDS,
+                              help='Number of most common keywords of shorts and movies')
+        self.add_passthru_arg('--top-words-per-genre', type=int, default=DEFAULT_TOP_WORDS_PER_GENRE,
+                              help='Number of most common keywords of shorts per genre')
+
+    def top_words(self, result_set):
+        """
+        :param result_set: GLOBAL or GENRE
+        :return: number of most common keywords in the result set
+        """
+        if result_set == GLOBAL:
+            return self.options.top_words
+        return self.options.top_words_per_genre
+
+    def mapper_init(self):
+        """
+        This initializer loads the NLP models once per mapper and prepares the keyword extraction
+        """
+        self.init_keyword_extraction()
+
+    def mapper_keywords(self, _, line):
+        """
+        This mapper filters the line by the title type (second column) and extracts the keywords of the
+        primary title (third column) once for all the result sets the title belongs to.
+        Titles are buffered and tagged in batches and the keywords are counted in the mapper
+        until the counts are spilled.
+        :param _: None
+        :param line: one line from the input file (raw or compact)
+        :return: ((result_set, genre, keyword), count)
+        """
+
+        # For input file type TSV, read the columns of the raw file or of the compact file written by title_basics.py
+        _, title_type, primary_title, genre_list = parse_title_line(line)
+
+        if title_type in ('short', 'movie'):
+            self.count_keywords(self.extract_keywords((title_type, genre_list), primary_title))
+
+        for keyword_count in self.keyword_counts.spill_if_full():
+            yield keyword_count
+
+    def mapper_final(self):
+        """
+        This finalizer tags the titles left in the buffers, emits the keyword counts (or the keyword sketch
+        of each result set in the approximate mode) and reports the usage of the language and part of speech caches
+        and how much the counting in the mapper cut the shuffle
+        :return: ((result_set, genre, keyword), count) or ((result_set, genre), sketch state)
+        """
+        self.count_keywords(self.flush_keywords())
+        for keyword_count in self.keyword_counts.spill():
+            yield keyword_count
+        for result_sketch in self.keyword_sketches.spill():
+            yield result_sketch
+
+        self.increment_keyword_counters()
+
+    def count_keywords(self, title_keyword_pairs):
+        """
+        Counts each keyword in the global result set and, for shorts, in the result set of each genre,
+        or adds it to the sketches of these result sets in the approximate mode
+        :param title_keyword_pairs: iterable of ((title_type, genre_list), keyword)
+        """
+        for (title_type, genre_list), keyword in title_keyword_pairs:
+            for result_set, genre, _ in result_set_keywords(title_type, genre_list, [keyword]):
+                if self.options.approximate:
+                    self.keyword_sketches.add((result_set, genre), keyword, 1)
+                else:
+                    self.keyword_counts.add((result_set, genre, keyword), 1)
+
+    def combiner_count_words(self, result_keyword, counts):
+        """
+        This combiner sums the keywords we've selected so far by key
+        :param result_keyword: (result_set, genre, keyword)
+        :param counts: the number of occurrences counted by a mapper
+        :return: ((result_set, genre, keyword), sum)
+        """
+        yield result_keyword, sum(counts)
+
+    def reducer_init_top_words(self):
+        """
+        This initializer prepares the bounded heaps of the most common keywords
+        of each result set seen by this reducer
+        """
+        self.top_words_by_result = {}
+
+    def reducer_count_words(self, result_keyword, counts):
+        """
+        This reducer sums the occurrences of each keyword of a result set and keeps only
+        the top keywords of each result set it sees
+        :param result_keyword: (result_set, genre, keyword)
+        :param counts: the number of occurrences of the key from the result of the combiner
+        :return: None
+        """
+        result_set, genre, keyword = result_keyword
+        result = (result_set, genre)
+        if result not in self.top_words_by_result:
+            self.top_words_by_result[result] = TopK(self.top_words(result_set))
+        self.top_words_by_result[result].push(sum(counts), keyword)
+
+    def reducer_final_top_words(self):
+        """
+        This finalizer sends the top (count, keyword) pairs of each result set seen by this reducer to the next step
+        :return: ((result_set, genre), (count, keyword))
+        """
+        for result, top_words in self.top_words_by_result.items():
+            for count, keyword in top_words.pairs():
+                yield result, (count, keyword)
+
+    def combiner_find_top_words(self, result, word_count_pairs):
+        """
+        This combiner merges the partial top lists of a result set into a single one
+        :param result: (result_set, genre)
+        :param word_count_pairs: each item of word_count_pairs is (count, keyword)
+        :return: ((result_set, genre), (count, keyword))
+        """
+        for word_count_pair in top_k(word_count_pairs, self.top_words(result[0])):
+            yield result, word_count_pair
+
+    def reducer_find_top_words(self, result, word_count_pairs):
+        """
+        This reducer gets the most common keywords of each result set
+        :param result: (result_set, genre), genre is None for the global result set
+        :param word_count_pairs: each item of word_count_pairs is (count, keyword)
+        :return: ((result_set, genre), (count, keyword)), tagged output lines of all the result sets
+        """
+        for word_count_pair in top_k(word_count_pairs, self.top_words(result[0])):
+            yield result, word_count_pair
+
+    def reducer_find_top_words_from_sketches(self, result, sketch_states):
+        """
+        This reducer merges the keyword sketches of a result set and gets its approximate most common keywords
+        :param result: (result_set, genre), genre is None for the global result set
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :return: ((result_set, genre), (count, keyword)), tagged output lines of all the result sets
+        """
+        result_set, genre = result
+        result_name = result_set if genre is None else '{}:{}'.format(result_set, genre)
+        for word_count_pair in self.top_words_from_sketches(result_name, sketch_states, self.top_words(result_set)):
+            yield result, word_count_pair
+
+    def steps(self):
+        if self.options.approximate:
+            return [
+                MRStep(mapper_init=self.mapper_init,
+                       mapper=self.mapper_keywords,
+                       mapper_final=self.mapper_final,
+                       combiner=self.combiner_merge_sketches,
+                       reducer=self.reducer_find_top_words_from_sketches)
+            ]
+        return [
+            MRStep(mapper_init=self.mapper_init,
+                   mapper=self.mapper_keywords,
+                   mapper_final=self.mapper_final,
+                   combiner=self.combiner_count_words,
+                   reducer_init=self.reducer_init_top_words,
+                   reducer=self.reducer_count_words,
+                   reducer_final=self.reducer_final_top_words),
+            MRStep(combiner=self.combiner_find_top_words,
+                   reducer=self.reducer_find_top_words)
+        ]
+
+
+if __name__ == '__main__':
+    MostCommonKeyWordsAllResultsIMDB.run()
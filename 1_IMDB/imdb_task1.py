@@ -1,74 +1,74 @@
-from mrjob.job import MRJob
-from mrjob.step import MRStep
-import re
-import nltk
-import fr_core_news_sm
-
-# Load the spaCy CNN for french word tagging
-NLP_FR = fr_core_news_sm.load()
+import os
+import sys
 
-# Download relevant NLTK models if not already present
-nltk.download('averaged_perceptron_tagger')
-nltk.download('stopwords')
-
-# Regular expression to match words
-WORD_RE = re.compile(r"[\w']+")
+from mrjob.step import MRStep
 
-# Stopwords are used to determine the language
-# The method to detect the English language using NLTK can be found here:
-# https://www.algorithm.co.il/programming/python/cheap-language-detection-nltk/
-ENGLISH_STOPWORDS = set(nltk.corpus.stopwords.words('english'))
-NON_ENGLISH_STOPWORDS = set(nltk.corpus.stopwords.words()) - ENGLISH_STOPWORDS
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
 
-STOPWORDS_DICT = {lang: set(nltk.corpus.stopwords.words(lang)) for lang in nltk.corpus.stopwords.fileids()}
+from title_basics import parse_title_line
+from title_keywords import TitleKeywordsJob
+from top_k import TopK, top_k
 
+# Number of most common keywords in the result
+TOP_WORDS = 50
 
-def is_english(text):
-    text = text.lower()
-    words = set(nltk.wordpunct_tokenize(text))
-    return len(words & ENGLISH_STOPWORDS) > len(words & NON_ENGLISH_STOPWORDS)
 
+class MostCommonKeyWordsIMDB(TitleKeywordsJob):
 
-class MostCommonKeyWordsIMDB(MRJob):
+    def mapper_init(self):
+        """
+        This initializer loads the NLP models once per mapper and prepares the keyword extraction
+        """
+        self.init_keyword_extraction()
 
     def mapper_filter_by_title_type_and_part_of_speech(self, _, line):
         """
         This mapper filters the line by the title type (second column)
         and then filters each word in the primary title (third column)
-        by part of speech.
+        by part of speech. Titles are buffered and tagged in batches
+        and the keywords are counted in the mapper until the counts are spilled.
         :param _: None
-        :param line: one line from the input file
-        :return: (word, 1)
+        :param line: one line from the input file (raw or compact)
+        :return: (word, count)
         """
 
-        # For input file type TSV, split line by tabs
-        attributes = line.split('\t')
-
-        # Columns: tconst titleType primaryTitle originalTitle isAdult startYear endYear runtimeMinutes genres
-        title_type = attributes[1]
-        primary_title = attributes[2]
+        # For input file type TSV, read the columns of the raw file or of the compact file written by title_basics.py
+        _, title_type, primary_title, _ = parse_title_line(line)
 
         if title_type in ('short', 'movie'):
-            if is_english(primary_title):
-                for word in WORD_RE.findall(primary_title):
-
-                    # Filter out auxiliary verbs, prepositions, articles and conjunctions
-                    # Available parts of speech can be listed with nltk.help.upenn_tagset()
-                    # List also available at the official documentation:
-                    # https://www.ling.upenn.edu/courses/Fall_2003/ling001/penn_treebank_pos.html
-                    nltk_tagged_word = nltk.pos_tag([word])
-                    part_of_speech = nltk_tagged_word[0][1]
-
-                    if part_of_speech not in ('IN', 'RP', 'CC', 'MD', 'DT', 'PDT', 'TO'):
-                        yield word.lower(), 1
-            else:
-                # The second most common language in the input file was French, so we decided to
-                # filter out auxiliary verbs, prepositions, articles and conjunctions in French;
-                # This is done using spaCy.io
-                doc = NLP_FR(primary_title)
-                for w in doc:
-                    if w.pos_ not in ('ADP', 'AUX', 'CONJ', 'CCONJ', 'DET', 'PUNCT', 'SCONJ', 'SYM', 'PART', 'X'):
-                        yield w.text.lower(), 1
+            self.count_keywords(self.extract_keywords(None, primary_title))
+
+        for keyword_count in self.keyword_counts.spill_if_full():
+            yield keyword_count
+
+    def mapper_final(self):
+        """
+        This finalizer tags the titles left in the buffers, emits the keyword counts (or the keyword sketch
+        in the approximate mode) and reports the usage of the language and part of speech caches and how much
+        the counting in the mapper cut the shuffle
+        :return: (word, count) or (None, sketch state)
+        """
+        self.count_keywords(self.flush_keywords())
+        for keyword_count in self.keyword_counts.spill():
+            yield keyword_count
+        for keyword_sketch in self.keyword_sketches.spill():
+            yield keyword_sketch
+
+        self.increment_keyword_counters()
+
+    def count_keywords(self, keywords):
+        """
+        Counts the keywords in the mapper, or adds them to the sketch in the approximate mode
+        :param keywords: iterable of (None, keyword) pairs
+        """
+        if self.options.approximate:
+            for _, keyword in keywords:
+                self.keyword_sketches.add(None, keyword, 1)
+            return
+
+        for _, keyword in keywords:
+            self.keyword_counts.add(keyword, 1)
 
     def combiner_count_words(self, word, counts):
         """
@@ -79,34 +79,81 @@ class MostCommonKeyWordsIMDB(MRJob):
         """
         yield (word, sum(counts))
 
+    def reducer_init_top_words(self):
+        """
+        This initializer prepares the bounded heap of the most common keywords seen by this reducer
+        """
+        self.top_words = TopK(TOP_WORDS)
+
     def reducer_count_words(self, word, counts):
         """
-        This reducer sends all (num_occurrences, word) pairs to the same final reducer.
+        This reducer sums the occurrences of each word and keeps only the top 50 words it sees,
+        so that each reducer sends at most 50 pairs to the final reducer
         :param word: word obtained from the combiner
         :param counts: the number of occurrences of the word from the result of the combiner
-        :return: (None, (sum(counts), word))
+        :return: None
+        """
+        self.top_words.push(sum(counts), word)
+
+    def reducer_final_top_words(self):
+        """
+        This finalizer sends the top 50 (num_occurrences, word) pairs of this reducer to the same final reducer.
+        :return: (None, (count, word)) at most 50 times
         """
-        yield None, (sum(counts), word)
+        for count, word in self.top_words.pairs():
+            yield None, (count, word)
+
+    def combiner_find_top_fifty_words(self, _, word_count_pairs):
+        """
+        This combiner merges the partial top 50 lists it receives into a single one
+        :param _: discard the key; it is just None
+        :param word_count_pairs: each item of word_count_pairs is (count, word)
+        :return: (None, (count, word)) at most 50 times
+        """
+        for word_count_pair in top_k(word_count_pairs, TOP_WORDS):
+            yield None, word_count_pair
 
     def reducer_find_top_fifty_words(self, _, word_count_pairs):
         """
-        This reducer gets the top 50 most common keywords
+        This reducer gets the top 50 most common keywords from the partial top 50 lists
         :param _: discard the key; it is just None
         :param word_count_pairs: each item of word_count_pairs is (count, word),
         :return: (key=counts, value=word) 50 times
         """
 
-        # Sort by keyword occurrence
-        sorted_word_count_pairs = sorted(word_count_pairs, key=lambda x: x[0], reverse=True)
-        for i in range(50):
-            yield sorted_word_count_pairs[i]
+        # Keep only the 50 highest keyword occurrences instead of sorting them all
+        for word_count_pair in top_k(word_count_pairs, TOP_WORDS):
+            yield word_count_pair
+
+    def reducer_find_top_fifty_words_from_sketches(self, _, sketch_states):
+        """
+        This reducer merges the keyword sketches of the mappers and gets the approximate top 50 keywords
+        :param _: discard the key; it is just None
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :return: (key=counts, value=word) 50 times
+        """
+        for word_count_pair in self.top_words_from_sketches('global', sketch_states, TOP_WORDS):
+            yield word_count_pair
 
     def steps(self):
+        if self.options.approximate:
+            return [
+                MRStep(mapper_init=self.mapper_init,
+                       mapper=self.mapper_filter_by_title_type_and_part_of_speech,
+                       mapper_final=self.mapper_final,
+                       combiner=self.combiner_merge_sketches,
+                       reducer=self.reducer_find_top_fifty_words_from_sketches)
+            ]
         return [
-            MRStep(mapper=self.mapper_filter_by_title_type_and_part_of_speech,
+            MRStep(mapper_init=self.mapper_init,
+                   mapper=self.mapper_filter_by_title_type_and_part_of_speech,
+                   mapper_final=self.mapper_final,
                    combiner=self.combiner_count_words,
-                   reducer=self.reducer_count_words),
-            MRStep(reducer=self.reducer_find_top_fifty_words)
+                   reducer_init=self.reducer_init_top_words,
+                   reducer=self.reducer_count_words,
+                   reducer_final=self.reducer_final_top_words),
+            MRStep(combiner=self.combiner_find_top_fifty_words,
+                   reducer=self.reducer_find_top_fifty_words)
         ]
 
 
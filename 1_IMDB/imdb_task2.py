@@ -1,87 +1,86 @@
-from mrjob.job import MRJob
-from mrjob.step import MRStep
-import re
-import nltk
-import fr_core_news_sm
-
-# Load the spaCy CNN for french word tagging
-NLP_FR = fr_core_news_sm.load()
-
-# Download relevant NLTK models if not already present
-nltk.download('averaged_perceptron_tagger')
-nltk.download('stopwords')
+import os
+import sys
 
-# Regular expression to match words
-WORD_RE = re.compile(r"[\w']+")
-
-# Stopwords are used to determine the language
-# The method to detect the English language using NLTK can be found here:
-# https://www.algorithm.co.il/programming/python/cheap-language-detection-nltk/
-ENGLISH_STOPWORDS = set(nltk.corpus.stopwords.words('english'))
-NON_ENGLISH_STOPWORDS = set(nltk.corpus.stopwords.words()) - ENGLISH_STOPWORDS
+from mrjob.step import MRStep
 
-STOPWORDS_DICT = {lang: set(nltk.corpus.stopwords.words(lang)) for lang in nltk.corpus.stopwords.fileids()}
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
 
+from title_basics import parse_title_line
+from title_keywords import TitleKeywordsJob
+from top_k import TopK, top_k
 
-def is_english(text):
-    text = text.lower()
-    words = set(nltk.wordpunct_tokenize(text))
-    return len(words & ENGLISH_STOPWORDS) > len(words & NON_ENGLISH_STOPWORDS)
+# Number of most common keywords per genre in the result
+TOP_WORDS_PER_GENRE = 15
 
 
-class MostCommonKeyWordsByGenreIMDB(MRJob):
+class MostCommonKeyWordsByGenreIMDB(TitleKeywordsJob):
 
     def mapper_title_by_genre(self, _, line):
         """
         This mapper filters the line by the title type (second column)
         and maps each primary title (third column) to its genre (ninth column)
         :param _: None
-        :param line: one line from the input file
+        :param line: one line from the input file (raw or compact)
         :return: (genre, primary_title)
         """
 
-        # For input file type TSV, split line by tabs
-        attributes = line.split('\t')
-
-        # Columns: tconst titleType primaryTitle originalTitle isAdult startYear endYear runtimeMinutes genres
-        title_type = attributes[1]
-        primary_title = attributes[2]
-        genre_list = attributes[8]
+        # For input file type TSV, read the columns of the raw file or of the compact file written by title_basics.py
+        _, title_type, primary_title, genre_list = parse_title_line(line)
 
         if title_type == 'short':
             genres = genre_list.split(',')
             for genre in genres:
                 yield genre.lower(), primary_title
 
+    def mapper_keywords_init(self):
+        """
+        This initializer loads the NLP models once per mapper and prepares the keyword extraction
+        """
+        self.init_keyword_extraction()
+
     def mapper_keywords_by_genre(self, genre, title):
         """
         This mapper filters the words in the title by part of speech and
-        yields each (genre, keyword) pair.
+        yields each (genre, keyword) pair. Titles are buffered and tagged in batches
+        and the keywords are counted in the mapper until the counts are spilled.
         :param genre: None
         :param title: primary title of movie
-        :return: ((genre, keyword), 1)
-        """
-
-        if is_english(title):
-            for word in WORD_RE.findall(title):
-
-                # Filter out auxiliary verbs, prepositions, articles and conjunctions
-                # Available parts of speech can be listed with nltk.help.upenn_tagset()
-                # List also available at the official documentation:
-                # https://www.ling.upenn.edu/courses/Fall_2003/ling001/penn_treebank_pos.html
-                nltk_tagged_word = nltk.pos_tag([word])
-                part_of_speech = nltk_tagged_word[0][1]
-
-                if part_of_speech not in ('IN', 'RP', 'CC', 'MD', 'DT', 'PDT', 'TO'):
-                    yield (genre, word.lower()), 1
-        else:
-            # The second most common language in the input file was French, so we decided to
-            # filter out auxiliary verbs, prepositions, articles and conjunctions in French;
-            # This is done using spaCy.io
-            doc = NLP_FR(title)
-            for w in doc:
-                if w.pos_ not in ('ADP', 'AUX', 'CONJ', 'CCONJ', 'DET', 'PUNCT', 'SCONJ', 'SYM', 'PART', 'X'):
-                    yield (genre, w.text.lower()), 1
+        :return: ((genre, keyword), count)
+        """
+        self.count_keywords(self.extract_keywords(genre, title))
+
+        for genre_keyword_count in self.keyword_counts.spill_if_full():
+            yield genre_keyword_count
+
+    def mapper_keywords_final(self):
+        """
+        This finalizer tags the titles left in the buffers, emits the keyword counts (or the keyword sketch
+        of each genre in the approximate mode) and reports the usage of the language and part of speech caches
+        and how much the counting in the mapper cut the shuffle
+        :return: ((genre, keyword), count) or (genre, sketch state)
+        """
+        self.count_keywords(self.flush_keywords())
+        for genre_keyword_count in self.keyword_counts.spill():
+            yield genre_keyword_count
+        for genre_sketch in self.keyword_sketches.spill():
+            yield genre_sketch
+
+        self.increment_keyword_counters()
+
+    def count_keywords(self, genre_keyword_pairs):
+        """
+        Counts the (genre, keyword) pairs in the mapper, or adds the keywords to the sketch of their genre
+        in the approximate mode
+        :param genre_keyword_pairs: iterable of (genre, keyword)
+        """
+        if self.options.approximate:
+            for genre, keyword in genre_keyword_pairs:
+                self.keyword_sketches.add(genre, keyword, 1)
+            return
+
+        for genre_keyword_pair in genre_keyword_pairs:
+            self.keyword_counts.add(genre_keyword_pair, 1)
 
     def combiner_count_words(self, genre_keyword_pair, counts):
         """
@@ -92,26 +91,44 @@ class MostCommonKeyWordsByGenreIMDB(MRJob):
         """
         yield (genre_keyword_pair, sum(counts))
 
+    def reducer_init_top_words(self):
+        """
+        This initializer prepares the bounded heaps of the most common keywords
+        of each genre seen by this reducer
+        """
+        self.top_words_by_genre = {}
+
     def reducer_count_words(self, genre_keyword_pair, counts):
         """
-        This reducer sends all (num_occurrences, (genre, keyword)) constructs to the next step
+        This reducer sums the occurrences of each (genre, keyword) pair and keeps only the top 15 keywords
+        of each genre it sees, so that each reducer sends at most 15 pairs per genre to the next step
         :param genre_keyword_pair: pair obtained from the combiner
         :param counts: the number of occurrences of the key from the result of the combiner
-        :return: (None, (sum(counts), genre_keyword_pair))
+        :return: None
         """
-        yield None, (sum(counts), genre_keyword_pair)
+        genre, keyword = genre_keyword_pair
+        if genre not in self.top_words_by_genre:
+            self.top_words_by_genre[genre] = TopK(TOP_WORDS_PER_GENRE)
+        self.top_words_by_genre[genre].push(sum(counts), keyword)
 
-    def mapper_keyword_counts_by_genre(self, _, counts_genre_keyword_pair):
+    def reducer_final_top_words(self):
         """
-        This mapper remaps the result of the previous step for our final reducer
-        :param _: None
-        :param counts_genre_keyword_pair: (count, (genre, keyword))
-        :return: (genre, (count, keyword))
+        This finalizer sends the top 15 (count, keyword) pairs of each genre seen by this reducer to the next step
+        :return: (genre, (count, keyword)) at most 15 times per genre
+        """
+        for genre, top_words in self.top_words_by_genre.items():
+            for count, keyword in top_words.pairs():
+                yield genre, (count, keyword)
+
+    def combiner_find_top_fifteen_words_by_genre(self, genre, word_count_pairs):
         """
-        count = counts_genre_keyword_pair[0]
-        genre = counts_genre_keyword_pair[1][0]
-        keyword = counts_genre_keyword_pair[1][1]
-        yield genre, (count, keyword)
+        This combiner merges the partial top 15 lists of a genre into a single one
+        :param genre: movie genre
+        :param word_count_pairs: each item of word_count_pairs is (count, word)
+        :return: (genre, (count, word)) at most 15 times
+        """
+        for word_count_pair in top_k(word_count_pairs, TOP_WORDS_PER_GENRE):
+            yield genre, word_count_pair
 
     def reducer_find_top_fifteen_words_by_genre(self, genre, word_count_pairs):
         """
@@ -121,21 +138,40 @@ class MostCommonKeyWordsByGenreIMDB(MRJob):
         :return: (genre, (key=counts, value=word)) 15 times per genre
         """
 
-        # Sort by keyword occurrence
-        sorted_word_count_pairs = sorted(word_count_pairs, key=lambda x: x[0], reverse=True)
-        top_range = len(sorted_word_count_pairs)
-        if top_range >= 15:
-            top_range = 15
-        for i in range(top_range):
-            yield genre, sorted_word_count_pairs[i]
+        # Keep only the 15 highest keyword occurrences instead of sorting them all
+        for word_count_pair in top_k(word_count_pairs, TOP_WORDS_PER_GENRE):
+            yield genre, word_count_pair
+
+    def reducer_find_top_fifteen_words_by_genre_from_sketches(self, genre, sketch_states):
+        """
+        This reducer merges the keyword sketches of a genre and gets its approximate top 15 keywords
+        :param genre: movie genre
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :return: (genre, (key=counts, value=word)) 15 times per genre
+        """
+        for word_count_pair in self.top_words_from_sketches(genre, sketch_states, TOP_WORDS_PER_GENRE):
+            yield genre, word_count_pair
 
     def steps(self):
+        if self.options.approximate:
+            return [
+                MRStep(mapper=self.mapper_title_by_genre),
+                MRStep(mapper_init=self.mapper_keywords_init,
+                       mapper=self.mapper_keywords_by_genre,
+                       mapper_final=self.mapper_keywords_final,
+                       combiner=self.combiner_merge_sketches,
+                       reducer=self.reducer_find_top_fifteen_words_by_genre_from_sketches)
+            ]
         return [
             MRStep(mapper=self.mapper_title_by_genre),
-            MRStep(mapper=self.mapper_keywords_by_genre,
+            MRStep(mapper_init=self.mapper_keywords_init,
+                   mapper=self.mapper_keywords_by_genre,
+                   mapper_final=self.mapper_keywords_final,
                    combiner=self.combiner_count_words,
-                   reducer=self.reducer_count_words),
-            MRStep(mapper=self.mapper_keyword_counts_by_genre,
+                   reducer_init=self.reducer_init_top_words,
+                   reducer=self.reducer_count_words,
+                   reducer_final=self.reducer_final_top_words),
+            MRStep(combiner=self.combiner_find_top_fifteen_words_by_genre,
                    reducer=self.reducer_find_top_fifteen_words_by_genre)
         ]
 
@@ -0,0 +1,72 @@
+"""
+Stopword based language detection for the IMDB titles. It gives the same verdicts as nlp_resources.is_english(),
+but the stopword lists are compiled once into a single token -> score table and the titles are tokenized by one
+regular expression instead of nltk.wordpunct_tokenize().
+"""
+
+import re
+from collections import OrderedDict
+
+from nlp_resources import language_stopwords
+
+# Same pattern as nltk.tokenize.WordPunctTokenizer, so that the titles are split into the same tokens
+TOKEN_RE = re.compile(r"\w+|[^\w\s]+")
+
+# Score of a token: English stopwords count for English and all the other stopwords against it
+ENGLISH_SCORE = 1
+NON_ENGLISH_SCORE = -1
+
+# Default number of title verdicts kept in the cache, 0 disables the cache
+DEFAULT_CACHE_SIZE = 100000
+
+
+class LanguageDetector:
+    """
+    Decides whether a title is English: a title is English when it contains more distinct English stopwords
+    than distinct non-English stopwords, i.e. when the sum of the scores of its distinct tokens is positive.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        :param cache_size: maximum number of title verdicts kept in the cache, 0 disables the cache
+        """
+        english_stopwords, non_english_stopwords = language_stopwords()
+
+        # Stopwords the tokenizer can never produce (e.g. "don't") would never match, so they are left out
+        self.scores = {word: NON_ENGLISH_SCORE for word in non_english_stopwords if TOKEN_RE.fullmatch(word)}
+        self.scores.update({word: ENGLISH_SCORE for word in english_stopwords if TOKEN_RE.fullmatch(word)})
+
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+
+    def score(self, title):
+        """
+        Scores the title in one pass over its distinct tokens
+        :param title: a title
+        :return: the number of distinct English stopwords minus the number of distinct non-English stopwords
+        """
+        scores = self.scores
+        return sum([scores.get(token, 0) for token in set(TOKEN_RE.findall(title.lower()))])
+
+    def is_english(self, title):
+        """
+        :param title: a title
+        :return: True if the title is detected as English
+        """
+        if not self.cache_size:
+            return self.score(title) > 0
+
+        cache = self._cache
+        verdict = cache.get(title)
+        if verdict is not None:
+            cache.move_to_end(title)
+            self.hits += 1
+            return verdict
+
+        self.misses += 1
+        verdict = cache[title] = self.score(title) > 0
+        if len(cache) > self.cache_size:
+            cache.popitem(last=False)
+        return verdict
@@ -0,0 +1,60 @@
+"""
+Use this script to check that LanguageDetector gives the same verdicts as is_english() on a sample of the
+primary titles and to compare their speed, e.g.:
+python language_detection_benchmark.py title.basics.tsv 200000
+"""
+
+import sys
+import time
+
+from language_detection import LanguageDetector
+from nlp_resources import is_english
+
+INPUT_FILE = sys.argv[1] if len(sys.argv) > 1 else 'title.basics.tsv'
+
+# Number of short and movie titles in the reference sample
+SAMPLE_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+
+def read_sample():
+    """
+    Reads the first SAMPLE_SIZE primary titles the IMDB jobs classify (title type short or movie)
+    :return: list of titles
+    """
+    titles = []
+    with open(INPUT_FILE, encoding='utf-8') as f:
+        for line in f:
+            attributes = line.split('\t')
+            if attributes[1] in ('short', 'movie'):
+                titles.append(attributes[2])
+                if len(titles) == SAMPLE_SIZE:
+                    break
+    return titles
+
+
+def timed(detect, titles):
+    """
+    :param detect: function deciding whether a title is English
+    :param titles: list of titles
+    :return: (verdicts, elapsed seconds)
+    """
+    start = time.perf_counter()
+    verdicts = [detect(title) for title in titles]
+    return verdicts, time.perf_counter() - start
+
+
+titles = read_sample()
+
+# Build the stopword sets and the score table before timing
+is_english('')
+uncached_detector = LanguageDetector(cache_size=0)
+cached_detector = LanguageDetector()
+
+reference_verdicts, reference_time = timed(is_english, titles)
+print('is_english():                 {:.3f}s for {} titles'.format(reference_time, len(titles)))
+
+for name, detector in (('LanguageDetector (no cache)', uncached_detector), ('LanguageDetector (cache)', cached_detector)):
+    verdicts, elapsed = timed(detector.is_english, titles)
+    mismatches = sum(1 for verdict, reference in zip(verdicts, reference_verdicts) if verdict != reference)
+    print('{:<29} {:.3f}s, {:.1f}x faster, {} different verdicts'.format(
+        name + ':', elapsed, reference_time / elapsed, mismatches))
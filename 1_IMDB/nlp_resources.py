@@ -0,0 +1,68 @@
+"""
+Lazy access to the NLTK data used by the IMDB jobs. Nothing is loaded when the module is imported, so reducers,
+which never touch NLP, start without paying for NLTK; mappers load what they need in mapper_init.
+"""
+
+# NLTK packages used by the IMDB jobs and the path under which nltk.data.find() locates each of them
+NLTK_RESOURCES = {
+    'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger',
+    'stopwords': 'corpora/stopwords',
+}
+
+# Packages already found or downloaded by this process
+_checked_packages = set()
+
+# English and non-English stopwords, built on first use by language_stopwords()
+_stopwords = None
+
+
+def ensure_nltk_data(*packages):
+    """
+    Downloads the given NLTK packages only if they cannot be found locally.
+    Unlike nltk.download(), which looks up the remote index on every call,
+    no network lookup is done for packages that are already installed.
+    :param packages: names of NLTK packages, keys of NLTK_RESOURCES
+    """
+    import nltk
+
+    for package in packages:
+        if package in _checked_packages:
+            continue
+        try:
+            nltk.data.find(NLTK_RESOURCES[package])
+        except LookupError:
+            nltk.download(package)
+        _checked_packages.add(package)
+
+
+def language_stopwords():
+    """
+    Builds the English and non-English stopword sets once per process
+    :return: (english_stopwords, non_english_stopwords)
+    """
+    global _stopwords
+    if _stopwords is None:
+        import nltk
+
+        ensure_nltk_data('stopwords')
+        english_stopwords = set(nltk.corpus.stopwords.words('english'))
+        non_english_stopwords = set(nltk.corpus.stopwords.words()) - english_stopwords
+        _stopwords = english_stopwords, non_english_stopwords
+    return _stopwords
+
+
+def is_english(text):
+    """
+    Stopwords are used to determine the language; the jobs use the faster language_detection.LanguageDetector,
+    this is the reference implementation it is checked against
+    The method to detect the English language using NLTK can be found here:
+    https://www.algorithm.co.il/programming/python/cheap-language-detection-nltk/
+    :param text: a title
+    :return: True if the title has more English than non-English stopwords
+    """
+    import nltk
+
+    english_stopwords, non_english_stopwords = language_stopwords()
+    text = text.lower()
+    words = set(nltk.wordpunct_tokenize(text))
+    return len(words & english_stopwords) > len(words & non_english_stopwords)
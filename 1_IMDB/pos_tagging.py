@@ -0,0 +1,116 @@
+"""
+Part of speech tagging layer shared by the IMDB jobs. English titles are tagged in batches and every word is
+tagged on its own, the same way nltk.pos_tag([word]) did, so the tag of a word never depends on the title
+it appears in and can be cached. Non-English titles are tagged by the French spaCy pipeline.
+NLTK and spaCy are imported only when a tagger or a pipeline is created.
+"""
+
+from collections import OrderedDict
+
+from nlp_resources import ensure_nltk_data
+
+# Parts of speech filtered out of English titles: auxiliary verbs, prepositions, articles and conjunctions
+# Available parts of speech can be listed with nltk.help.upenn_tagset()
+# List also available at the official documentation:
+# https://www.ling.upenn.edu/courses/Fall_2003/ling001/penn_treebank_pos.html
+ENGLISH_EXCLUDED_TAGS = ('IN', 'RP', 'CC', 'MD', 'DT', 'PDT', 'TO')
+
+# Parts of speech filtered out of French titles by spaCy, with the same meaning as above
+FRENCH_EXCLUDED_POS = ('ADP', 'AUX', 'CONJ', 'CCONJ', 'DET', 'PUNCT', 'SCONJ', 'SYM', 'PART', 'X')
+
+# Only the tagger of the French pipeline is needed to read the part of speech (token.pos_)
+FRENCH_UNUSED_COMPONENTS = ('parser', 'ner')
+
+# Default number of words kept in the word -> tag cache
+DEFAULT_CACHE_SIZE = 100000
+
+# Default number of titles given to spaCy at once
+DEFAULT_SPACY_BATCH_SIZE = 1000
+
+
+class CachedPosTagger:
+    """
+    Wraps the NLTK averaged perceptron tagger with a bounded word -> tag cache.
+    The perceptron is loaded once per instance instead of once per nltk.pos_tag() call;
+    the least recently used words are evicted when the cache is full.
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        :param max_size: maximum number of words kept in the cache
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._cache = OrderedDict()
+
+        from nltk.tag.perceptron import PerceptronTagger
+
+        ensure_nltk_data('averaged_perceptron_tagger')
+        self._tagger = PerceptronTagger()
+
+    def tag_words(self, words):
+        """
+        Tags a batch of words, calling the perceptron only for the distinct words missing from the cache
+        :param words: list of words
+        :return: list of tags, in the same order as words
+        """
+        cache = self._cache
+        tags = {}
+        missing = []
+        for word in words:
+            if word in tags:
+                self.hits += 1
+            elif word in cache:
+                cache.move_to_end(word)
+                tags[word] = cache[word]
+                self.hits += 1
+            else:
+                # Reserve the slot so repeated words within the batch are tagged only once
+                tags[word] = None
+                missing.append(word)
+                self.misses += 1
+
+        # Each word is tagged as a sentence of its own, as with nltk.pos_tag([word])
+        for tagged_word in self._tagger.tag_sents([[word] for word in missing]):
+            word, tag = tagged_word[0]
+            tags[word] = tag
+            cache[word] = tag
+
+        while len(cache) > self.max_size:
+            cache.popitem(last=False)
+            self.evictions += 1
+
+        return [tags[word] for word in words]
+
+    def tag_titles(self, titles):
+        """
+        Tags the words of a batch of titles in one call
+        :param titles: list of titles, each one a list of words
+        :return: list of titles, each one a list of (word, tag) pairs
+        """
+        tags = iter(self.tag_words([word for title in titles for word in title]))
+        return [[(word, next(tags)) for word in title] for title in titles]
+
+
+def load_french_pipeline():
+    """
+    Loads the spaCy CNN for French word tagging with the components the jobs never use disabled
+    :return: the spaCy language pipeline
+    """
+    import fr_core_news_sm
+
+    return fr_core_news_sm.load(disable=list(FRENCH_UNUSED_COMPONENTS))
+
+
+def french_keywords(nlp, titles, batch_size=DEFAULT_SPACY_BATCH_SIZE):
+    """
+    Tags a batch of titles with nlp.pipe and filters out auxiliary verbs, prepositions, articles and conjunctions
+    :param nlp: the spaCy pipeline returned by load_french_pipeline()
+    :param titles: list of titles
+    :param batch_size: number of titles spaCy processes at once
+    :return: generator of lists of lowercase keywords, one list per title
+    """
+    for doc in nlp.pipe(titles, batch_size=batch_size):
+        yield [w.text.lower() for w in doc if w.pos_ not in FRENCH_EXCLUDED_POS]
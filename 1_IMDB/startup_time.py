@@ -0,0 +1,56 @@
+"""
+Use this script to measure how long the IMDB job tasks take to start. Every measurement runs in a fresh
+Python process, the same way each mapper and reducer task of a job does:
+- import: time to import the job module, which every task pays (reducers pay nothing else)
+- mapper_init: time to load the NLP models, which only the keyword mappers pay
+"""
+
+import statistics
+import subprocess
+import sys
+
+# Job module and class of each IMDB task
+JOBS = [
+    ('imdb_task1', 'MostCommonKeyWordsIMDB', 'mapper_init'),
+    ('imdb_task2', 'MostCommonKeyWordsByGenreIMDB', 'mapper_keywords_init'),
+]
+
+# Number of fresh processes started per measurement
+RUNS = 5
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+MAPPER_INIT_SNIPPET = """
+import time
+from {module} import {job_class}
+job = {job_class}([])
+start = time.perf_counter()
+job.{mapper_init}()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(snippet):
+    """
+    Runs the snippet in RUNS fresh Python processes
+    :param snippet: Python code printing the measured time in seconds
+    :return: median of the measured times in seconds
+    """
+    times = []
+    for _ in range(RUNS):
+        output = subprocess.run([sys.executable, '-c', snippet], check=True, stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        times.append(float(output.split()[-1]))
+    return statistics.median(times)
+
+
+for module, job_class, mapper_init in JOBS:
+    import_time = measure(IMPORT_SNIPPET.format(module=module))
+    mapper_init_time = measure(MAPPER_INIT_SNIPPET.format(module=module, job_class=job_class,
+                                                          mapper_init=mapper_init))
+    print('{}: import {:.3f}s, {} {:.3f}s'.format(module, import_time, mapper_init, mapper_init_time))
@@ -0,0 +1,147 @@
+"""
+Use this script to pre-extract the rows of title.basics.tsv the IMDB jobs need into a compact file. The raw file is
+scanned in large binary chunks and only the rows of the wanted title types are kept, with four columns:
+tconst, title type code, primary title and genre bitmask. The IMDB jobs read both the raw and the compact file, so
+repeated runs on the compact file skip most of the parsing and I/O. The compact file keeps a line per title rather than
+a file per column, so that the mappers read it line by line like the raw file and it can be split at line breaks.
+Example:
+python title_basics.py title.basics.tsv title.compact.tsv
+"""
+
+import argparse
+from functools import lru_cache
+
+# Title types of the titleType column; the code of a title type is its index
+TITLE_TYPES = ('movie', 'short', 'tvEpisode', 'tvMiniSeries', 'tvMovie', 'tvPilot', 'tvSeries', 'tvShort',
+               'tvSpecial', 'video', 'videoGame')
+
+# Genres of the genres column; the bit of a genre in the bitmask is 1 << index
+GENRES = ('Action', 'Adult', 'Adventure', 'Animation', 'Biography', 'Comedy', 'Crime', 'Documentary', 'Drama',
+          'Family', 'Fantasy', 'Film-Noir', 'Game-Show', 'History', 'Horror', 'Music', 'Musical', 'Mystery', 'News',
+          'Reality-TV', 'Romance', 'Sci-Fi', 'Short', 'Sport', 'Talk-Show', 'Thriller', 'War', 'Western')
+
+# Value of the genres column of the titles without genre
+NO_GENRE = '\\N'
+
+# Title types kept by default, the ones the IMDB jobs use
+DEFAULT_TITLE_TYPES = ('short', 'movie')
+
+# Size of the chunks the raw file is read in
+CHUNK_SIZE = 64 * 1024 * 1024
+
+_TITLE_TYPE_CODES = {title_type.encode(): str(code).encode() for code, title_type in enumerate(TITLE_TYPES)}
+_GENRE_BITS = {genre.encode(): 1 << index for index, genre in enumerate(GENRES)}
+
+
+def genre_mask(genre_list):
+    """
+    :param genre_list: genres column of the raw file, as bytes
+    :return: bitmask of the genres, 0 for no genre
+    """
+    if genre_list == NO_GENRE.encode():
+        return 0
+
+    mask = 0
+    for genre in genre_list.split(b','):
+        if genre not in _GENRE_BITS:
+            raise ValueError('Unknown genre ' + genre.decode() + ', it has to be added to GENRES')
+        mask |= _GENRE_BITS[genre]
+    return mask
+
+
+@lru_cache(maxsize=None)
+def genre_list_from_mask(mask):
+    """
+    :param mask: bitmask of the genres
+    :return: genres column as in the raw file, e.g. 'Comedy,Short'
+    """
+    if not mask:
+        return NO_GENRE
+    return ','.join(genre for index, genre in enumerate(GENRES) if mask & (1 << index))
+
+
+def parse_title_line(line):
+    """
+    Reads the columns the IMDB jobs need from a line of either the raw or the compact file
+    :param line: one line of title.basics.tsv or of the compact file
+    :return: (tconst, title_type, primary_title, genre_list)
+    """
+    attributes = line.split('\t')
+
+    # Columns: tconst titleType primaryTitle originalTitle isAdult startYear endYear runtimeMinutes genres
+    if len(attributes) > 4:
+        return attributes[0], attributes[1], attributes[2], attributes[8]
+
+    # Columns: tconst titleTypeCode primaryTitle genreMask
+    return attributes[0], TITLE_TYPES[int(attributes[1])], attributes[2], genre_list_from_mask(int(attributes[3]))
+
+
+def compact_lines(lines, kept_type_codes):
+    """
+    :param lines: list of raw lines, as bytes without line break
+    :param kept_type_codes: dict of title type -> code of the kept title types, as bytes
+    :return: generator of compact lines, as bytes without line break
+    """
+    for line in lines:
+        # Only the first columns are split to check the title type, most rows are thrown away here
+        attributes = line.split(b'\t', 3)
+        if len(attributes) < 4:
+            continue
+        type_code = kept_type_codes.get(attributes[1])
+        if type_code is None:
+            continue
+
+        genre_list = line.rsplit(b'\t', 1)[1].rstrip(b'\r')
+        yield b'\t'.join((attributes[0], type_code, attributes[2], str(genre_mask(genre_list)).encode()))
+
+
+def prefilter(input_file, output_file, title_types=DEFAULT_TITLE_TYPES, chunk_size=CHUNK_SIZE):
+    """
+    Writes the compact file
+    :param input_file: path of title.basics.tsv
+    :param output_file: path of the compact file
+    :param title_types: title types to keep
+    :param chunk_size: size of the chunks the raw file is read in, in bytes
+    :return: (number of rows read, number of rows kept)
+    """
+    kept_type_codes = {title_type.encode(): _TITLE_TYPE_CODES[title_type.encode()] for title_type in title_types}
+    rows_read = 0
+    rows_kept = 0
+    rest = b''
+
+    with open(input_file, 'rb') as raw, open(output_file, 'wb') as compact:
+        while True:
+            chunk = raw.read(chunk_size)
+            if not chunk:
+                break
+
+            # The last line of the chunk may be incomplete, it is carried over to the next chunk
+            lines = (rest + chunk).split(b'\n')
+            rest = lines.pop()
+            rows_read += len(lines)
+
+            kept = list(compact_lines(lines, kept_type_codes))
+            rows_kept += len(kept)
+            if kept:
+                compact.write(b'\n'.join(kept) + b'\n')
+
+        if rest:
+            rows_read += 1
+            kept = list(compact_lines([rest], kept_type_codes))
+            rows_kept += len(kept)
+            if kept:
+                compact.write(kept[0] + b'\n')
+
+    return rows_read, rows_kept
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-extract the rows of title.basics.tsv the IMDB jobs need')
+    parser.add_argument('input_file', help='path of title.basics.tsv')
+    parser.add_argument('output_file', help='path of the compact file')
+    parser.add_argument('--title-types', default=','.join(DEFAULT_TITLE_TYPES),
+                        help='comma separated title types to keep, short,movie by default')
+    args = parser.parse_args()
+
+    read, kept = prefilter(args.input_file, args.output_file, args.title_types.split(','))
+    print('Kept {} of {} rows'.format(kept, read))
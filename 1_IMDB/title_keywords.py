@@ -0,0 +1,171 @@
+"""
+Base class of the IMDB keyword jobs. It extracts the keywords of the primary titles: the language of each title is
+detected, English titles are tagged in batches by the cached NLTK tagger and the other titles by the French spaCy
+pipeline, and auxiliary verbs, prepositions, articles and conjunctions are filtered out.
+The spaCy CNN for french word tagging and the NLTK models are loaded lazily by init_keyword_extraction(),
+so that the jobs start fast in the tasks which never use them.
+"""
+
+import math
+import os
+import re
+import sys
+
+from mrjob.job import MRJob
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from in_mapper_combiner import DEFAULT_MAX_KEYS, DEFAULT_MAX_MEMORY_MB, InMapperCombiner
+from language_detection import DEFAULT_CACHE_SIZE as DEFAULT_LANGUAGE_CACHE_SIZE, LanguageDetector
+from pos_tagging import CachedPosTagger, DEFAULT_CACHE_SIZE, DEFAULT_SPACY_BATCH_SIZE, ENGLISH_EXCLUDED_TAGS, \
+    french_keywords, load_french_pipeline
+from space_saving import DEFAULT_SKETCH_SIZE, HeavyHitterSketches, SpaceSaving
+
+# Regular expression to match words
+WORD_RE = re.compile(r"[\w']+")
+
+# Default number of English titles buffered by a mapper before they are tagged together
+DEFAULT_POS_BATCH_SIZE = 1000
+
+
+class TitleKeywordsJob(MRJob):
+
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['language_detection.py', 'nlp_resources.py', 'pos_tagging.py', 'title_basics.py', 'title_keywords.py',
+             '../common/space_saving.py#space_saving.py', '../common/in_mapper_combiner.py#in_mapper_combiner.py',
+             '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(TitleKeywordsJob, self).configure_args()
+        self.add_passthru_arg('--pos-batch-size', type=int, default=DEFAULT_POS_BATCH_SIZE,
+                              help='Number of English titles tagged together by the part of speech tagger')
+        self.add_passthru_arg('--pos-cache-size', type=int, default=DEFAULT_CACHE_SIZE,
+                              help='Maximum number of words kept in the word -> part of speech cache')
+        self.add_passthru_arg('--language-cache-size', type=int, default=DEFAULT_LANGUAGE_CACHE_SIZE,
+                              help='Maximum number of title language verdicts kept in the cache, 0 disables it')
+        self.add_passthru_arg('--spacy-batch-size', type=int, default=DEFAULT_SPACY_BATCH_SIZE,
+                              help='Number of non-English titles tagged together by the French spaCy pipeline')
+        self.add_passthru_arg('--combiner-max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                              help='Maximum number of keywords counted in a mapper before the counts are emitted')
+        self.add_passthru_arg('--combiner-max-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                              help='Maximum memory of the keywords counted in a mapper before the counts are emitted')
+        self.add_passthru_arg('--approximate', action='store_true',
+                              help='Count the keywords with Space-Saving sketches of bounded size instead of exactly')
+        self.add_passthru_arg('--sketch-size', type=int, default=DEFAULT_SKETCH_SIZE,
+                              help='Number of keywords monitored by each sketch of the approximate mode')
+
+    def init_keyword_extraction(self):
+        """
+        Loads the language detector, the part of speech tagger and the French spaCy pipeline
+        once per mapper (the parser and the named entity recognizer are disabled)
+        and prepares the buffers of English and non-English titles waiting to be tagged
+        and the in-mapper keyword counts or sketches; to be called from mapper_init
+        """
+        self.language_detector = LanguageDetector(self.options.language_cache_size)
+        self.pos_tagger = CachedPosTagger(self.options.pos_cache_size)
+        self.nlp_fr = load_french_pipeline()
+        self.english_titles = []
+        self.french_titles = []
+        self.keyword_counts = InMapperCombiner(self.options.combiner_max_keys, self.options.combiner_max_mb)
+        self.keyword_sketches = HeavyHitterSketches(self.options.sketch_size)
+
+    def extract_keywords(self, key, title):
+        """
+        Buffers the title until its batch is tagged
+        :param key: any value identifying the title, given back with each of its keywords
+        :param title: primary title
+        :return: list of (key, keyword) pairs of the titles of the batches tagged by this call, often empty
+        """
+        if self.language_detector.is_english(title):
+            self.english_titles.append((key, WORD_RE.findall(title)))
+            if len(self.english_titles) >= self.options.pos_batch_size:
+                return list(self.flush_english_titles())
+        else:
+            # The second most common language in the input file was French, so we decided to
+            # filter out auxiliary verbs, prepositions, articles and conjunctions in French;
+            # This is done using spaCy.io
+            self.french_titles.append((key, title))
+            if len(self.french_titles) >= self.options.spacy_batch_size:
+                return list(self.flush_french_titles())
+        return []
+
+    def flush_keywords(self):
+        """
+        Tags the titles left in the buffers; to be called from mapper_final
+        :return: generator of (key, keyword) pairs
+        """
+        for key_keyword_pair in self.flush_english_titles():
+            yield key_keyword_pair
+        for key_keyword_pair in self.flush_french_titles():
+            yield key_keyword_pair
+
+    def flush_english_titles(self):
+        """
+        Tags the buffered English titles in one call and filters out auxiliary verbs,
+        prepositions, articles and conjunctions
+        :return: generator of (key, keyword) pairs
+        """
+        keys = [key for key, _ in self.english_titles]
+        tagged_titles = self.pos_tagger.tag_titles([words for _, words in self.english_titles])
+        self.english_titles = []
+
+        for key, tagged_title in zip(keys, tagged_titles):
+            for word, part_of_speech in tagged_title:
+                if part_of_speech not in ENGLISH_EXCLUDED_TAGS:
+                    yield key, word.lower()
+
+    def flush_french_titles(self):
+        """
+        Tags the buffered non-English titles with the French spaCy pipeline
+        :return: generator of (key, keyword) pairs
+        """
+        keys = [key for key, _ in self.french_titles]
+        french_titles = [title for _, title in self.french_titles]
+        self.french_titles = []
+
+        for key, keywords in zip(keys, french_keywords(self.nlp_fr, french_titles, self.options.spacy_batch_size)):
+            for keyword in keywords:
+                yield key, keyword
+
+    def increment_keyword_counters(self):
+        """
+        Reports the usage of the language and part of speech caches and how much the counting
+        in the mapper cut the shuffle; to be called from mapper_final
+        """
+        self.increment_counter('language_detector', 'cache_hits', self.language_detector.hits)
+        self.increment_counter('language_detector', 'cache_misses', self.language_detector.misses)
+        self.increment_counter('pos_tagger', 'cache_hits', self.pos_tagger.hits)
+        self.increment_counter('pos_tagger', 'cache_misses', self.pos_tagger.misses)
+        self.increment_counter('pos_tagger', 'cache_evictions', self.pos_tagger.evictions)
+        if self.options.approximate:
+            self.increment_counter('space_saving', 'records_in', self.keyword_sketches.records_in)
+            self.increment_counter('space_saving', 'evictions', self.keyword_sketches.evictions)
+        else:
+            self.increment_counter('in_mapper_combiner', 'records_in', self.keyword_counts.records_in)
+            self.increment_counter('in_mapper_combiner', 'records_out', self.keyword_counts.records_out)
+            self.increment_counter('in_mapper_combiner', 'spills', self.keyword_counts.spills)
+
+    def combiner_merge_sketches(self, result, sketch_states):
+        """
+        This combiner merges the keyword sketches of a result into a single one
+        :param result: key of the result, e.g. None or a genre
+        :param sketch_states: states of the Space-Saving sketches of the mappers
+        :return: result, state of the merged sketch
+        """
+        yield result, SpaceSaving.merge(sketch_states, self.options.sketch_size).state()
+
+    def top_words_from_sketches(self, result_name, sketch_states, n):
+        """
+        Merges the keyword sketches of a result and reports how many of its top keywords are certainly right
+        and the maximum overestimation of its counts; to be called from the reducer
+        :param result_name: name of the result in the counters
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :param n: number of keywords in the result
+        :return: list of at most n (count, keyword) pairs, highest count first
+        """
+        pairs, guaranteed, max_error = SpaceSaving.merge(sketch_states, self.options.sketch_size).top(n)
+        self.increment_counter('space_saving', 'results', len(pairs))
+        self.increment_counter('space_saving', 'guaranteed_results', guaranteed)
+        self.increment_counter('space_saving_max_error', result_name, int(math.ceil(max_error)))
+        return pairs
@@ -0,0 +1,252 @@
+import csv
+import os
+import sys
+
+from mrjob.job import MRJob
+from mrjob.step import MRStep
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from in_mapper_combiner import DEFAULT_MAX_KEYS, DEFAULT_MAX_MEMORY_MB, InMapperCombiner
+from retail_input import ALL, COLUMNS, CUSTOMER_ID, DEFAULT_BLOCK_MB, INVOICE_DATE, PERIODS, PRICE, QUANTITY, \
+    STOCK_CODE, block_periods, invoice_period, read_blocks, sum_by_period_and_key
+from top_k import TopK, top_k
+
+# Metrics of the job, used as the first part of each key and as the key of the output lines
+# (with the period, if the rows are partitioned by period):
+# revenue per customer (task 3), revenue per product and quantity per product (task 4)
+CUSTOMER_REVENUE = 'customer-revenue'
+PRODUCT_REVENUE = 'product-revenue'
+PRODUCT_QUANTITY = 'product-quantity'
+METRICS = (CUSTOMER_REVENUE, PRODUCT_REVENUE, PRODUCT_QUANTITY)
+
+# Default number of customers and products in the result of each metric
+DEFAULT_TOP_CUSTOMERS = 10
+DEFAULT_TOP_PRODUCTS = 1
+
+
+def tag_sums(metric, key_sum_pairs):
+    """
+    :param metric: one of METRICS
+    :param key_sum_pairs: list of ((period, customer_id or product), sum)
+    :return: list of ((metric, period, customer_id or product), sum)
+    """
+    return [((metric, period, key), key_sum) for (period, key), key_sum in key_sum_pairs]
+
+
+class RetailAnalytics(MRJob):
+    """
+    Computes the results of task 3 and task 4 in a single scan of the input files:
+    each row is parsed once and its revenue and quantity are summed for every selected metric.
+    """
+
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['retail_input.py', '../common/in_mapper_combiner.py#in_mapper_combiner.py', '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(RetailAnalytics, self).configure_args()
+        self.add_passthru_arg('--metric', action='append', choices=METRICS,
+                              help='Metric to compute, can be given several times; all the metrics by default')
+        self.add_passthru_arg('--top-customers', type=int, default=DEFAULT_TOP_CUSTOMERS,
+                              help='Number of customers in the result of the customer metrics')
+        self.add_passthru_arg('--top-products', type=int, default=DEFAULT_TOP_PRODUCTS,
+                              help='Number of products in the result of the product metrics')
+        self.add_passthru_arg('--period', choices=PERIODS, default=ALL,
+                              help='Compute the results of each year, quarter or month of the invoice dates')
+        self.add_passthru_arg('--combiner-max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                              help='Maximum number of keys summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--combiner-max-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                              help='Maximum memory of the keys summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--ingestion', choices=['block', 'line'], default='line',
+                              help='Parse the input one line at a time (line), or each input file in large blocks by a '
+                                   'single mapper (block)')
+        self.add_passthru_arg('--block-mb', type=int, default=DEFAULT_BLOCK_MB,
+                              help='Size of the blocks of the block ingestion, in megabytes')
+
+    def metrics(self):
+        """
+        :return: the selected metrics
+        """
+        return self.options.metric or METRICS
+
+    def top_n(self, metric):
+        """
+        :param metric: one of METRICS
+        :return: number of customers or products in the result of the metric
+        """
+        if metric == CUSTOMER_REVENUE:
+            return self.options.top_customers
+        return self.options.top_products
+
+    def mapper_init(self):
+        """
+        This initializer prepares the in-mapper sums of all the metrics
+        """
+        self.sums = InMapperCombiner(self.options.combiner_max_keys, self.options.combiner_max_mb)
+        self.selected_metrics = self.metrics()
+
+    def mapper_metrics(self, _, line):
+        """
+        This mapper parses the line once and sums the revenue (quantity * price) by customer id (seventh column),
+        the revenue by product (second column) and the quantity (forth column) by product
+        for the selected metrics in the period of the invoice date (fifth column), until the sums are spilled
+        :param _: None
+        :param line: one line from the input file
+        :return: ((metric, period, customer_id or product), value), period is None if the rows are not partitioned
+        """
+        attributes = next(csv.reader([line]))
+
+        # For input file type CSV, skip the header
+        if attributes != list(COLUMNS):
+            # Columns: Invoice,StockCode,Description,Quantity,InvoiceDate,Price,Customer ID,Country
+            product = attributes[1]
+            quantity = float(attributes[3])
+            period = invoice_period(attributes[4], self.options.period)
+            revenue = float(attributes[5]) * quantity
+            customer_id = attributes[6]
+
+            # Take into account only customer ids different than NULL
+            if CUSTOMER_REVENUE in self.selected_metrics and customer_id != '':
+                self.sums.add((CUSTOMER_REVENUE, period, customer_id), revenue)
+            if PRODUCT_REVENUE in self.selected_metrics:
+                self.sums.add((PRODUCT_REVENUE, period, product), revenue)
+            if PRODUCT_QUANTITY in self.selected_metrics:
+                self.sums.add((PRODUCT_QUANTITY, period, product), quantity)
+
+        for metric_value in self.sums.spill_if_full():
+            yield metric_value
+
+    def mapper_raw_metrics(self, input_path, _):
+        """
+        This mapper parses the whole input file in blocks and sums the revenues and quantities of all the rows
+        of a block at once by period for the selected metrics before adding them to the in-mapper sums
+        :param input_path: local path of the input file
+        :param _: URI of the input file
+        :return: ((metric, period, customer_id or product), value), period is None if the rows are not partitioned
+        """
+        for rows, block in read_blocks(input_path, [CUSTOMER_ID, STOCK_CODE, INVOICE_DATE], [QUANTITY, PRICE],
+                                       self.options.block_mb):
+            revenue = block[QUANTITY] * block[PRICE]
+            periods = block_periods(block[INVOICE_DATE], self.options.period)
+            block_sums = []
+
+            # As in the line mapper, a value is counted for each row of each metric it is added to
+            values = 0
+
+            # Take into account only customer ids different than NULL
+            if CUSTOMER_REVENUE in self.selected_metrics:
+                known = block[CUSTOMER_ID] != b''
+                customer_sums = sum_by_period_and_key(periods[known] if periods is not None else None,
+                                                      block[CUSTOMER_ID][known], revenue[known])
+                block_sums.extend(tag_sums(CUSTOMER_REVENUE, customer_sums))
+                values += int(known.sum())
+            if PRODUCT_REVENUE in self.selected_metrics:
+                product_sums = sum_by_period_and_key(periods, block[STOCK_CODE], revenue)
+                block_sums.extend(tag_sums(PRODUCT_REVENUE, product_sums))
+                values += rows
+            if PRODUCT_QUANTITY in self.selected_metrics:
+                product_sums = sum_by_period_and_key(periods, block[STOCK_CODE], block[QUANTITY])
+                block_sums.extend(tag_sums(PRODUCT_QUANTITY, product_sums))
+                values += rows
+            self.sums.add_totals(block_sums, values)
+
+            for metric_value in self.sums.spill_if_full():
+                yield metric_value
+
+    def mapper_final(self):
+        """
+        This finalizer emits the sums left in the mapper
+        and reports how much the summing in the mapper cut the shuffle
+        :return: ((metric, period, customer_id or product), value)
+        """
+        for metric_value in self.sums.spill():
+            yield metric_value
+
+        self.increment_counter('in_mapper_combiner', 'records_in', self.sums.records_in)
+        self.increment_counter('in_mapper_combiner', 'records_out', self.sums.records_out)
+        self.increment_counter('in_mapper_combiner', 'spills', self.sums.spills)
+
+    def combiner_sum_values(self, metric_key, values):
+        """
+        This combiner sums the values we've computed so far by key
+        :param metric_key: (metric, period, customer_id or product)
+        :param values: revenues or quantities
+        :return: ((metric, period, customer_id or product), sum of values)
+        """
+        yield metric_key, sum(values)
+
+    def reducer_init_top_keys(self):
+        """
+        This initializer prepares the bounded heaps of the customers or products
+        with the highest values of each metric and period seen by this reducer
+        """
+        self.top_keys_by_result = {}
+
+    def reducer_sum_values(self, metric_key, values):
+        """
+        This reducer sums the values of each customer or product and keeps only the top ones
+        of each metric and period it sees
+        :param metric_key: (metric, period, customer_id or product)
+        :param values: the total values of the key from the result of the combiner
+        :return: None
+        """
+        metric, period, key = metric_key
+        result = (metric, period)
+        if result not in self.top_keys_by_result:
+            self.top_keys_by_result[result] = TopK(self.top_n(metric))
+        self.top_keys_by_result[result].push(sum(values), key)
+
+    def reducer_final_top_keys(self):
+        """
+        This finalizer sends the top (value, customer_id or product) pairs of each metric and period
+        seen by this reducer to the next step
+        :return: ((metric, period), (value, customer_id or product))
+        """
+        for result, top_keys in self.top_keys_by_result.items():
+            for value, key in top_keys.pairs():
+                yield result, (value, key)
+
+    def combiner_find_top_keys(self, result, value_key_pairs):
+        """
+        This combiner merges the partial top lists of a metric and period into a single one
+        :param result: (metric, period)
+        :param value_key_pairs: each item of value_key_pairs is (value, customer_id or product)
+        :return: ((metric, period), (value, customer_id or product))
+        """
+        for pair in top_k(value_key_pairs, self.top_n(result[0])):
+            yield result, pair
+
+    def reducer_find_top_keys(self, result, value_key_pairs):
+        """
+        This reducer gets the top customers or products of each metric and period
+        :param result: (metric, period), period is None if the rows are not partitioned
+        :param value_key_pairs: each item of value_key_pairs is (value, customer_id or product)
+        :return: (metric, (value, customer_id or product)) or ((metric, period), (value, customer_id or product)),
+                 tagged output lines of all the metrics
+        """
+        metric, period = result
+        for pair in top_k(value_key_pairs, self.top_n(metric)):
+            if period is None:
+                yield metric, pair
+            else:
+                yield result, pair
+
+    def steps(self):
+        block_ingestion = self.options.ingestion == 'block'
+        return [
+            MRStep(mapper_init=self.mapper_init,
+                   mapper_raw=self.mapper_raw_metrics if block_ingestion else None,
+                   mapper=None if block_ingestion else self.mapper_metrics,
+                   mapper_final=self.mapper_final,
+                   combiner=self.combiner_sum_values,
+                   reducer_init=self.reducer_init_top_keys,
+                   reducer=self.reducer_sum_values,
+                   reducer_final=self.reducer_final_top_keys),
+            MRStep(combiner=self.combiner_find_top_keys,
+                   reducer=self.reducer_find_top_keys)
+        ]
+
+
+if __name__ == '__main__':
+    RetailAnalytics.run()
@@ -0,0 +1,257 @@
+"""
+Use this script to build a pre-aggregated cube of the retail files once and to answer top customer and product
+questions over any date range and country from it, without scanning the files again. The cube is a folder with:
+- customers.<column>.npy: revenue per (day, customer, country)
+- products.<column>.npy: revenue and quantity per (day, product, country)
+- cube.json: the customer ids, products and countries the integer codes of the tables stand for
+The rows of both tables are sorted by day, so a date range is a contiguous slice found by binary search, and the
+arrays are memory-mapped, so a query reads only the pages of its range. Example:
+python retail_cube.py build retail0910.csv retail1011.csv --cube retail_cube
+python retail_cube.py query --cube retail_cube --metric customer-revenue --start 2011-03 --end 2011-03
+"""
+
+import argparse
+import calendar
+import json
+import os
+from datetime import date
+
+import numpy as np
+
+from retail_analytics import CUSTOMER_REVENUE, DEFAULT_TOP_CUSTOMERS, DEFAULT_TOP_PRODUCTS, METRICS, PRODUCT_QUANTITY, \
+    PRODUCT_REVENUE
+from retail_input import COUNTRY, CUSTOMER_ID, DEFAULT_BLOCK_MB, INVOICE_DATE, PRICE, QUANTITY, STOCK_CODE, \
+    block_days, read_blocks
+
+DEFAULT_CUBE = 'retail_cube'
+
+# Name of the file with the dictionaries of the cube
+METADATA_FILE = 'cube.json'
+
+# Columns of the tables of the cube, the rows are sorted by all the integer columns in this order
+CUSTOMERS = 'customers'
+PRODUCTS = 'products'
+TABLES = {
+    CUSTOMERS: (('day', 'customer', 'country'), ('revenue',)),
+    PRODUCTS: (('day', 'product', 'country'), ('revenue', 'quantity')),
+}
+
+# Table, key column and value column of each metric
+METRIC_COLUMNS = {
+    CUSTOMER_REVENUE: (CUSTOMERS, 'customer', 'revenue'),
+    PRODUCT_REVENUE: (PRODUCTS, 'product', 'revenue'),
+    PRODUCT_QUANTITY: (PRODUCTS, 'product', 'quantity'),
+}
+
+
+class Dictionary:
+    """
+    Encodes the distinct values of a column to integer codes, in the order they are first seen
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def encode(self, values):
+        """
+        :param values: bytes array
+        :return: integer array of the codes of the values, new values get new codes
+        """
+        unique_values, inverse = np.unique(values, return_inverse=True)
+        codes = np.array([self.code(value) for value in unique_values.tolist()], dtype=np.int32)
+        return codes[inverse.ravel()]
+
+    def code(self, value):
+        """
+        :param value: bytes
+        :return: code of the value, a new value gets a new code
+        """
+        if value not in self.codes:
+            self.codes[value] = len(self.values)
+            self.values.append(value)
+        return self.codes[value]
+
+    def decoded_values(self):
+        """
+        :return: list of the values, as strings, the code of each value is its index
+        """
+        return [value.decode('utf-8', 'replace') for value in self.values]
+
+
+def aggregate(dimensions, measures):
+    """
+    Sums the measures of the rows with the same dimensions
+    :param dimensions: list of integer arrays, the rows are sorted by the first one, then by the second one...
+    :param measures: list of float arrays of the same length
+    :return: (list of the dimension arrays of the distinct rows, list of the summed measure arrays), sorted
+    """
+    order = np.lexsort(dimensions[::-1])
+    dimensions = [dimension[order] for dimension in dimensions]
+    if not len(order):
+        return dimensions, [measure[order] for measure in measures]
+
+    # A new row starts where any of the dimensions changes
+    starts = np.zeros(len(order), dtype=bool)
+    starts[0] = True
+    for dimension in dimensions:
+        starts[1:] |= dimension[1:] != dimension[:-1]
+    starts = np.flatnonzero(starts)
+    return [dimension[starts] for dimension in dimensions], [np.add.reduceat(measure[order], starts)
+                                                             for measure in measures]
+
+
+def concatenate_parts(parts):
+    """
+    :param parts: list of (list of dimension arrays, list of measure arrays) of the blocks
+    :return: (list of dimension arrays, list of measure arrays) of all the blocks, summed again
+    """
+    dimensions = [np.concatenate(columns) for columns in zip(*(part[0] for part in parts))]
+    measures = [np.concatenate(columns) for columns in zip(*(part[1] for part in parts))]
+    return aggregate(dimensions, measures)
+
+
+def build_cube(input_files, cube_path=DEFAULT_CUBE, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Reads the retail files once and writes the cube, each block is summed before all of them are summed together
+    :param input_files: paths of the retail files
+    :param cube_path: folder of the cube, created if needed
+    :param block_mb: size of the blocks the files are read in, in megabytes
+    :return: number of rows read
+    """
+    customers, products, countries = Dictionary(), Dictionary(), Dictionary()
+    customer_parts, product_parts = [], []
+    total_rows = 0
+    for input_file in input_files:
+        for rows, block in read_blocks(input_file, [CUSTOMER_ID, STOCK_CODE, INVOICE_DATE, COUNTRY],
+                                       [QUANTITY, PRICE], block_mb):
+            days = block_days(block[INVOICE_DATE])
+            country_codes = countries.encode(block[COUNTRY])
+            revenue = block[QUANTITY] * block[PRICE]
+
+            # Take into account only customer ids different than NULL
+            known = block[CUSTOMER_ID] != b''
+            customer_parts.append(aggregate([days[known], customers.encode(block[CUSTOMER_ID][known]),
+                                             country_codes[known]], [revenue[known]]))
+            product_parts.append(aggregate([days, products.encode(block[STOCK_CODE]), country_codes],
+                                           [revenue, block[QUANTITY]]))
+            total_rows += rows
+
+    os.makedirs(cube_path, exist_ok=True)
+    for table, parts in ((CUSTOMERS, customer_parts), (PRODUCTS, product_parts)):
+        dimension_columns, measure_columns = TABLES[table]
+        dimensions, measures = concatenate_parts(parts) if parts else ([np.zeros(0, dtype=np.int32)] * 3,
+                                                                       [np.zeros(0)] * len(measure_columns))
+        for column, values in zip(dimension_columns + measure_columns, dimensions + measures):
+            np.save(os.path.join(cube_path, '{}.{}.npy'.format(table, column)), values)
+
+    with open(os.path.join(cube_path, METADATA_FILE), 'w') as f:
+        json.dump({'input_files': list(input_files),
+                   'rows': total_rows,
+                   'customer': customers.decoded_values(),
+                   'product': products.decoded_values(),
+                   'country': countries.decoded_values()}, f)
+    return total_rows
+
+
+class RetailCube:
+    """
+    Answers top customer and product questions from a cube written by build_cube()
+    """
+
+    def __init__(self, cube_path=DEFAULT_CUBE):
+        with open(os.path.join(cube_path, METADATA_FILE)) as f:
+            self.metadata = json.load(f)
+        self.tables = {table: {column: np.load(os.path.join(cube_path, '{}.{}.npy'.format(table, column)),
+                                               mmap_mode='r')
+                               for column in dimension_columns + measure_columns}
+                       for table, (dimension_columns, measure_columns) in TABLES.items()}
+
+    def top(self, metric, n, start=None, end=None, country=None):
+        """
+        :param metric: one of METRICS
+        :param n: number of customers or products in the result
+        :param start: first day of the range, None for the first day of the cube
+        :param end: last day of the range, None for the last day of the cube
+        :param country: name of the country the rows are filtered by, None for all the countries
+        :return: list of (value, customer_id or product) of the n highest values, highest first
+        """
+        table, key_column, value_column = METRIC_COLUMNS[metric]
+        columns = self.tables[table]
+
+        # The rows are sorted by day, the range is a contiguous slice
+        days = columns['day']
+        first = 0 if start is None else np.searchsorted(days, start.toordinal(), 'left')
+        last = len(days) if end is None else np.searchsorted(days, end.toordinal(), 'right')
+        keys = np.asarray(columns[key_column][first:last])
+        values = np.asarray(columns[value_column][first:last])
+
+        if country is not None:
+            if country not in self.metadata['country']:
+                return []
+            selected = np.asarray(columns['country'][first:last]) == self.metadata['country'].index(country)
+            keys, values = keys[selected], values[selected]
+
+        names = self.metadata[key_column]
+        sums = np.bincount(keys, weights=values, minlength=len(names))
+
+        # Only the keys with rows in the range are candidates, the n highest are selected without sorting them all
+        candidates = np.flatnonzero(np.bincount(keys, minlength=len(names)))
+        if len(candidates) > n:
+            candidates = candidates[np.argpartition(-sums[candidates], n)[:n]]
+        candidates = candidates[np.argsort(-sums[candidates], kind='stable')]
+        return [(sums[code].item(), names[code]) for code in candidates]
+
+
+def first_day(text):
+    """
+    :param text: YYYY, YYYY-MM or YYYY-MM-DD
+    :return: first day of the year, month or the day itself
+    """
+    parts = [int(part) for part in text.split('-')]
+    return date(parts[0], *(parts[1:] + [1, 1])[:2])
+
+
+def last_day(text):
+    """
+    :param text: YYYY, YYYY-MM or YYYY-MM-DD
+    :return: last day of the year, month or the day itself
+    """
+    parts = [int(part) for part in text.split('-')]
+    if len(parts) == 1:
+        return date(parts[0], 12, 31)
+    if len(parts) == 2:
+        return date(parts[0], parts[1], calendar.monthrange(parts[0], parts[1])[1])
+    return date(*parts)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query a pre-aggregated cube of the retail files')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='read the retail files and write the cube')
+    build_parser.add_argument('input_files', nargs='+', help='paths of the retail files')
+    build_parser.add_argument('--cube', default=DEFAULT_CUBE, help='folder of the cube')
+    build_parser.add_argument('--block-mb', type=int, default=DEFAULT_BLOCK_MB)
+
+    query_parser = subparsers.add_parser('query', help='print the top customers and products from the cube')
+    query_parser.add_argument('--cube', default=DEFAULT_CUBE, help='folder of the cube')
+    query_parser.add_argument('--metric', action='append', choices=METRICS,
+                              help='metric to compute, can be given several times; all the metrics by default')
+    query_parser.add_argument('--start', type=first_day, help='first day, month or year of the range')
+    query_parser.add_argument('--end', type=last_day, help='last day, month or year of the range')
+    query_parser.add_argument('--country', help='take into account only the invoices of this country')
+    query_parser.add_argument('--top-customers', type=int, default=DEFAULT_TOP_CUSTOMERS)
+    query_parser.add_argument('--top-products', type=int, default=DEFAULT_TOP_PRODUCTS)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print('{} rows written to the cube {}'.format(build_cube(args.input_files, args.cube, args.block_mb),
+                                                      args.cube))
+    else:
+        cube = RetailCube(args.cube)
+        for metric in sorted(args.metric or METRICS):
+            n = args.top_customers if metric == CUSTOMER_REVENUE else args.top_products
+            for pair in cube.top(metric, n, args.start, args.end, args.country):
+                print(json.dumps(metric) + '\t' + json.dumps(list(pair)))
@@ -0,0 +1,143 @@
+"""
+Use this script to compute the results of retail_analytics.py in a single process without MapReduce. The input files
+are read in blocks, the customer ids and products are dictionary-encoded to integer codes, the values of each block are
+summed with np.bincount and added to NumPy arrays of sums indexed by code, and the top customers and products are
+selected with np.argpartition. Nothing goes through the JSON protocol of mrjob, and the output lines are the same as
+the ones of retail_analytics.py. Example:
+python retail_groupby.py retail0910.csv retail1011.csv --period year
+"""
+
+import argparse
+import json
+
+import numpy as np
+
+from retail_analytics import CUSTOMER_REVENUE, DEFAULT_TOP_CUSTOMERS, DEFAULT_TOP_PRODUCTS, METRICS, PRODUCT_QUANTITY, \
+    PRODUCT_REVENUE
+from retail_input import ALL, CUSTOMER_ID, DEFAULT_BLOCK_MB, INVOICE_DATE, PERIODS, PRICE, QUANTITY, STOCK_CODE, \
+    block_periods, group_by_period_and_key, read_blocks
+
+# Initial length of the arrays of sums, doubled when more keys are seen
+INITIAL_CAPACITY = 1024
+
+
+class GroupBySum:
+    """
+    Sums values by (period, key). Each (period, key) pair is encoded to an integer code the first time it is seen
+    and its sum is kept at that index of a NumPy array.
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.groups = []
+        self.sums = np.zeros(INITIAL_CAPACITY)
+
+    def encode(self, groups):
+        """
+        :param groups: list of (period, key) pairs
+        :return: integer array of their codes, new pairs get new codes
+        """
+        codes = self.codes
+        for group in groups:
+            if group not in codes:
+                codes[group] = len(self.groups)
+                self.groups.append(group)
+
+        if len(self.groups) > len(self.sums):
+            capacity = max(len(self.groups), 2 * len(self.sums))
+            self.sums = np.concatenate([self.sums, np.zeros(capacity - len(self.sums))])
+        return np.array([codes[group] for group in groups], dtype=np.int64)
+
+    def add(self, groups, inverse, values):
+        """
+        :param groups: list of the distinct (period, key) pairs of a block, as returned by group_by_period_and_key()
+        :param inverse: index in groups of the pair of each row
+        :param values: float array of the value of each row
+        """
+        codes = self.encode(groups)
+        np.add.at(self.sums, codes, np.bincount(inverse, weights=values, minlength=len(groups)))
+
+    def top(self, n):
+        """
+        :param n: number of keys in the result of each period
+        :return: dict of period -> list of (sum, key) of the n keys with the highest sums, highest first
+        """
+        sums = self.sums[:len(self.groups)]
+        periods = sorted(set(period for period, _ in self.groups), key=lambda period: period or '')
+        period_codes = {period: code for code, period in enumerate(periods)}
+        group_periods = np.array([period_codes[period] for period, _ in self.groups], dtype=np.int64)
+
+        results = {}
+        for code, period in enumerate(periods):
+            indices = np.flatnonzero(group_periods == code)
+
+            # Select the n highest sums without sorting them all, then sort only those
+            if len(indices) > n:
+                indices = indices[np.argpartition(-sums[indices], n)[:n]]
+            indices = indices[np.argsort(-sums[indices], kind='stable')]
+            results[period] = [(sums[index].item(), self.groups[index][1].decode('utf-8', 'replace'))
+                               for index in indices]
+        return results
+
+
+def group_by_sum(input_files, metrics=METRICS, period=ALL, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Sums the revenues and quantities of the input files for the metrics of retail_analytics.py
+    :param input_files: paths of the retail files
+    :param metrics: metrics to compute
+    :param period: one of PERIODS
+    :param block_mb: size of the blocks the files are read in, in megabytes
+    :return: dict of metric -> GroupBySum
+    """
+    results = {metric: GroupBySum() for metric in metrics}
+    for input_file in input_files:
+        for _, block in read_blocks(input_file, [CUSTOMER_ID, STOCK_CODE, INVOICE_DATE], [QUANTITY, PRICE], block_mb):
+            revenue = block[QUANTITY] * block[PRICE]
+            periods = block_periods(block[INVOICE_DATE], period)
+
+            # Take into account only customer ids different than NULL
+            if CUSTOMER_REVENUE in results:
+                known = block[CUSTOMER_ID] != b''
+                groups, inverse = group_by_period_and_key(periods[known] if periods is not None else None,
+                                                          block[CUSTOMER_ID][known])
+                results[CUSTOMER_REVENUE].add(groups, inverse, revenue[known])
+
+            # The products are grouped once for both product metrics
+            if PRODUCT_REVENUE in results or PRODUCT_QUANTITY in results:
+                groups, inverse = group_by_period_and_key(periods, block[STOCK_CODE])
+                if PRODUCT_REVENUE in results:
+                    results[PRODUCT_REVENUE].add(groups, inverse, revenue)
+                if PRODUCT_QUANTITY in results:
+                    results[PRODUCT_QUANTITY].add(groups, inverse, block[QUANTITY])
+    return results
+
+
+def top_results(results, top_customers=DEFAULT_TOP_CUSTOMERS, top_products=DEFAULT_TOP_PRODUCTS):
+    """
+    :param results: dict of metric -> GroupBySum
+    :param top_customers: number of customers in the result of the customer metrics
+    :param top_products: number of products in the result of the product metrics
+    :return: generator of (metric or (metric, period), (value, customer_id or product)),
+             in the same format and order as retail_analytics.py
+    """
+    for metric in sorted(results):
+        top = results[metric].top(top_customers if metric == CUSTOMER_REVENUE else top_products)
+        for period, pairs in top.items():
+            for pair in pairs:
+                yield (metric if period is None else (metric, period)), pair
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute the retail results with NumPy in a single process')
+    parser.add_argument('input_files', nargs='+', help='paths of the retail files')
+    parser.add_argument('--metric', action='append', choices=METRICS,
+                        help='metric to compute, can be given several times; all the metrics by default')
+    parser.add_argument('--period', choices=PERIODS, default=ALL)
+    parser.add_argument('--top-customers', type=int, default=DEFAULT_TOP_CUSTOMERS)
+    parser.add_argument('--top-products', type=int, default=DEFAULT_TOP_PRODUCTS)
+    parser.add_argument('--block-mb', type=int, default=DEFAULT_BLOCK_MB)
+    args = parser.parse_args()
+
+    sums = group_by_sum(args.input_files, args.metric or METRICS, args.period, args.block_mb)
+    for result, pair in top_results(sums, args.top_customers, args.top_products):
+        print(json.dumps(result) + '\t' + json.dumps(list(pair)))
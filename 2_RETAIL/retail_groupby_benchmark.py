@@ -0,0 +1,90 @@
+"""
+Use this script to check that the NumPy group-by of retail_groupby.py gives the same results as the mrjob job
+retail_analytics.py and to compare their speed, e.g.:
+python retail_groupby_benchmark.py retail0910.csv retail1011.csv
+"""
+
+import sys
+import time
+
+from retail_analytics import RetailAnalytics
+from retail_groupby import group_by_sum, top_results
+
+INPUT_FILES = sys.argv[1:] or ['retail0910.csv', 'retail1011.csv']
+
+# Periods of the runs, the same for all the paths
+BENCHMARK_PERIODS = ['all', 'month']
+
+# Number of decimals compared, the sums are not added in the same order by both paths
+DECIMALS = 6
+
+
+def run_job(ingestion, period):
+    """
+    Runs retail_analytics.py with the inline runner
+    :return: list of (result, (value, key)) output pairs
+    """
+    job = RetailAnalytics(['-r', 'inline', '--no-conf', '--ingestion', ingestion, '--period', period] + INPUT_FILES)
+    with job.make_runner() as runner:
+        runner.run()
+        return [(tuple(result) if isinstance(result, list) else result, tuple(pair))
+                for result, pair in job.parse_output(runner.cat_output())]
+
+
+def run_groupby(period):
+    """
+    :return: list of (result, (value, key)) output pairs of retail_groupby.py
+    """
+    return list(top_results(group_by_sum(INPUT_FILES, period=period)))
+
+
+def timed(run, *args):
+    """
+    :return: (output pairs, elapsed seconds)
+    """
+    start = time.perf_counter()
+    pairs = run(*args)
+    return pairs, time.perf_counter() - start
+
+
+def by_result(pairs):
+    """
+    Groups the output pairs by result; keys with the same value may come out in any order
+    :return: dict of result -> sorted list of (rounded value, key)
+    """
+    results = {}
+    for result, (value, key) in pairs:
+        results.setdefault(result, []).append((round(value, DECIMALS), key))
+    return {result: sorted(values) for result, values in results.items()}
+
+
+def same_top(reference_values, values):
+    """
+    Compares the top lists of a result. Keys tied with the lowest value of the list may differ, since each path may
+    keep any of the tied keys
+    :param reference_values: sorted list of (rounded value, key) of the reference, None if it has no such result
+    :param values: sorted list of (rounded value, key), None if there is no such result
+    :return: True if both lists have the same values and the same keys above the lowest value
+    """
+    if reference_values is None or values is None:
+        return reference_values == values
+    if [value for value, _ in reference_values] != [value for value, _ in values]:
+        return False
+    lowest = reference_values[0][0] if reference_values else None
+    return [pair for pair in reference_values if pair[0] != lowest] == [pair for pair in values if pair[0] != lowest]
+
+
+for period in BENCHMARK_PERIODS:
+    reference_pairs, reference_time = timed(run_job, 'line', period)
+    reference = by_result(reference_pairs)
+    print('--period {}'.format(period))
+    print('  {:<22} {:.3f}s'.format('mrjob, line mapper:', reference_time))
+
+    for name, run, args in (('mrjob, block mapper:', run_job, ('block', period)),
+                            ('NumPy group-by:', run_groupby, (period,))):
+        pairs, elapsed = timed(run, *args)
+        results = by_result(pairs)
+        mismatches = sum(1 for result in set(reference) | set(results)
+                         if not same_top(reference.get(result), results.get(result)))
+        print('  {:<22} {:.3f}s, {:.1f}x faster, {} different results'.format(
+            name, elapsed, reference_time / elapsed, mismatches))
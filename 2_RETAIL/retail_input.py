@@ -0,0 +1,258 @@
+"""
+Block ingestion of the retail CSV files for the mapper_raw mode of the retail jobs. Instead of building a CSV reader
+for every line, the file is read in large binary blocks of complete records. The rows without quotes, nearly all of
+them, are split into fields by a single split of the whole block; only the rows with quoted fields, which may contain
+commas and line breaks, go through the CSV reader. The numeric columns of a block are converted into NumPy arrays at
+once and the values are summed by key per block with np.unique and np.bincount, so only one (key, total) pair per key
+and block reaches the in-mapper sums.
+"""
+
+import csv
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+
+# Columns of the retail files, used when a file has no header
+COLUMNS = ('Invoice', 'StockCode', 'Description', 'Quantity', 'InvoiceDate', 'Price', 'Customer ID', 'Country')
+
+STOCK_CODE = 'StockCode'
+QUANTITY = 'Quantity'
+INVOICE_DATE = 'InvoiceDate'
+PRICE = 'Price'
+CUSTOMER_ID = 'Customer ID'
+COUNTRY = 'Country'
+
+# Periods the aggregations can be partitioned by; with ALL, the rows are not partitioned
+ALL = 'all'
+PERIODS = (ALL, 'year', 'quarter', 'month')
+
+# Default size of the blocks the files are read in, in megabytes
+DEFAULT_BLOCK_MB = 16
+
+
+def column_indices(first_row, columns):
+    """
+    Detects the header by its column names
+    :param first_row: first row of the file
+    :param columns: names of the columns to read
+    :return: (dict of column -> index, number of columns, True if first_row is the header)
+    """
+    if all(column in first_row for column in columns):
+        return {column: first_row.index(column) for column in columns}, len(first_row), True
+    return {column: COLUMNS.index(column) for column in columns}, len(COLUMNS), False
+
+
+def complete_records_end(data):
+    """
+    :param data: bytes read so far
+    :return: position after the last complete record of data
+    """
+    end = data.rfind(b'\n') + 1
+
+    # With an odd number of quotes, the last quote opens a field with line breaks which is not complete yet
+    if data.count(b'"', 0, end) % 2:
+        end = data.rfind(b'\n', 0, data.rfind(b'"', 0, end)) + 1
+    return end
+
+
+def split_quoted_records(records):
+    """
+    Separates the records with quoted fields from the other ones
+    :param records: complete records, as bytes
+    :return: (the records without quotes, as bytes, list of the records with quoted fields, as bytes)
+    """
+    plain = []
+    quoted = []
+    plain_start = 0
+    quote = records.find(b'"')
+    while quote != -1:
+        start = records.rfind(b'\n', 0, quote) + 1
+        end = records.find(b'\n', quote)
+
+        # A quoted field can contain line breaks, the record ends at the first line break after an even number of quotes
+        while end != -1 and records.count(b'"', start, end) % 2:
+            end = records.find(b'\n', end + 1)
+        if end == -1:
+            end = len(records)
+
+        plain.append(records[plain_start:start])
+        quoted.append(records[start:end])
+        plain_start = end + 1
+        quote = records.find(b'"', plain_start)
+
+    plain.append(records[plain_start:])
+    return b''.join(plain), quoted
+
+
+def csv_rows(records, indices):
+    """
+    :param records: list of records, as bytes
+    :param indices: dict of column -> index of the columns to read
+    :return: dict of column -> list of values, as bytes
+    """
+    text = b'\n'.join(records).decode('utf-8', 'replace')
+    rows = [row for row in csv.reader(text.split('\n')) if row]
+    return {column: [row[index].encode('utf-8') for row in rows] for column, index in indices.items()}
+
+
+def parse_records(records, indices, number_of_columns, numeric_columns):
+    """
+    :param records: complete records, as bytes
+    :param indices: dict of column -> index of the columns to read
+    :param number_of_columns: number of columns of the file
+    :param numeric_columns: columns converted to float arrays, the others are kept as bytes arrays
+    :return: (number of rows, dict of column -> NumPy array)
+    """
+    plain, quoted = split_quoted_records(records.replace(b'\r\n', b'\n'))
+    values = csv_rows(quoted, indices)
+
+    # The rows without quotes are split into fields all at once
+    plain = plain.strip(b'\n')
+    rows = plain.count(b'\n') + 1 if plain else 0
+    fields = plain.replace(b'\n', b',').split(b',') if plain else []
+    if len(fields) == number_of_columns * rows:
+        for column, index in indices.items():
+            values[column].extend(fields[index::number_of_columns])
+    else:
+        # Some row has an empty line or a wrong number of fields, the CSV reader parses the whole block
+        values = csv_rows([records], indices)
+
+    block = {column: np.array(column_values, dtype=float if column in numeric_columns else bytes)
+             for column, column_values in values.items()}
+    return len(next(iter(values.values()))), block
+
+
+def read_blocks(path, text_columns, numeric_columns, block_mb=DEFAULT_BLOCK_MB):
+    """
+    Parses a retail file in blocks; the header, if any, is skipped
+    :param path: local path of the retail file
+    :param text_columns: names of the string columns to read, kept as bytes arrays
+    :param numeric_columns: names of the numeric columns to read
+    :param block_mb: size of the blocks, in megabytes
+    :return: generator of (number of rows, dict of column -> NumPy array)
+    """
+    with open(path, 'rb') as f:
+        first_line = f.readline()
+        first_row = next(csv.reader([first_line.decode('utf-8', 'replace')]), [])
+        indices, number_of_columns, has_header = column_indices(first_row, list(text_columns) + list(numeric_columns))
+
+        rest = b'' if has_header else first_line
+        while True:
+            chunk = f.read(block_mb * 1024 * 1024)
+            data = rest + chunk
+            if not chunk:
+                if data.strip():
+                    yield parse_records(data, indices, number_of_columns, numeric_columns)
+                break
+
+            end = complete_records_end(data)
+            rest = data[end:]
+            if end:
+                yield parse_records(data[:end], indices, number_of_columns, numeric_columns)
+
+
+@lru_cache(maxsize=None)
+def invoice_day(invoice_date):
+    """
+    :param invoice_date: InvoiceDate column, e.g. 2009-12-01 07:45:00 or 12/1/2009 7:45
+    :return: date of the invoice
+    """
+    day = invoice_date.split(' ', 1)[0]
+    if '/' in day:
+        month, day_of_month, year = day.split('/')
+    else:
+        year, month, day_of_month = day.split('-')
+    return date(int(year), int(month), int(day_of_month))
+
+
+@lru_cache(maxsize=None)
+def invoice_period(invoice_date, period):
+    """
+    :param invoice_date: InvoiceDate column, e.g. 2009-12-01 07:45:00 or 12/1/2009 7:45
+    :param period: one of PERIODS
+    :return: period of the invoice, e.g. 2009, 2009-Q4 or 2009-12, None for ALL
+    """
+    if period == ALL:
+        return None
+
+    day = invoice_day(invoice_date)
+    if period == 'year':
+        return str(day.year)
+    if period == 'quarter':
+        return '{}-Q{}'.format(day.year, (day.month - 1) // 3 + 1)
+    return '{}-{:02d}'.format(day.year, day.month)
+
+
+def block_periods(invoice_dates, period):
+    """
+    :param invoice_dates: bytes array of the InvoiceDate column of a block
+    :param period: one of PERIODS
+    :return: string array of the period of each row, None for ALL
+    """
+    if period == ALL:
+        return None
+
+    # Many rows share the same invoice, each distinct date is parsed once
+    unique_dates, inverse = np.unique(invoice_dates, return_inverse=True)
+    periods = np.array([invoice_period(value.decode('utf-8', 'replace'), period) for value in unique_dates.tolist()])
+    return periods[inverse.ravel()]
+
+
+def block_days(invoice_dates):
+    """
+    :param invoice_dates: bytes array of the InvoiceDate column of a block
+    :return: integer array of the day of each row, as proleptic Gregorian ordinal (date.toordinal())
+    """
+    unique_dates, inverse = np.unique(invoice_dates, return_inverse=True)
+    days = np.array([invoice_day(value.decode('utf-8', 'replace')).toordinal() for value in unique_dates.tolist()],
+                    dtype=np.int32)
+    return days[inverse.ravel()]
+
+
+def group_by_period_and_key(periods, keys):
+    """
+    :param periods: string array of the period of each row, None if the rows are not partitioned
+    :param keys: bytes array of the same length
+    :return: (list of the distinct (period, key) pairs with bytes keys, index in that list of the pair of each row)
+    """
+    unique_keys, key_inverse = np.unique(keys, return_inverse=True)
+    unique_keys = unique_keys.tolist()
+    key_inverse = key_inverse.ravel()
+    if periods is None:
+        return [(None, key) for key in unique_keys], key_inverse
+
+    # The (period, key) pairs are numbered by period index * number of keys + key index
+    unique_periods, period_inverse = np.unique(periods, return_inverse=True)
+    groups, inverse = np.unique(period_inverse.ravel() * len(unique_keys) + key_inverse, return_inverse=True)
+    unique_periods = unique_periods.tolist()
+    return [(unique_periods[group // len(unique_keys)], unique_keys[group % len(unique_keys)])
+            for group in groups.tolist()], inverse.ravel()
+
+
+def sum_by_period_and_key(periods, keys, values):
+    """
+    :param periods: string array of the period of each value, None if the values are not partitioned
+    :param keys: bytes array of the same length
+    :param values: float array of the same length
+    :return: list of ((period, key), sum of its values), the keys are decoded
+    """
+    groups, inverse = group_by_period_and_key(periods, keys)
+    sums = np.bincount(inverse, weights=values, minlength=len(groups))
+    return [((period, key.decode('utf-8', 'replace')), total) for (period, key), total in zip(groups, sums.tolist())]
+
+
+def sum_non_negative_by_period_and_key(periods, keys, values):
+    """
+    Sums the values like sum_by_period_and_key(), leaving out each negative value before summing
+    :param periods: string array of the period of each value, None if the values are not partitioned
+    :param keys: bytes array of the same length
+    :param values: float array of the same length
+    :return: (list of ((period, key), sum of its non-negative values), number of negative values left out)
+    """
+    kept = values >= 0
+    skipped = len(values) - int(np.count_nonzero(kept))
+    if skipped:
+        periods = periods[kept] if periods is not None else None
+        keys, values = keys[kept], values[kept]
+    return sum_by_period_and_key(periods, keys, values), skipped
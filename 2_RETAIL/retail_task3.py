@@ -1,17 +1,54 @@
 import csv
+import os
+import sys
 
 from mrjob.job import MRJob
 from mrjob.step import MRStep
 
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from in_mapper_combiner import DEFAULT_MAX_KEYS, DEFAULT_MAX_MEMORY_MB, InMapperCombiner
+from retail_input import ALL, CUSTOMER_ID, DEFAULT_BLOCK_MB, INVOICE_DATE, PERIODS, PRICE, QUANTITY, block_periods, \
+    invoice_period, read_blocks, sum_by_period_and_key
+from top_k import TopK, top_k
+
+# Number of customers in the result
+TOP_CUSTOMERS = 10
+
 
 class TopTenCustomers(MRJob):
 
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['retail_input.py', '../common/in_mapper_combiner.py#in_mapper_combiner.py', '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(TopTenCustomers, self).configure_args()
+        self.add_passthru_arg('--combiner-max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                              help='Maximum number of customers summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--combiner-max-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                              help='Maximum memory of the customers summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--period', choices=PERIODS, default=ALL,
+                              help='Compute the top customers of each year, quarter or month of the invoice dates')
+        self.add_passthru_arg('--ingestion', choices=['block', 'line'], default='line',
+                              help='Parse the input one line at a time (line), or each input file in large blocks by a '
+                                   'single mapper (block)')
+        self.add_passthru_arg('--block-mb', type=int, default=DEFAULT_BLOCK_MB,
+                              help='Size of the blocks of the block ingestion, in megabytes')
+
+    def mapper_init(self):
+        """
+        This initializer prepares the in-mapper revenue sums
+        """
+        self.revenue_sums = InMapperCombiner(self.options.combiner_max_keys, self.options.combiner_max_mb)
+
     def mapper_revenue_customer(self, _, line):
         """
-        This mapper yields the customer ids (seventh column) and the revenue for each one (quantity * price)
+        This mapper sums the revenue (quantity * price) of each customer id (seventh column)
+        in the period of the invoice date (fifth column) until the sums are spilled
         :param _: None
         :param line: one line from the input file
-        :return: (customer_id, revenue)
+        :return: ((period, customer_id), revenue), period is None if the rows are not partitioned
         """
 
         # For input file type CSV, skip first line and split other lines by commas
@@ -20,51 +57,129 @@ class TopTenCustomers(MRJob):
 
             # Columns: Invoice,StockCode,Description,Quantity,InvoiceDate,Price,Customer ID,Country
             quantity = float(attributes[3])
+            period = invoice_period(attributes[4], self.options.period)
             price = float(attributes[5])
             customer_id = attributes[6]
 
             # Take into account only customer ids different than NULL
             if customer_id != '':
                 revenue = price * quantity
-                yield customer_id, revenue
+                self.revenue_sums.add((period, customer_id), revenue)
+
+        for customer_revenue in self.revenue_sums.spill_if_full():
+            yield customer_revenue
+
+    def mapper_raw_revenue_customer(self, input_path, _):
+        """
+        This mapper parses the whole input file in blocks, computes the revenue of all the rows
+        of a block at once and sums it by period and customer id within the block
+        before adding it to the in-mapper sums
+        :param input_path: local path of the input file
+        :param _: URI of the input file
+        :return: ((period, customer_id), revenue), period is None if the rows are not partitioned
+        """
+        for rows, block in read_blocks(input_path, [CUSTOMER_ID, INVOICE_DATE], [QUANTITY, PRICE],
+                                       self.options.block_mb):
+
+            # Take into account only customer ids different than NULL
+            known = block[CUSTOMER_ID] != b''
+            revenue = block[QUANTITY][known] * block[PRICE][known]
+            periods = block_periods(block[INVOICE_DATE][known], self.options.period)
+            self.revenue_sums.add_totals(sum_by_period_and_key(periods, block[CUSTOMER_ID][known], revenue),
+                                         int(known.sum()))
+
+            for customer_revenue in self.revenue_sums.spill_if_full():
+                yield customer_revenue
 
-    def combiner_sum_revenue(self, customer_id, revenue):
+    def mapper_final(self):
+        """
+        This finalizer emits the revenue sums left in the mapper
+        and reports how much the summing in the mapper cut the shuffle
+        :return: ((period, customer_id), revenue)
+        """
+        for customer_revenue in self.revenue_sums.spill():
+            yield customer_revenue
+
+        self.increment_counter('in_mapper_combiner', 'records_in', self.revenue_sums.records_in)
+        self.increment_counter('in_mapper_combiner', 'records_out', self.revenue_sums.records_out)
+        self.increment_counter('in_mapper_combiner', 'spills', self.revenue_sums.spills)
+
+    def combiner_sum_revenue(self, period_customer, revenue):
         """
         This combiner sums the revenues we've computed so far by key
-        :param customer_id
+        :param period_customer: (period, customer_id)
         :param revenue: price * quantity
-        :return: (customer_id, sum of revenue)
+        :return: ((period, customer_id), sum of revenue)
+        """
+        yield period_customer, sum(revenue)
+
+    def reducer_init_top_customers(self):
+        """
+        This initializer prepares the bounded heaps of the customers with the highest revenue
+        of each period seen by this reducer
         """
-        yield customer_id, sum(revenue)
+        self.top_customers_by_period = {}
 
-    def reducer_sum_revenue(self, customer_id, revenue):
+    def reducer_sum_revenue(self, period_customer, revenue):
         """
-        This reducer sends all (total revenue, customer) constructs to the next step
-        :param customer_id
+        This reducer sums the revenue of each customer and keeps only the top 10 customers of each period it sees
+        :param period_customer: (period, customer_id)
         :param revenue: the total revenue of the key from the result of the combiner
-        :return: (None, (sum(revenue), customer_id))
+        :return: None
+        """
+        period, customer_id = period_customer
+        if period not in self.top_customers_by_period:
+            self.top_customers_by_period[period] = TopK(TOP_CUSTOMERS)
+        self.top_customers_by_period[period].push(sum(revenue), customer_id)
+
+    def reducer_final_top_customers(self):
+        """
+        This finalizer sends the top 10 (total revenue, customer) constructs of each period seen by this reducer
+        to the next step
+        :return: (period, (revenue, customer_id)) at most 10 times per period
+        """
+        for period, top_customers in self.top_customers_by_period.items():
+            for revenue, customer_id in top_customers.pairs():
+                yield period, (revenue, customer_id)
+
+    def combiner_find_top_ten_customers(self, period, revenue_customer_pair):
+        """
+        This combiner merges the partial top 10 lists of a period into a single one
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param revenue_customer_pair: each item of revenue_customer_pair is (revenue, customer)
+        :return: (period, (revenue, customer)) at most 10 times
         """
-        yield None, (sum(revenue), customer_id)
+        for pair in top_k(revenue_customer_pair, TOP_CUSTOMERS):
+            yield period, pair
 
-    def reducer_find_top_ten_customers(self, _, revenue_customer_pair):
+    def reducer_find_top_ten_customers(self, period, revenue_customer_pair):
         """
-        This reducer gets the top 10 client with the higher total revenue for each year
-        :param _: discard the key; it is just None
+        This reducer gets the top 10 client with the higher total revenue for each period
+        :param period: period of the invoice dates, None if the rows are not partitioned
         :param revenue_customer_pair: each item of revenue_customer_pair is (revenue, customer)
-        :return: (key=revenue, value=customer) 10 times
+        :return: (key=revenue, value=customer) 10 times, or (period, (revenue, customer)) 10 times per period
         """
 
-        # Sort by value of the revenue
-        sorted_revenue_customer_pairs = sorted(revenue_customer_pair, key=lambda x: x[0], reverse=True)
-        for i in range(10):
-            yield sorted_revenue_customer_pairs[i]
+        # Keep only the 10 highest revenues instead of sorting them all
+        for pair in top_k(revenue_customer_pair, TOP_CUSTOMERS):
+            if period is None:
+                yield pair
+            else:
+                yield period, pair
 
     def steps(self):
+        block_ingestion = self.options.ingestion == 'block'
         return [
-            MRStep(mapper=self.mapper_revenue_customer,
+            MRStep(mapper_init=self.mapper_init,
+                   mapper_raw=self.mapper_raw_revenue_customer if block_ingestion else None,
+                   mapper=None if block_ingestion else self.mapper_revenue_customer,
+                   mapper_final=self.mapper_final,
                    combiner=self.combiner_sum_revenue,
-                   reducer=self.reducer_sum_revenue),
-            MRStep(reducer=self.reducer_find_top_ten_customers)
+                   reducer_init=self.reducer_init_top_customers,
+                   reducer=self.reducer_sum_revenue,
+                   reducer_final=self.reducer_final_top_customers),
+            MRStep(combiner=self.combiner_find_top_ten_customers,
+                   reducer=self.reducer_find_top_ten_customers)
         ]
 
 
@@ -2,17 +2,63 @@ from mrjob.job import MRJob
 from mrjob.step import MRStep
 
 import csv
+import math
+import os
+import sys
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from in_mapper_combiner import DEFAULT_MAX_KEYS, DEFAULT_MAX_MEMORY_MB, InMapperCombiner
+from retail_input import ALL, DEFAULT_BLOCK_MB, INVOICE_DATE, PERIODS, PRICE, QUANTITY, STOCK_CODE, block_periods, \
+    invoice_period, read_blocks, sum_by_period_and_key, sum_non_negative_by_period_and_key
+from space_saving import DEFAULT_SKETCH_SIZE, HeavyHitterSketches, SpaceSaving
+from top_k import TopK, top_k
+
+# Number of best selling products in the result
+TOP_PRODUCTS = 1
 
 
 class BestSellingProductByRevenue(MRJob):
 
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['retail_input.py', '../common/space_saving.py#space_saving.py',
+             '../common/in_mapper_combiner.py#in_mapper_combiner.py', '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(BestSellingProductByRevenue, self).configure_args()
+        self.add_passthru_arg('--combiner-max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                              help='Maximum number of products summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--combiner-max-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                              help='Maximum memory of the products summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--period', choices=PERIODS, default=ALL,
+                              help='Compute the best selling product of each year, quarter or month of the invoice dates')
+        self.add_passthru_arg('--ingestion', choices=['block', 'line'], default='line',
+                              help='Parse the input one line at a time (line), or each input file in large blocks by a '
+                                   'single mapper (block)')
+        self.add_passthru_arg('--block-mb', type=int, default=DEFAULT_BLOCK_MB,
+                              help='Size of the blocks of the block ingestion, in megabytes')
+        self.add_passthru_arg('--approximate', action='store_true',
+                              help='Find the best selling products with Space-Saving sketches of bounded size '
+                                   'instead of exact sums; negative values are left out')
+        self.add_passthru_arg('--sketch-size', type=int, default=DEFAULT_SKETCH_SIZE,
+                              help='Number of products monitored by each sketch of the approximate mode')
+
+    def mapper_init(self):
+        """
+        This initializer prepares the in-mapper revenue sums, or the sketches of the approximate mode
+        """
+        self.revenue_sums = InMapperCombiner(self.options.combiner_max_keys, self.options.combiner_max_mb)
+        self.product_sketches = HeavyHitterSketches(self.options.sketch_size)
+
     def mapper_product_value(self, _, line):
         """
-        This mapper yields each product (second column), the quantity (forth column) and the price (sixth column)
-        and computes the revenue for each one (quantity * price)
+        This mapper reads each product (second column), the quantity (forth column) and the price (sixth column),
+        computes the revenue for each one (quantity * price) and sums it by product in the period of the invoice date
+        (fifth column) until the sums are spilled
         :param _: None
         :param line: one line from the input file
-        :return: product, revenue
+        :return: (period, product), revenue; period is None if the rows are not partitioned
         """
 
         # For input file type CSV, skip first line and split other lines by commas
@@ -22,58 +68,215 @@ class BestSellingProductByRevenue(MRJob):
             # Columns: Invoice,StockCode,Description,Quantity,InvoiceDate,Price,Customer ID,Country
             product = attributes[1]
             quantity = float(attributes[3])
+            period = invoice_period(attributes[4], self.options.period)
             price = float(attributes[5])
 
             # Compute the revenue
             revenue = price * quantity
-            yield product, revenue
+            if self.options.approximate:
+                self.product_sketches.add(period, product, revenue)
+            else:
+                self.revenue_sums.add((period, product), revenue)
+
+        for product_revenue in self.revenue_sums.spill_if_full():
+            yield product_revenue
+
+    def mapper_raw_product_value(self, input_path, _):
+        """
+        This mapper parses the whole input file in blocks, computes the revenue of all the rows
+        of a block at once and sums it by period and product within the block before adding it to the in-mapper sums,
+        or to the sketches of the approximate mode without the negative revenues
+        :param input_path: local path of the input file
+        :param _: URI of the input file
+        :return: (period, product), revenue; period is None if the rows are not partitioned
+        """
+        for rows, block in read_blocks(input_path, [STOCK_CODE, INVOICE_DATE], [QUANTITY, PRICE],
+                                       self.options.block_mb):
+            revenue = block[QUANTITY] * block[PRICE]
+            periods = block_periods(block[INVOICE_DATE], self.options.period)
+            if self.options.approximate:
+                # The negative revenues are left out row by row before summing, as in the line mapper
+                product_sums, skipped = sum_non_negative_by_period_and_key(periods, block[STOCK_CODE], revenue)
+                self.product_sketches.add_totals(product_sums, rows - skipped, skipped)
+            else:
+                self.revenue_sums.add_totals(sum_by_period_and_key(periods, block[STOCK_CODE], revenue), rows)
+
+            for product_revenue in self.revenue_sums.spill_if_full():
+                yield product_revenue
+
+    def mapper_final(self):
+        """
+        This finalizer emits the revenue sums left in the mapper, or the sketch of each period in the approximate mode,
+        and reports how much the summing in the mapper cut the shuffle
+        :return: (period, product), revenue or period, sketch state
+        """
+        for product_revenue in self.revenue_sums.spill():
+            yield product_revenue
+        for period_sketch in self.product_sketches.spill():
+            yield period_sketch
+
+        if self.options.approximate:
+            self.increment_counter('space_saving', 'records_in', self.product_sketches.records_in)
+            self.increment_counter('space_saving', 'records_skipped', self.product_sketches.records_skipped)
+            self.increment_counter('space_saving', 'evictions', self.product_sketches.evictions)
+        else:
+            self.increment_counter('in_mapper_combiner', 'records_in', self.revenue_sums.records_in)
+            self.increment_counter('in_mapper_combiner', 'records_out', self.revenue_sums.records_out)
+            self.increment_counter('in_mapper_combiner', 'spills', self.revenue_sums.spills)
 
-    def combiner_sum_revenue(self, product, revenue):
+    def combiner_sum_revenue(self, period_product, revenue):
         """
-        This combiner sums the revenues we've computed so far by key (product)
-        :param product (stockCode)
+        This combiner sums the revenues we've computed so far by key (period, product)
+        :param period_product: (period, stockCode)
         :param revenue: price * quantity
-        :return: product, sum of revenue
+        :return: (period, product), sum of revenue
         """
-        yield product, sum(revenue)
+        yield period_product, sum(revenue)
 
-    def reducer_sum_revenue(self, product, revenue):
+    def reducer_init_top_products(self):
         """
-        This reducer sends all total revenue, product pairs to the next step
-        :param product
+        This initializer prepares the bounded heaps of the best selling products of each period seen by this reducer
+        """
+        self.top_products_by_period = {}
+
+    def reducer_sum_revenue(self, period_product, revenue):
+        """
+        This reducer sums the revenue of each product and keeps only the best selling product of each period it sees
+        :param period_product: (period, product)
         :param revenue: the total revenue of the key from the result of the combiner
-        :return: (None, (sum(revenue), product))
+        :return: None
+        """
+        period, product = period_product
+        if period not in self.top_products_by_period:
+            self.top_products_by_period[period] = TopK(TOP_PRODUCTS)
+        self.top_products_by_period[period].push(sum(revenue), product)
+
+    def reducer_final_top_products(self):
+        """
+        This finalizer sends the best total revenue, product pair of each period seen by this reducer to the next step
+        :return: (period, (revenue, product)) once per period
+        """
+        for period, top_products in self.top_products_by_period.items():
+            for revenue, product in top_products.pairs():
+                yield period, (revenue, product)
+
+    def combiner_find_best_selling_product_by_revenue(self, period, revenue_product_pairs):
         """
-        yield None, (sum(revenue), product)
+        This combiner keeps the best selling product of a period among the pairs it receives
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param revenue_product_pairs: each item of revenue_product_pairs is (revenue, product)
+        :return: (period, (revenue, product)) once
+        """
+        for pair in top_k(revenue_product_pairs, TOP_PRODUCTS):
+            yield period, pair
 
-    def reducer_find_best_selling_product_by_revenue(self, _, revenue_product_pairs):
+    def reducer_find_best_selling_product_by_revenue(self, period, revenue_product_pairs):
         """
-        This reducer gets the best selling product in terms of revenue
-        :param _: discard the key; it is just None
+        This reducer gets the best selling product in terms of revenue for each period
+        :param period: period of the invoice dates, None if the rows are not partitioned
         :param revenue_product_pairs: each item of revenue_product_pairs is (revenue, product)
-        :return: (key=revenue, value=product) once
+        :return: (key=revenue, value=product) once, or (period, (revenue, product)) once per period
+        """
+
+        # Keep only the highest revenue instead of sorting them all
+        for pair in top_k(revenue_product_pairs, TOP_PRODUCTS):
+            if period is None:
+                yield pair
+            else:
+                yield period, pair
+
+    def combiner_merge_sketches(self, period, sketch_states):
+        """
+        This combiner merges the sketches of a period into a single one
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param sketch_states: states of the Space-Saving sketches of the mappers
+        :return: period, state of the merged sketch
+        """
+        yield period, SpaceSaving.merge(sketch_states, self.options.sketch_size).state()
+
+    def reducer_find_best_selling_product_from_sketches(self, period, sketch_states):
         """
+        This reducer merges the sketches of a period, gets its approximate best selling product by revenue
+        and reports how many results are certainly right and the maximum overestimation of each period
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :return: (key=revenue, value=product) once, or (period, (revenue, product)) once per period
+        """
+        pairs, guaranteed, max_error = SpaceSaving.merge(sketch_states, self.options.sketch_size).top(TOP_PRODUCTS)
+        self.increment_counter('space_saving', 'results', len(pairs))
+        self.increment_counter('space_saving', 'guaranteed_results', guaranteed)
+        self.increment_counter('space_saving_max_error', period or ALL, int(math.ceil(max_error)))
 
-        # Sort by value of the revenue
-        sorted_revenue_product_pairs = sorted(revenue_product_pairs, key=lambda x: x[0], reverse=True)
-        yield sorted_revenue_product_pairs[0]
+        for pair in pairs:
+            if period is None:
+                yield pair
+            else:
+                yield period, pair
 
     def steps(self):
+        block_ingestion = self.options.ingestion == 'block'
+        if self.options.approximate:
+            return [
+                MRStep(mapper_init=self.mapper_init,
+                       mapper_raw=self.mapper_raw_product_value if block_ingestion else None,
+                       mapper=None if block_ingestion else self.mapper_product_value,
+                       mapper_final=self.mapper_final,
+                       combiner=self.combiner_merge_sketches,
+                       reducer=self.reducer_find_best_selling_product_from_sketches)
+            ]
         return [
-            MRStep(mapper=self.mapper_product_value,
+            MRStep(mapper_init=self.mapper_init,
+                   mapper_raw=self.mapper_raw_product_value if block_ingestion else None,
+                   mapper=None if block_ingestion else self.mapper_product_value,
+                   mapper_final=self.mapper_final,
                    combiner=self.combiner_sum_revenue,
-                   reducer=self.reducer_sum_revenue),
-            MRStep(reducer=self.reducer_find_best_selling_product_by_revenue)
+                   reducer_init=self.reducer_init_top_products,
+                   reducer=self.reducer_sum_revenue,
+                   reducer_final=self.reducer_final_top_products),
+            MRStep(combiner=self.combiner_find_best_selling_product_by_revenue,
+                   reducer=self.reducer_find_best_selling_product_by_revenue)
         ]
 
 
 class BestSellingProductByQuantity(MRJob):
+
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['retail_input.py', '../common/space_saving.py#space_saving.py',
+             '../common/in_mapper_combiner.py#in_mapper_combiner.py', '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(BestSellingProductByQuantity, self).configure_args()
+        self.add_passthru_arg('--combiner-max-keys', type=int, default=DEFAULT_MAX_KEYS,
+                              help='Maximum number of products summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--combiner-max-mb', type=int, default=DEFAULT_MAX_MEMORY_MB,
+                              help='Maximum memory of the products summed in a mapper before the sums are emitted')
+        self.add_passthru_arg('--period', choices=PERIODS, default=ALL,
+                              help='Compute the best selling product of each year, quarter or month of the invoice dates')
+        self.add_passthru_arg('--ingestion', choices=['block', 'line'], default='line',
+                              help='Parse the input one line at a time (line), or each input file in large blocks by a '
+                                   'single mapper (block)')
+        self.add_passthru_arg('--block-mb', type=int, default=DEFAULT_BLOCK_MB,
+                              help='Size of the blocks of the block ingestion, in megabytes')
+        self.add_passthru_arg('--approximate', action='store_true',
+                              help='Find the best selling products with Space-Saving sketches of bounded size '
+                                   'instead of exact sums; negative values are left out')
+        self.add_passthru_arg('--sketch-size', type=int, default=DEFAULT_SKETCH_SIZE,
+                              help='Number of products monitored by each sketch of the approximate mode')
+
+    def mapper_init(self):
+        """
+        This initializer prepares the in-mapper quantity sums, or the sketches of the approximate mode
+        """
+        self.quantity_sums = InMapperCombiner(self.options.combiner_max_keys, self.options.combiner_max_mb)
+        self.product_sketches = HeavyHitterSketches(self.options.sketch_size)
+
     def mapper_product_value(self, _, line):
         """
-        This mapper yields each product (second column), and the quantity (forth column)
+        This mapper reads each product (second column) and the quantity (forth column)
+        and sums the quantity by product in the period of the invoice date (fifth column) until the sums are spilled
         :param _: None
         :param line: one line from the input file
-        :return: product, quantity
+        :return: (period, product), quantity; period is None if the rows are not partitioned
         """
 
         # For input file type CSV, skip first line and split other lines by commas
@@ -83,45 +286,168 @@ class BestSellingProductByQuantity(MRJob):
             # Columns: Invoice,StockCode,Description,Quantity,InvoiceDate,Price,Customer ID,Country
             product = attributes[1]
             quantity = float(attributes[3])
+            period = invoice_period(attributes[4], self.options.period)
 
-            yield product, quantity
+            if self.options.approximate:
+                self.product_sketches.add(period, product, quantity)
+            else:
+                self.quantity_sums.add((period, product), quantity)
 
-    def combiner_sum_quantity(self, product, quantity):
+        for product_quantity in self.quantity_sums.spill_if_full():
+            yield product_quantity
+
+    def mapper_raw_product_value(self, input_path, _):
+        """
+        This mapper parses the whole input file in blocks
+        and sums the quantity by period and product within each block before adding it to the in-mapper sums,
+        or to the sketches of the approximate mode without the negative quantities
+        :param input_path: local path of the input file
+        :param _: URI of the input file
+        :return: (period, product), quantity; period is None if the rows are not partitioned
         """
-        This combiner sums the quantities by key (product)
-        :param product (stockCode)
+        for rows, block in read_blocks(input_path, [STOCK_CODE, INVOICE_DATE], [QUANTITY], self.options.block_mb):
+            periods = block_periods(block[INVOICE_DATE], self.options.period)
+            if self.options.approximate:
+                # The negative quantities are left out row by row before summing, as in the line mapper
+                product_sums, skipped = sum_non_negative_by_period_and_key(periods, block[STOCK_CODE], block[QUANTITY])
+                self.product_sketches.add_totals(product_sums, rows - skipped, skipped)
+            else:
+                self.quantity_sums.add_totals(sum_by_period_and_key(periods, block[STOCK_CODE], block[QUANTITY]), rows)
+
+            for product_quantity in self.quantity_sums.spill_if_full():
+                yield product_quantity
+
+    def mapper_final(self):
+        """
+        This finalizer emits the quantity sums left in the mapper, or the sketch of each period in the approximate mode,
+        and reports how much the summing in the mapper cut the shuffle
+        :return: (period, product), quantity or period, sketch state
+        """
+        for product_quantity in self.quantity_sums.spill():
+            yield product_quantity
+        for period_sketch in self.product_sketches.spill():
+            yield period_sketch
+
+        if self.options.approximate:
+            self.increment_counter('space_saving', 'records_in', self.product_sketches.records_in)
+            self.increment_counter('space_saving', 'records_skipped', self.product_sketches.records_skipped)
+            self.increment_counter('space_saving', 'evictions', self.product_sketches.evictions)
+        else:
+            self.increment_counter('in_mapper_combiner', 'records_in', self.quantity_sums.records_in)
+            self.increment_counter('in_mapper_combiner', 'records_out', self.quantity_sums.records_out)
+            self.increment_counter('in_mapper_combiner', 'spills', self.quantity_sums.spills)
+
+    def combiner_sum_quantity(self, period_product, quantity):
+        """
+        This combiner sums the quantities by key (period, product)
+        :param period_product: (period, stockCode)
         :param quantity
-        :return: product, sum of quantities
+        :return: (period, product), sum of quantities
         """
-        yield product, sum(quantity)
+        yield period_product, sum(quantity)
 
-    def reducer_sum_quantity(self, product, quantity):
+    def reducer_init_top_products(self):
+        """
+        This initializer prepares the bounded heaps of the best selling products of each period seen by this reducer
         """
-        This reducer sends all total quantities, product pairs to the next step
-        :param product
+        self.top_products_by_period = {}
+
+    def reducer_sum_quantity(self, period_product, quantity):
+        """
+        This reducer sums the quantity of each product and keeps only the best selling product of each period it sees
+        :param period_product: (period, product)
         :param quantity: the total quantity of the key from the result of the combiner
-        :return: (None, (sum(quantity), product))
+        :return: None
+        """
+        period, product = period_product
+        if period not in self.top_products_by_period:
+            self.top_products_by_period[period] = TopK(TOP_PRODUCTS)
+        self.top_products_by_period[period].push(sum(quantity), product)
+
+    def reducer_final_top_products(self):
+        """
+        This finalizer sends the best total quantity, product pair of each period seen by this reducer to the next step
+        :return: (period, (quantity, product)) once per period
+        """
+        for period, top_products in self.top_products_by_period.items():
+            for quantity, product in top_products.pairs():
+                yield period, (quantity, product)
+
+    def combiner_find_best_selling_product_by_quantity(self, period, quantity_product_pairs):
+        """
+        This combiner keeps the best selling product of a period among the pairs it receives
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param quantity_product_pairs: each item of quantity_product_pairs is (quantity, product)
+        :return: (period, (quantity, product)) once
         """
-        yield None, (sum(quantity), product)
+        for pair in top_k(quantity_product_pairs, TOP_PRODUCTS):
+            yield period, pair
 
-    def reducer_find_best_selling_product_by_quantity(self, _, quantity_product_pairs):
+    def reducer_find_best_selling_product_by_quantity(self, period, quantity_product_pairs):
         """
-        This reducer gets the best selling product in terms of revenue
-        :param _: discard the key; it is just None
+        This reducer gets the best selling product in terms of quantity for each period
+        :param period: period of the invoice dates, None if the rows are not partitioned
         :param quantity_product_pairs: each item of quantity_product_pairs is (quantity, product)
-        :return: (key=quantity, value=product) once
+        :return: (key=quantity, value=product) once, or (period, (quantity, product)) once per period
+        """
+
+        # Keep only the highest quantity instead of sorting them all
+        for pair in top_k(quantity_product_pairs, TOP_PRODUCTS):
+            if period is None:
+                yield pair
+            else:
+                yield period, pair
+
+    def combiner_merge_sketches(self, period, sketch_states):
+        """
+        This combiner merges the sketches of a period into a single one
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param sketch_states: states of the Space-Saving sketches of the mappers
+        :return: period, state of the merged sketch
+        """
+        yield period, SpaceSaving.merge(sketch_states, self.options.sketch_size).state()
+
+    def reducer_find_best_selling_product_from_sketches(self, period, sketch_states):
+        """
+        This reducer merges the sketches of a period, gets its approximate best selling product by quantity
+        and reports how many results are certainly right and the maximum overestimation of each period
+        :param period: period of the invoice dates, None if the rows are not partitioned
+        :param sketch_states: states of the Space-Saving sketches of the combiners
+        :return: (key=quantity, value=product) once, or (period, (quantity, product)) once per period
         """
+        pairs, guaranteed, max_error = SpaceSaving.merge(sketch_states, self.options.sketch_size).top(TOP_PRODUCTS)
+        self.increment_counter('space_saving', 'results', len(pairs))
+        self.increment_counter('space_saving', 'guaranteed_results', guaranteed)
+        self.increment_counter('space_saving_max_error', period or ALL, int(math.ceil(max_error)))
 
-        # Sort by value of the quantity
-        sorted_quantity_product_pairs = sorted(quantity_product_pairs, key=lambda x: x[0], reverse=True)
-        yield sorted_quantity_product_pairs[0]
+        for pair in pairs:
+            if period is None:
+                yield pair
+            else:
+                yield period, pair
 
     def steps(self):
+        block_ingestion = self.options.ingestion == 'block'
+        if self.options.approximate:
+            return [
+                MRStep(mapper_init=self.mapper_init,
+                       mapper_raw=self.mapper_raw_product_value if block_ingestion else None,
+                       mapper=None if block_ingestion else self.mapper_product_value,
+                       mapper_final=self.mapper_final,
+                       combiner=self.combiner_merge_sketches,
+                       reducer=self.reducer_find_best_selling_product_from_sketches)
+            ]
         return [
-            MRStep(mapper=self.mapper_product_value,
+            MRStep(mapper_init=self.mapper_init,
+                   mapper_raw=self.mapper_raw_product_value if block_ingestion else None,
+                   mapper=None if block_ingestion else self.mapper_product_value,
+                   mapper_final=self.mapper_final,
                    combiner=self.combiner_sum_quantity,
-                   reducer=self.reducer_sum_quantity),
-            MRStep(reducer=self.reducer_find_best_selling_product_by_quantity)
+                   reducer_init=self.reducer_init_top_products,
+                   reducer=self.reducer_sum_quantity,
+                   reducer_final=self.reducer_final_top_products),
+            MRStep(combiner=self.combiner_find_best_selling_product_by_quantity,
+                   reducer=self.reducer_find_best_selling_product_by_quantity)
         ]
 
 
@@ -0,0 +1,55 @@
+"""
+Checks that the approximate mode of the task 4 jobs gives the same result with the block and the line ingestion.
+Run with: python -m pytest test_retail_task4.py
+"""
+
+import pytest
+
+from retail_task4 import BestSellingProductByQuantity, BestSellingProductByRevenue
+
+HEADER = 'Invoice,StockCode,Description,Quantity,InvoiceDate,Price,Customer ID,Country\n'
+
+# P1 sells the most if its return is left out, P2 if it is netted with the sale
+ROWS = [
+    '489434,P1,"BOX, RED",10,2009-12-01 07:45:00,2.0,13085.0,United Kingdom',
+    '489435,P2,MUG,7,2009-12-01 07:46:00,2.0,13085.0,United Kingdom',
+    'C489436,P1,"BOX, RED",-5,2009-12-01 07:47:00,2.0,13085.0,United Kingdom',
+    '489437,P3,PEN,3,2010-01-04 09:00:00,1.5,13086.0,France',
+    '489438,P2,MUG,2,2010-01-05 10:00:00,2.0,13086.0,France',
+    'C489439,P3,PEN,-1,2010-01-05 11:00:00,1.5,13086.0,France',
+    '489440,P4,LAMP,2,2010-01-06 12:00:00,1.0,13087.0,Spain',
+]
+
+
+def run_job(job_class, args):
+    """
+    :param job_class: job of task 4
+    :param args: command line arguments of the job
+    :return: (list of the output (key, value) pairs, dict of the space_saving counters)
+    """
+    job = job_class(['-r', 'inline', '--no-conf'] + args)
+    with job.make_runner() as runner:
+        runner.run()
+        output = list(job.parse_output(runner.cat_output()))
+        counters = {}
+        for step_counters in runner.counters():
+            counters.update(step_counters.get('space_saving', {}))
+    return output, counters
+
+
+@pytest.mark.parametrize('job_class', [BestSellingProductByRevenue, BestSellingProductByQuantity])
+@pytest.mark.parametrize('period', ['all', 'month'])
+def test_approximate_ingestions_agree(tmp_path, job_class, period):
+    input_file = tmp_path / 'retail.csv'
+    input_file.write_text(HEADER + '\n'.join(ROWS) + '\n')
+
+    args = ['--approximate', '--period', period, str(input_file)]
+    block_output, block_counters = run_job(job_class, ['--ingestion', 'block'] + args)
+    line_output, line_counters = run_job(job_class, ['--ingestion', 'line'] + args)
+
+    assert block_output == line_output
+    assert block_counters == line_counters
+    assert block_counters['records_in'] == len(ROWS) - 2
+    assert block_counters['records_skipped'] == 2
+    if period == 'all':
+        assert block_output[0][1] == 'P1'
@@ -0,0 +1,199 @@
+"""
+Use this script to add an inverted index to a TF-IDF index written by tfidf_index.py and to find the most similar
+papers from it without scoring every paper. For each term, the postings are the rows of the papers containing it and
+their weights, and the highest weight of the term is kept apart:
+- postings.data.npy, postings.rows.npy, postings.indptr.npy: the postings of each term, as the arrays of a CSC matrix
+- max_weight.npy: highest weight of each term
+A query is evaluated term at a time with max-score pruning. The query terms are read by decreasing upper bound of their
+contribution (query weight * highest weight of the term). Once the contributions of the terms left cannot lift a paper
+which was not seen yet above a running lower bound of the k-th best score, no new candidate is added; the terms left
+are only looked up for the candidates, and the candidates which cannot reach that bound anymore are dropped. The bound
+is the highest k-th partial score of the papers of the postings of a term met so far, and the partial scores are
+accumulated in arrays allocated once per index, so a query reads only the postings and the papers in them. The result
+is the exact top k. Example:
+python inverted_index.py build --index arxiv_index
+python inverted_index.py query --index arxiv_index --paper-id 1802.00209v1 --top-papers 5
+"""
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+from tfidf_index import DEFAULT_INDEX, DEFAULT_TOP_PAPERS, DECIMALS, TfidfIndex
+
+
+def build_inverted_index(index_path=DEFAULT_INDEX):
+    """
+    Writes the postings of the terms of a TF-IDF index next to it
+    :param index_path: folder of the index written by tfidf_index.py
+    :return: (number of terms, number of postings)
+    """
+    postings = TfidfIndex(index_path).matrix.tocsc()
+    postings.sort_indices()
+    np.save(os.path.join(index_path, 'postings.data.npy'), postings.data)
+    np.save(os.path.join(index_path, 'postings.rows.npy'), postings.indices)
+    np.save(os.path.join(index_path, 'postings.indptr.npy'), postings.indptr)
+    np.save(os.path.join(index_path, 'max_weight.npy'), postings.max(axis=0).toarray().ravel())
+    return postings.shape[1], postings.nnz
+
+
+def kth_highest(scores, k):
+    """
+    :param scores: array of scores
+    :param k: rank
+    :return: k-th highest score, -inf if there are fewer than k scores
+    """
+    if len(scores) < k:
+        return -np.inf
+    return np.partition(scores, len(scores) - k)[len(scores) - k]
+
+
+class InvertedIndex(TfidfIndex):
+    """
+    TF-IDF index with the postings written by build_inverted_index(). postings_read postings were added to scores and
+    candidates_scored papers were kept as candidates by all the searches.
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        super(InvertedIndex, self).__init__(index_path)
+
+        def load(name):
+            return np.load(os.path.join(index_path, name), mmap_mode='r')
+
+        self.postings_data = load('postings.data.npy')
+        self.postings_rows = load('postings.rows.npy')
+        self.postings_indptr = load('postings.indptr.npy')
+        self.max_weight = load('max_weight.npy')
+        self.postings_read = 0
+        self.candidates_scored = 0
+        self._scores = None
+        self._seen = None
+
+    def postings(self, term):
+        """
+        :param term: column of the term
+        :return: (sorted array of the rows of the papers containing the term, array of their weights)
+        """
+        start, end = self.postings_indptr[term], self.postings_indptr[term + 1]
+        return self.postings_rows[start:end], self.postings_data[start:end]
+
+    def search(self, vector, n=DEFAULT_TOP_PAPERS, exclude=None):
+        """
+        :param vector: 1 x number of terms CSR matrix of an L2-normalised TF-IDF vector
+        :param n: number of papers in the result
+        :param exclude: id of a paper left out of the result, e.g. the paper of the vector
+        :return: list of at most n (cosine_similarity, paper_id), highest first, the same as most_similar() without
+                 the papers with a similarity of 0, which share no term with the vector
+        """
+        excluded_row = self.row(exclude) if exclude is not None else None
+        terms, query_weights = vector.indices, vector.data
+
+        # Terms with the highest possible contribution first
+        bounds = query_weights * self.max_weight[terms]
+        order = np.argsort(-bounds, kind='stable')
+        rest = float(bounds.sum())
+
+        # The partial scores are accumulated in arrays of all the papers allocated once, only the papers seen are read
+        # and reset after the search
+        if self._scores is None:
+            self._scores = np.zeros(len(self.paper_ids))
+            self._seen = np.zeros(len(self.paper_ids), dtype=bool)
+        scores, seen = self._scores, self._seen
+        if excluded_row is not None:
+            # The excluded paper never gets above the k-th best score nor becomes a candidate
+            scores[excluded_row] = -np.inf
+            seen[excluded_row] = True
+        seen_rows = []
+
+        # The partial scores only grow, so the k-th highest partial score of any papers is at most the k-th best final
+        # score. The threshold of the pruning is the highest of those met so far, each taken from the papers of the
+        # postings of a term, so it is kept up to date without reading all the papers seen.
+        threshold = -np.inf
+
+        candidate_rows = None
+        try:
+            for term, query_weight, bound in zip(terms[order], query_weights[order], bounds[order]):
+                # The rounding errors of the subtractions must not make the bound negative
+                rest = max(rest - bound, 0.0)
+                rows, weights = self.postings(term)
+                if not len(rows):
+                    continue
+
+                if candidate_rows is None:
+                    # Every paper of the postings is a candidate
+                    self.postings_read += len(rows)
+                    scores[rows] += query_weight * weights
+                    new_rows = rows[~seen[rows]]
+                    seen[new_rows] = True
+                    seen_rows.append(new_rows)
+
+                    threshold = max(threshold, kth_highest(scores[rows], n))
+
+                    # A paper which was not seen yet scores at most the contributions of the terms left
+                    if rest < threshold:
+                        candidate_rows = np.sort(np.concatenate(seen_rows))
+                else:
+                    # Only the candidates are looked up in the postings of the term
+                    self.postings_read += len(candidate_rows)
+                    positions = np.minimum(np.searchsorted(rows, candidate_rows), len(rows) - 1)
+                    found = rows[positions] == candidate_rows
+                    found_rows = candidate_rows[found]
+                    scores[found_rows] += query_weight * weights[positions[found]]
+                    threshold = max(threshold, kth_highest(scores[found_rows], n))
+
+                    # The candidates which cannot reach the k-th best score anymore are dropped
+                    candidate_rows = candidate_rows[scores[candidate_rows] + rest >= threshold]
+
+            if candidate_rows is None:
+                candidate_rows = np.sort(np.concatenate(seen_rows)) if seen_rows else np.zeros(0, dtype=np.int64)
+            candidate_scores = scores[candidate_rows]
+        finally:
+            for rows in seen_rows:
+                scores[rows] = 0.0
+                seen[rows] = False
+            if excluded_row is not None:
+                scores[excluded_row] = 0.0
+                seen[excluded_row] = False
+        self.candidates_scored += len(candidate_rows)
+
+        # Select the n highest scores without sorting them all, then sort only those
+        best = np.arange(len(candidate_rows))
+        if len(best) > n:
+            best = np.argpartition(-candidate_scores, n - 1)[:n]
+        best = best[np.argsort(-candidate_scores[best], kind='stable')]
+        return [(round(float(candidate_scores[position]), DECIMALS), self.paper_ids[candidate_rows[position]])
+                for position in best.tolist()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query the inverted index of a TF-IDF index')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='write the postings of the terms next to the TF-IDF index')
+    build_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+
+    query_parser = subparsers.add_parser('query', help='print the papers most similar to a paper')
+    query_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    query_group = query_parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument('--paper-id', help='id of a paper of the index, e.g. printed by random_paper_selector.py')
+    query_group.add_argument('--summary', help='summary of any paper')
+    query_parser.add_argument('--top-papers', type=int, default=DEFAULT_TOP_PAPERS)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print('Postings of {} terms ({} postings) written to the index {}'.format(*build_inverted_index(args.index),
+                                                                                 args.index))
+    else:
+        index = InvertedIndex(args.index)
+        if args.paper_id is not None:
+            if index.row(args.paper_id) is None:
+                parser.error('paper {} is not in the index'.format(args.paper_id))
+            query_vector = index.paper_vector(args.paper_id)
+        else:
+            query_vector = index.summary_vector(args.summary)
+
+        for similarity, paper_id in index.search(query_vector, args.top_papers, args.paper_id):
+            print(json.dumps(similarity) + '\t' + json.dumps(paper_id))
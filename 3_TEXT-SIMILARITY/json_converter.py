@@ -1,20 +1,11 @@
-import json
+from paper_lines import INPUT_FILE, LINES_FILE, ids_path, offsets_path, write_lines
 
 """
-Use this script to convert a pretty printed multiline JSON array file to one having an entry per line
+Use this script to convert a pretty printed multiline JSON array file to one having an entry per line.
+The array is read one entry at a time, and the byte offset and the id of each line are written next to the output
+file, so that random_paper_selector.py can read a paper without parsing the whole file.
 """
 
-INPUT_FILE = 'arxivData.json'
-OUTPUT_FILE = 'arxivData_lines.json'
-
-with open(INPUT_FILE) as f:
-    data = json.load(f)
-
-    f.close()
-
-    with open(OUTPUT_FILE, 'w') as json_file:
-        for entry in data:
-            json.dump(entry, json_file)
-            json_file.write('\n')
-
-        json_file.close()
+papers = write_lines(INPUT_FILE, LINES_FILE)
+print('{} papers written to {}, offsets to {} and ids to {}'.format(papers, LINES_FILE, offsets_path(LINES_FILE),
+                                                                   ids_path(LINES_FILE)))
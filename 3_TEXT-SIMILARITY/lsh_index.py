@@ -0,0 +1,335 @@
+"""
+Use this script to add an approximate nearest neighbour index (locality-sensitive hashing) to a TF-IDF index written by
+tfidf_index.py. The signature of a paper is the sign of its TF-IDF vector projected on bands * rows random hyperplanes
+(SimHash); two papers get the same bit with probability 1 - angle / pi. The bits are grouped in bands of rows bits and
+the papers with the same key in at least one band are the candidates of each other, so a query scores only its
+candidates instead of the whole corpus. More rows per band give fewer candidates, more bands give a higher recall.
+New papers can be inserted without building the index again; they are vectorized with the vocabulary and inverse
+document frequencies of the TF-IDF index. The index is kept next to the TF-IDF index:
+- lsh.json: the bands, rows, seed of the hyperplanes and the ids of the inserted papers
+- lsh.keys.npy: key of each band of each paper, the papers of the TF-IDF index first
+- lsh.inserted.npz: TF-IDF vectors of the inserted papers
+Example:
+python lsh_index.py build --index arxiv_index --bands 16 --rows 6
+python lsh_index.py insert new_papers.json --index arxiv_index
+python lsh_index.py query --index arxiv_index --paper-id 1802.00209v1 --top-papers 5
+python lsh_index.py evaluate --index arxiv_index --queries 200 --top-papers 10
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix, load_npz, save_npz, vstack
+
+from tfidf_index import DEFAULT_BLOCK_ROWS, DEFAULT_INDEX, DEFAULT_TOP_PAPERS, DECIMALS, TfidfIndex
+
+# Default number of bands and of bits (rows) per band of the signatures
+DEFAULT_BANDS = 16
+DEFAULT_ROWS = 6
+
+# Default seed of the random hyperplanes
+DEFAULT_SEED = 5
+
+# Default number of papers of the index used as queries to measure the recall
+DEFAULT_EVALUATION_QUERIES = 200
+
+
+def build_lsh_index(index_path=DEFAULT_INDEX, bands=DEFAULT_BANDS, rows=DEFAULT_ROWS, seed=DEFAULT_SEED):
+    """
+    Writes the signatures of all the papers of a TF-IDF index next to it, without inserted papers
+    :param index_path: folder of the index written by tfidf_index.py
+    :param bands: number of bands of the signatures
+    :param rows: number of bits of each band, at most 64
+    :param seed: seed of the random hyperplanes
+    :return: number of papers
+    """
+    with open(os.path.join(index_path, 'lsh.json'), 'w') as f:
+        json.dump({'bands': bands, 'rows': rows, 'seed': seed, 'inserted_ids': []}, f)
+    for name in ('lsh.keys.npy', 'lsh.inserted.npz'):
+        if os.path.exists(os.path.join(index_path, name)):
+            os.remove(os.path.join(index_path, name))
+
+    index = LshIndex(index_path)
+    matrix = index.matrix
+    keys = [index.band_keys(matrix[start:start + DEFAULT_BLOCK_ROWS])
+            for start in range(0, matrix.shape[0], DEFAULT_BLOCK_ROWS)]
+    index.keys = np.concatenate(keys or [np.zeros((0, bands), dtype=np.uint64)])
+    index.save()
+    return matrix.shape[0]
+
+
+class LshIndex(TfidfIndex):
+    """
+    TF-IDF index with the band keys written by build_lsh_index(). candidates_scored papers were scored by all the
+    searches.
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        super(LshIndex, self).__init__(index_path)
+        self.index_path = index_path
+        with open(os.path.join(index_path, 'lsh.json')) as f:
+            settings = json.load(f)
+        self.bands = settings['bands']
+        self.rows = settings['rows']
+        self.seed = settings['seed']
+        self.inserted_ids = settings['inserted_ids']
+
+        keys_path = os.path.join(index_path, 'lsh.keys.npy')
+        self.keys = np.load(keys_path) if os.path.exists(keys_path) else np.zeros((0, self.bands), dtype=np.uint64)
+        inserted_path = os.path.join(index_path, 'lsh.inserted.npz')
+        self.inserted_vectors = load_npz(inserted_path).tocsr() if os.path.exists(inserted_path) \
+            else csr_matrix((0, len(self.terms)))
+
+        self._hyperplanes = None
+        self._buckets = None
+        self.candidates_scored = 0
+
+        # The keys and vectors of the papers inserted since they were last stacked, stacked all at once when needed
+        self._pending_keys = []
+        self._pending_vectors = []
+        self._inserted_positions = None
+
+    def hyperplanes(self):
+        """
+        :return: number of terms x (bands * rows) array of the normal vectors of the random hyperplanes
+        """
+        if self._hyperplanes is None:
+            random_state = np.random.RandomState(self.seed)
+            self._hyperplanes = random_state.standard_normal((len(self.terms), self.bands * self.rows))
+        return self._hyperplanes
+
+    def band_keys(self, vectors):
+        """
+        :param vectors: number of papers x number of terms CSR matrix of TF-IDF vectors
+        :return: number of papers x bands array of the keys of the bands of their signatures
+        """
+        bits = np.asarray(vectors.dot(self.hyperplanes())) > 0
+        bits = bits.reshape(vectors.shape[0], self.bands, self.rows).astype(np.uint64)
+        return (bits << np.arange(self.rows, dtype=np.uint64)).sum(axis=2, dtype=np.uint64)
+
+    def buckets(self):
+        """
+        :return: list of the dict of key -> list of paper rows of each band
+        """
+        if self._buckets is None:
+            self.stack_inserted()
+            self._buckets = [{} for _ in range(self.bands)]
+            for band, band_buckets in enumerate(self._buckets):
+                band_keys = self.keys[:, band]
+                order = np.argsort(band_keys, kind='stable')
+                unique_keys, starts = np.unique(band_keys[order], return_index=True)
+                for key, rows in zip(unique_keys.tolist(), np.split(order, starts[1:])):
+                    band_buckets[key] = rows.tolist()
+        return self._buckets
+
+    def paper_id(self, row):
+        """
+        :param row: row of a paper of the TF-IDF index or of an inserted paper, after them
+        :return: its id
+        """
+        if row < len(self.paper_ids):
+            return self.paper_ids[row]
+        return self.inserted_ids[row - len(self.paper_ids)]
+
+    def any_paper_vector(self, paper_id):
+        """
+        :param paper_id: id of a paper of the TF-IDF index or of an inserted paper
+        :return: its 1 x number of terms CSR matrix TF-IDF vector, None if there is no such paper
+        """
+        if self.row(paper_id) is not None:
+            return self.paper_vector(paper_id)
+        position = self.inserted_position(paper_id)
+        if position is None:
+            return None
+        self.stack_inserted()
+        return self.inserted_vectors[position]
+
+    def inserted_position(self, paper_id):
+        """
+        :param paper_id: id of a paper
+        :return: position of the paper among the inserted papers, None if it was not inserted
+        """
+        if self._inserted_positions is None:
+            self._inserted_positions = {inserted_id: position for position, inserted_id in enumerate(self.inserted_ids)}
+        return self._inserted_positions.get(paper_id)
+
+    def insert(self, paper_id, summary):
+        """
+        Adds a new paper to the LSH index, save() writes it. A paper already in the TF-IDF index or inserted is left
+        out, so that the searches never return a paper twice.
+        :param paper_id: id of the paper
+        :param summary: summary of the paper
+        :return: True if the paper was inserted, False if its id is already in the index
+        """
+        if self.row(paper_id) is not None or self.inserted_position(paper_id) is not None:
+            return False
+
+        vector = self.summary_vector(summary)
+        keys = self.band_keys(vector)
+        row = len(self.paper_ids) + len(self.inserted_ids)
+        self._pending_keys.append(keys)
+        self._pending_vectors.append(vector)
+        self._inserted_positions[paper_id] = len(self.inserted_ids)
+        self.inserted_ids.append(paper_id)
+        if self._buckets is not None:
+            for band_buckets, key in zip(self._buckets, keys[0].tolist()):
+                band_buckets.setdefault(key, []).append(row)
+        return True
+
+    def stack_inserted(self):
+        """
+        Appends the keys and the vectors of the papers inserted since the last call to the arrays of the index,
+        all at once, so that inserting many papers does not copy the arrays for each of them
+        """
+        if self._pending_keys:
+            self.keys = np.vstack([self.keys] + self._pending_keys)
+            self.inserted_vectors = vstack([self.inserted_vectors] + self._pending_vectors, format='csr')
+            self._pending_keys = []
+            self._pending_vectors = []
+
+    def save(self):
+        """
+        Writes the keys, the inserted papers and the settings
+        """
+        self.stack_inserted()
+        np.save(os.path.join(self.index_path, 'lsh.keys.npy'), self.keys)
+        save_npz(os.path.join(self.index_path, 'lsh.inserted.npz'), self.inserted_vectors)
+        with open(os.path.join(self.index_path, 'lsh.json'), 'w') as f:
+            json.dump({'bands': self.bands, 'rows': self.rows, 'seed': self.seed,
+                       'inserted_ids': self.inserted_ids}, f)
+
+    def candidates(self, vector):
+        """
+        :param vector: 1 x number of terms CSR matrix of a TF-IDF vector
+        :return: sorted array of the rows of the papers with the same key as the vector in at least one band
+        """
+        buckets = self.buckets()
+        rows = [band_buckets.get(key, []) for band_buckets, key in zip(buckets, self.band_keys(vector)[0].tolist())]
+        return np.unique(np.concatenate([np.array(band_rows, dtype=np.int64) for band_rows in rows]))
+
+    def search(self, vector, n=DEFAULT_TOP_PAPERS, exclude=None):
+        """
+        :param vector: 1 x number of terms CSR matrix of an L2-normalised TF-IDF vector
+        :param n: number of papers in the result
+        :param exclude: id of a paper left out of the result, e.g. the paper of the vector
+        :return: list of at most n (cosine_similarity, paper_id) among the candidates of the vector, highest first
+        """
+        rows = self.candidates(vector)
+        self.stack_inserted()
+        rows = rows[[self.paper_id(row) != exclude for row in rows.tolist()]] if exclude is not None else rows
+        self.candidates_scored += len(rows)
+
+        # The candidates are scored exactly
+        indexed = rows[rows < len(self.paper_ids)]
+        inserted = rows[rows >= len(self.paper_ids)] - len(self.paper_ids)
+        candidate_vectors = vstack([self.matrix[indexed], self.inserted_vectors[inserted]], format='csr')
+        scores = np.asarray(candidate_vectors.dot(vector.T).todense()).ravel()
+
+        # Select the n highest scores without sorting them all, then sort only those
+        best = np.arange(len(rows))
+        if len(best) > n:
+            best = np.argpartition(-scores, n - 1)[:n]
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(round(float(scores[position]), DECIMALS), self.paper_id(rows[position])) for position in best.tolist()]
+
+    def evaluate(self, queries=DEFAULT_EVALUATION_QUERIES, n=DEFAULT_TOP_PAPERS, seed=DEFAULT_SEED):
+        """
+        Measures the recall of the LSH search against the exact search on random papers of the TF-IDF index
+        :param queries: number of query papers
+        :param n: number of papers in the result of each query
+        :param seed: seed of the choice of the query papers
+        :return: dict with the mean recall, the mean fraction of the papers scored and the mean time of both searches
+        """
+        query_ids = [self.paper_ids[row] for row in np.random.RandomState(seed).choice(
+            len(self.paper_ids), min(queries, len(self.paper_ids)), replace=False).tolist()]
+        recall = 0.0
+        exact_time = lsh_time = 0.0
+        candidates_scored = self.candidates_scored
+        for query_id in query_ids:
+            vector = self.paper_vector(query_id)
+            start = time.perf_counter()
+            exact = self.most_similar(vector, n, query_id)
+            exact_time += time.perf_counter() - start
+            start = time.perf_counter()
+            approximate = self.search(vector, n, query_id)
+            lsh_time += time.perf_counter() - start
+
+            # Papers with the same similarity as the last exact one are as good as it, inserted papers are not counted
+            threshold = exact[-1][0] if exact else 0.0
+            found = sum(1 for similarity, paper_id in approximate
+                        if similarity >= threshold and self.row(paper_id) is not None)
+            recall += min(found, len(exact)) / len(exact) if exact else 1.0
+
+        total_papers = len(self.paper_ids) + len(self.inserted_ids)
+        return {'queries': len(query_ids),
+                'recall': recall / len(query_ids),
+                'scored_fraction': (self.candidates_scored - candidates_scored) / len(query_ids) / total_papers,
+                'exact_ms': exact_time / len(query_ids) * 1000,
+                'lsh_ms': lsh_time / len(query_ids) * 1000}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build, update and query the LSH index of a TF-IDF index')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='write the signatures of the papers of the TF-IDF index')
+    build_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    build_parser.add_argument('--bands', type=int, default=DEFAULT_BANDS)
+    build_parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='number of bits of each band')
+    build_parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+
+    insert_parser = subparsers.add_parser('insert', help='add the papers of a file to the LSH index')
+    insert_parser.add_argument('input_file', help='file with a JSON record of a paper per line')
+    insert_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+
+    query_parser = subparsers.add_parser('query', help='print the approximate most similar papers to a paper')
+    query_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    query_group = query_parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument('--paper-id', help='id of a paper of the index, e.g. printed by random_paper_selector.py, '
+                                                'or of an inserted paper')
+    query_group.add_argument('--summary', help='summary of any paper')
+    query_parser.add_argument('--top-papers', type=int, default=DEFAULT_TOP_PAPERS)
+
+    evaluate_parser = subparsers.add_parser('evaluate', help='measure the recall against the exact search')
+    evaluate_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    evaluate_parser.add_argument('--queries', type=int, default=DEFAULT_EVALUATION_QUERIES)
+    evaluate_parser.add_argument('--top-papers', type=int, default=DEFAULT_TOP_PAPERS)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        print('Signatures of {} papers written to the index {}'.format(
+            build_lsh_index(args.index, args.bands, args.rows, args.seed), args.index))
+    elif args.command == 'insert':
+        index = LshIndex(args.index)
+        inserted = skipped = 0
+        with open(args.input_file) as f:
+            for line in f:
+                if line.strip():
+                    paper = json.loads(line)
+                    if index.insert(paper["id"], paper["summary"]):
+                        inserted += 1
+                    else:
+                        skipped += 1
+        index.save()
+        print('{} papers inserted into the index {}, {} already in it'.format(inserted, args.index, skipped))
+    elif args.command == 'query':
+        index = LshIndex(args.index)
+        if args.paper_id is not None:
+            query_vector = index.any_paper_vector(args.paper_id)
+            if query_vector is None:
+                parser.error('paper {} is neither in the TF-IDF index nor inserted'.format(args.paper_id))
+        else:
+            query_vector = index.summary_vector(args.summary)
+
+        for similarity, paper_id in index.search(query_vector, args.top_papers, args.paper_id):
+            print(json.dumps(similarity) + '\t' + json.dumps(paper_id))
+    else:
+        report = LshIndex(args.index).evaluate(args.queries, args.top_papers)
+        print('Recall@{}: {:.3f} over {} queries, {:.1%} of the papers scored per query, '
+              '{:.1f} ms per LSH query, {:.1f} ms per exact query'.format(
+                  args.top_papers, report['recall'], report['queries'], report['scored_fraction'],
+                  report['lsh_ms'], report['exact_ms']))
@@ -0,0 +1,212 @@
+"""
+Streaming conversion of the pretty printed JSON array of papers to a file with a JSON record per line, and random
+access to the records of that file. The array is decoded one entry at a time from chunks of the input file, so the
+memory does not grow with the number of papers. Next to the file with a record per line, the conversion writes:
+- <lines file without extension>.offsets: the byte offset of the start of each line and the size of the file,
+  as little-endian 64 bit integers
+- <lines file without extension>.ids: the JSON id of the paper of each line, in the same order
+A record is then read by seeking to its offset, without parsing the lines before it.
+"""
+
+import json
+import os
+import struct
+
+import numpy as np
+
+INPUT_FILE = 'arxivData.json'
+LINES_FILE = 'arxivData_lines.json'
+
+# Number of characters read from the input file at once
+CHUNK_SIZE = 1 << 20
+
+# Format of an offset in the offsets file
+OFFSET_FORMAT = '<q'
+
+_whitespace = ' \t\n\r'
+
+
+def iter_json_array(f, chunk_size=CHUNK_SIZE):
+    """
+    :param f: text file object of a JSON array
+    :param chunk_size: number of characters read at once
+    :return: generator of the decoded entries of the array, in order
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    end_of_file = False
+
+    # 'start' before the opening bracket, 'first' before the first entry, 'entry' after a comma, 'separator' after an entry
+    state = 'start'
+    while True:
+        while position < len(buffer) and buffer[position] in _whitespace:
+            position += 1
+
+        need_more = position == len(buffer)
+        if not need_more:
+            character = buffer[position]
+            if state == 'start':
+                if character != '[':
+                    raise ValueError('the input is not a JSON array')
+                position += 1
+                state = 'first'
+            elif state == 'separator' or (state == 'first' and character == ']'):
+                if character == ']':
+                    return
+                if character != ',':
+                    raise ValueError('expected , or ] between the entries of the JSON array')
+                position += 1
+                state = 'entry'
+            else:
+                try:
+                    entry, end = decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError:
+                    if end_of_file:
+                        raise
+                    need_more = True
+                else:
+                    # An entry is complete once the next character is read, e.g. a number may go on in the next chunk
+                    after = end
+                    while after < len(buffer) and buffer[after] in _whitespace:
+                        after += 1
+                    need_more = not end_of_file and (after == len(buffer) or buffer[after] not in ',]')
+                    if not need_more:
+                        yield entry
+                        position = end
+                        state = 'separator'
+
+        if need_more:
+            if end_of_file:
+                raise ValueError('unexpected end of the JSON array')
+            chunk = f.read(chunk_size)
+            end_of_file = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+def offsets_path(lines_file=LINES_FILE):
+    """
+    :param lines_file: file with a JSON record of a paper per line
+    :return: path of its offsets file
+    """
+    return os.path.splitext(lines_file)[0] + '.offsets'
+
+
+def ids_path(lines_file=LINES_FILE):
+    """
+    :param lines_file: file with a JSON record of a paper per line
+    :return: path of its ids file
+    """
+    return os.path.splitext(lines_file)[0] + '.ids'
+
+
+def write_lines(input_file=INPUT_FILE, lines_file=LINES_FILE):
+    """
+    Writes the entries of a JSON array file with an entry per line, and the offsets and ids files of the lines
+    :param input_file: pretty printed JSON array file of the papers
+    :param lines_file: output file
+    :return: number of papers
+    """
+    papers = 0
+    offset = 0
+    with open(input_file) as f, open(lines_file, 'wb') as lines, open(offsets_path(lines_file), 'wb') as offsets, \
+            open(ids_path(lines_file), 'w') as ids:
+        for entry in iter_json_array(f):
+            line = (json.dumps(entry) + '\n').encode('utf-8')
+            lines.write(line)
+            offsets.write(struct.pack(OFFSET_FORMAT, offset))
+            ids.write(json.dumps(entry.get('id') if isinstance(entry, dict) else None) + '\n')
+            offset += len(line)
+            papers += 1
+        offsets.write(struct.pack(OFFSET_FORMAT, offset))
+    return papers
+
+
+class PaperLines:
+    """
+    Random access to the records of a file with a JSON record of a paper per line, through its offsets file
+    """
+
+    def __init__(self, lines_file=LINES_FILE):
+        """
+        :param lines_file: file written by write_lines()
+        """
+        self.lines_file = lines_file
+        self.offsets = np.memmap(offsets_path(lines_file), dtype=np.dtype(OFFSET_FORMAT), mode='r')
+        self._rows = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, row):
+        """
+        :param row: number of the line, from 0
+        :return: the line, without the line break
+        """
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        with open(self.lines_file, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start).decode('utf-8').rstrip('\n')
+
+    def paper_at(self, row):
+        """
+        :param row: number of the line, from 0
+        :return: the decoded record of the line
+        """
+        return json.loads(self.line(row))
+
+    def row(self, paper_id):
+        """
+        :param paper_id: id of a paper
+        :return: number of its line, None if there is no such paper
+        """
+        if self._rows is None:
+            with open(ids_path(self.lines_file)) as f:
+                self._rows = {json.loads(line): row for row, line in enumerate(f)}
+        return self._rows.get(paper_id)
+
+    def paper(self, paper_id):
+        """
+        :param paper_id: id of a paper
+        :return: its decoded record, None if there is no such paper
+        """
+        row = self.row(paper_id)
+        return self.paper_at(row) if row is not None else None
+
+
+def find_papers(lines_files, paper_ids):
+    """
+    Reads a few papers from files with a JSON record of a paper per line, through their offsets files if they are up
+    to date, by scanning them otherwise; paths which are not local files, e.g. on HDFS, are skipped
+    :param lines_files: list of paths
+    :param paper_ids: ids of the papers
+    :return: dict of paper id -> decoded record of the papers found
+    """
+    missing = set(paper_ids)
+    papers = {}
+    for lines_file in lines_files:
+        if not missing:
+            break
+        if not os.path.isfile(lines_file):
+            continue
+
+        if os.path.isfile(offsets_path(lines_file)) and os.path.isfile(ids_path(lines_file)):
+            lines = PaperLines(lines_file)
+            if len(lines.offsets) and lines.offsets[-1] == os.path.getsize(lines_file):
+                for paper_id in list(missing):
+                    paper = lines.paper(paper_id)
+                    if paper is not None:
+                        papers[paper_id] = paper
+                        missing.discard(paper_id)
+                continue
+
+        with open(lines_file) as f:
+            for line in f:
+                paper = json.loads(line)
+                if paper.get("id") in missing:
+                    papers[paper["id"]] = paper
+                    missing.discard(paper["id"])
+                    if not missing:
+                        break
+    return papers
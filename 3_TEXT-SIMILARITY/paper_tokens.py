@@ -0,0 +1,69 @@
+"""
+Tokenization of the paper summaries shared by the text similarity scripts. The summaries are split into sentences
+and words by the NLTK punkt tokenizer and lowercased, the same way the task 5 job does it. NLTK is imported on first
+use and the punkt model is downloaded only if it cannot be found locally.
+"""
+
+# Path under which nltk.data.find() locates the punkt model
+PUNKT_RESOURCE = 'tokenizers/punkt'
+
+# Description of the tokenization of summary_sentences(); the cached tokens are keyed by it, change it with the code
+TOKENIZATION = 'punkt sentences of the summary with spaces for line breaks, punkt words, lowercased'
+
+# Set once the punkt model was found or downloaded by this process
+_punkt_checked = False
+
+# Set by tokenizer_settings()
+_tokenizer_settings = None
+
+
+def ensure_punkt():
+    """
+    Downloads the NLTK punkt model only if it cannot be found locally
+    """
+    global _punkt_checked
+    if not _punkt_checked:
+        import nltk
+
+        try:
+            nltk.data.find(PUNKT_RESOURCE)
+        except LookupError:
+            nltk.download('punkt')
+        _punkt_checked = True
+
+
+def tokenizer_settings():
+    """
+    :return: string identifying the tokenization and the NLTK version, read without importing NLTK when possible
+    """
+    global _tokenizer_settings
+    if _tokenizer_settings is None:
+        try:
+            from importlib.metadata import version
+
+            nltk_version = version('nltk')
+        except ImportError:
+            import nltk
+
+            nltk_version = nltk.__version__
+        _tokenizer_settings = '{} (nltk {})'.format(TOKENIZATION, nltk_version)
+    return _tokenizer_settings
+
+
+def summary_sentences(summary):
+    """
+    :param summary: summary of a paper
+    :return: list of the sentences of the summary, each a list of its lowercased words
+    """
+    from nltk.tokenize import sent_tokenize, word_tokenize
+
+    ensure_punkt()
+    return [[word.lower() for word in word_tokenize(sentence)] for sentence in sent_tokenize(summary.replace("\n", " "))]
+
+
+def summary_tokens(summary):
+    """
+    :param summary: summary of a paper
+    :return: list of the lowercased words of all the sentences of the summary, in order
+    """
+    return [word for sentence in summary_sentences(summary) for word in sentence]
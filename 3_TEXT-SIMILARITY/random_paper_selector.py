@@ -1,24 +1,52 @@
-from datetime import datetime
+import argparse
 import json
-from random import seed, randint
+import os
+from random import randrange
+
+from paper_lines import INPUT_FILE, LINES_FILE, PaperLines, iter_json_array, offsets_path
 
 """
-Use this script to print a random paper from the input file
+Use this script to print a random paper from the input file, or the paper with a given id.
+The paper is read at its byte offset in the file written by json_converter.py. Without that file, the pretty printed
+input file is read one paper at a time and a random paper is kept by reservoir sampling.
+Example:
+python random_paper_selector.py
+python random_paper_selector.py --paper-id 1802.00209v1
 """
 
-INPUT_FILE = 'arxivData.json'
 
-# Needed to have seemingly 'true' random values
-seed(datetime.now())
+def stream_random_paper(input_file=INPUT_FILE):
+    """
+    :param input_file: pretty printed JSON array file of the papers
+    :return: a paper chosen uniformly at random, None if there are none
+    """
+    random_paper = None
+    with open(input_file) as f:
+        for count, paper in enumerate(iter_json_array(f), 1):
+            # The paper replaces the kept one with probability 1 / count
+            if randrange(count) == 0:
+                random_paper = paper
+    return random_paper
+
 
-with open(INPUT_FILE) as f:
-    papers = json.load(f)
-    length = len(papers)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print a random paper, or a paper by id')
+    parser.add_argument('--paper-id', help='id of the paper to print instead of a random one')
+    args = parser.parse_args()
 
-    f.close()
+    if os.path.exists(offsets_path(LINES_FILE)):
+        papers = PaperLines(LINES_FILE)
+        if args.paper_id is not None:
+            paper = papers.paper(args.paper_id)
+            if paper is None:
+                parser.error('paper {} is not in {}'.format(args.paper_id, LINES_FILE))
+        else:
+            paper = papers.paper_at(randrange(len(papers)))
+    elif args.paper_id is not None:
+        parser.error('run json_converter.py first to look up papers by id')
+    else:
+        paper = stream_random_paper(INPUT_FILE)
 
-    random_index = randint(0, length)
-    random_paper = papers[random_index]
-    pretty_printed_json = json.dumps(random_paper, indent=2)
+    pretty_printed_json = json.dumps(paper, indent=2)
 
     print(pretty_printed_json)
@@ -0,0 +1,178 @@
+"""
+Use this job to compute the related papers of every paper of the input file: the papers whose cosine similarity with it
+is at least a threshold, at most --top-papers of them. The TF-IDF vectors are computed with the tokenization, the
+vocabulary and the inverse document frequencies of a TF-IDF index built by tfidf_index.py on the same file.
+
+The pairs are found with prefix filtering (Bayardo et al. 2007, Vernica et al. 2010) instead of comparing all of them.
+The terms are ordered by increasing document frequency, and the prefix of a paper is the shortest list of its first
+terms such that its other terms cannot reach the threshold with any paper, their weights multiplied by the highest
+weights of the terms. Two papers above the threshold then share at least one term of both prefixes, and the first term
+they share is in both prefixes. Each paper is sent with its vector to the reducer of each of its prefix terms, which
+compares the papers it receives; a pair is scored only by the reducer of the first term the two papers share, and not
+at all if the largest weight of one paper times the sum of the weights of the other is below the threshold. The rare
+terms come first, so the prefixes mostly contain terms with short lists of papers, and the terms are spread over the
+reducers, e.g. over the cores with -r local --num-cores 8. Example:
+python tfidf_index.py build arxivData_lines.json --index arxiv_index
+python related_papers.py arxivData_lines.json --index arxiv_index --threshold 0.2 --top-papers 10
+The index folder is uploaded to the working directory of the tasks.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+from mrjob.job import MRJob
+from mrjob.step import MRStep
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from tfidf_index import DECIMALS, DEFAULT_INDEX, TfidfIndex
+from top_k import top_k
+
+# Default minimum cosine similarity of related papers
+DEFAULT_THRESHOLD = 0.2
+
+# Default maximum number of related papers of each paper
+DEFAULT_RELATED_PAPERS = 10
+
+# Name of the index folder in the working directory of the tasks
+TASK_INDEX = 'tfidf_index'
+
+
+class RelatedPapers(MRJob):
+
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['paper_tokens.py', 'tfidf_index.py', '../common/top_k.py#top_k.py']
+
+    def configure_args(self):
+        super(RelatedPapers, self).configure_args()
+        self.add_passthru_arg('--index', default=DEFAULT_INDEX,
+                              help='Folder of the TF-IDF index built by tfidf_index.py on the same papers')
+        self.add_passthru_arg('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                              help='Minimum cosine similarity of related papers, above 0')
+        self.add_passthru_arg('--top-papers', type=int, default=DEFAULT_RELATED_PAPERS,
+                              help='Maximum number of related papers of each paper')
+
+    def dirs(self):
+        # The index is shipped next to the job to the task working directories
+        return ['{}#{}'.format(self.options.index, TASK_INDEX)]
+
+    def mapper_init(self):
+        """
+        This initializer loads the TF-IDF index and ranks its terms by increasing document frequency
+        """
+        self.index = TfidfIndex(TASK_INDEX)
+        matrix = self.index.matrix
+        document_frequencies = np.bincount(matrix.indices, minlength=len(self.index.terms))
+        self.max_weight = np.zeros(len(self.index.terms))
+        np.maximum.at(self.max_weight, matrix.indices, matrix.data)
+
+        self.term_rank = np.empty(len(self.index.terms), dtype=np.int64)
+        self.term_rank[np.argsort(document_frequencies, kind='stable')] = np.arange(len(self.index.terms))
+        self.prefix_terms = 0
+
+    def mapper_prefix_terms(self, _, line):
+        """
+        This mapper computes the TF-IDF vector of the paper and yields it once for each term of its prefix
+        :param _: None
+        :param line: one line from the input file
+        :return: (term_rank, (paper_id, term_ranks, weights)) for each term of the prefix
+        """
+
+        # For input file type JSON, get the id and the summary of the paper
+        paper = json.loads(line)
+        vector = self.index.summary_vector(paper["summary"])
+
+        # The weights are rounded to the precision of the index, so the highest weights of the terms bound them
+        order = np.argsort(self.term_rank[vector.indices])
+        terms = vector.indices[order]
+        weights = vector.data[order].astype(np.float32).astype(float)
+
+        # The prefix ends where the highest similarity the other terms can add up to is below the threshold
+        bounds = np.cumsum((weights * self.max_weight[terms])[::-1])[::-1]
+        prefix_length = int(np.count_nonzero(bounds >= self.options.threshold))
+        self.prefix_terms += prefix_length
+
+        term_ranks = self.term_rank[terms].tolist()
+        for term_rank in term_ranks[:prefix_length]:
+            yield term_rank, (paper["id"], term_ranks, weights.tolist())
+
+    def mapper_final(self):
+        """
+        This finalizer reports how many times the papers were emitted
+        """
+        self.increment_counter('related_papers', 'prefix_terms', self.prefix_terms)
+
+    def reducer_compare_papers(self, term_rank, papers):
+        """
+        This reducer compares the papers which have the term in their prefix, for the pairs of papers
+        whose first common term it is
+        :param term_rank: rank of the term
+        :param papers: (paper_id, term_ranks, weights) of each paper
+        :return: (paper_id, (cosine_similarity, other_paper_id)) in both directions for each pair above the threshold
+        """
+        threshold = self.options.threshold
+        vectors = [(paper_id, dict(zip(term_ranks, weights)), max(weights), sum(weights))
+                   for paper_id, term_ranks, weights in papers]
+
+        compared = skipped = 0
+        for position, (paper_id, vector, max_weight, weight_sum) in enumerate(vectors):
+            for other_id, other_vector, other_max_weight, other_weight_sum in vectors[position + 1:]:
+                # Upper bound of the dot product, without looking at the terms
+                if paper_id == other_id or min(max_weight * other_weight_sum, other_max_weight * weight_sum) < threshold:
+                    skipped += 1
+                    continue
+
+                if len(other_vector) < len(vector):
+                    common_terms = [term for term in other_vector if term in vector]
+                else:
+                    common_terms = [term for term in vector if term in other_vector]
+
+                # The pair is scored only by the reducer of its first common term
+                if min(common_terms) != term_rank:
+                    continue
+                compared += 1
+
+                cosine_similarity = sum(vector[term] * other_vector[term] for term in common_terms)
+                if cosine_similarity >= threshold:
+                    cosine_similarity = round(cosine_similarity, DECIMALS)
+                    yield paper_id, (cosine_similarity, other_id)
+                    yield other_id, (cosine_similarity, paper_id)
+
+        self.increment_counter('related_papers', 'pairs_compared', compared)
+        self.increment_counter('related_papers', 'pairs_skipped_by_weights', skipped)
+
+    def combiner_top_related_papers(self, paper_id, similarity_paper_pairs):
+        """
+        This combiner keeps only the most similar papers of each paper among the pairs of its mapper
+        :param paper_id: id of the paper
+        :param similarity_paper_pairs: (cosine_similarity, other_paper_id)
+        :return: (paper_id, (cosine_similarity, other_paper_id)) for each kept pair
+        """
+        for pair in top_k(similarity_paper_pairs, self.options.top_papers):
+            yield paper_id, pair
+
+    def reducer_top_related_papers(self, paper_id, similarity_paper_pairs):
+        """
+        This reducer selects the most similar papers of each paper
+        :param paper_id: id of the paper
+        :param similarity_paper_pairs: (cosine_similarity, other_paper_id)
+        :return: (paper_id, list of (cosine_similarity, other_paper_id), highest first)
+        """
+        yield paper_id, top_k(similarity_paper_pairs, self.options.top_papers)
+
+    def steps(self):
+        return [
+            MRStep(mapper_init=self.mapper_init,
+                   mapper=self.mapper_prefix_terms,
+                   mapper_final=self.mapper_final,
+                   reducer=self.reducer_compare_papers),
+            MRStep(combiner=self.combiner_top_related_papers,
+                   reducer=self.reducer_top_related_papers)
+        ]
+
+
+if __name__ == '__main__':
+    RelatedPapers.run()
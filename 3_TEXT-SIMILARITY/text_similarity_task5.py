@@ -1,12 +1,29 @@
+import codecs
 import json
+import logging
 import math
+import os
+import sys
 
-import nltk
 from gensim import corpora
 from gensim import models
 from mrjob.job import MRJob
-from mrjob.step import MRStep
-from nltk.tokenize import sent_tokenize, word_tokenize
+from mrjob.step import MRStep, StepFailedException
+
+# The helper modules shared by the task folders are in the common folder
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from paper_lines import find_papers
+from token_cache import DEFAULT_CACHE, CachedTokenizer
+from top_k import top_k
+
+log = logging.getLogger(__name__)
+
+# Number of most similar papers in the result
+TOP_PAPERS = 1
+
+# Folder of the tokens cached by token_cache.py, the summaries are tokenized by NLTK without it
+TOKEN_CACHE = DEFAULT_CACHE
 
 # Change the value of this constant to the output of script random_paper_selector.py
 RANDOM_PAPER = {
@@ -24,9 +41,6 @@ RANDOM_PAPER = {
 # Global variable used to store the text to vec representation of the random paper's summary
 random_result = {}
 
-# Download relevant NLTK model if not already present
-nltk.download('punkt')
-
 
 def compute_random_paper_aspects():
     """
@@ -34,19 +48,9 @@ def compute_random_paper_aspects():
     :return: random_result: the text to vec representation of the random paper's summary
     """
 
-    random_paper_summary = RANDOM_PAPER["summary"]
-    random_paper_summary = random_paper_summary.replace("\n", " ")
-    random_data = []
-
-    # Iterate through each sentence in the random paper summary
-    for i in sent_tokenize(random_paper_summary):
-        temp = []
-
-        # Tokenize the sentence into words
-        for j in word_tokenize(i):
-            temp.append(j.lower())
+    # Tokenize each sentence of the random paper summary into lowercased words, or read them from the cache
+    random_data = CachedTokenizer(TOKEN_CACHE).sentences(RANDOM_PAPER["summary"])
 
-        random_data.append(temp)
     # Compute the dictionary of words for the random paper
     random_paper_dictionary = corpora.Dictionary(random_data)
 
@@ -84,43 +88,40 @@ def compute_random_paper_aspects():
 
 class SimilarPaperRecommendations(MRJob):
 
-    def mapper_paper_summary(self, _, line):
-        """
-        This mapper yields the paper id and the paper summary for each paper in the JSON
-        :param _: None
-        :param line: one line from the input file
-        :return: (paper_id, paper_summary)
-        """
+    # The helper modules have to be shipped next to the job to the task working directories
+    FILES = ['paper_lines.py', 'paper_tokens.py', 'token_cache.py', '../common/top_k.py#top_k.py']
 
-        # For input file type JSON, get the id and the summary of all the papers
-        paper_data = json.loads(line)
-        paper_id = paper_data["id"]
-        paper_summary = paper_data["summary"]
+    def dirs(self):
+        # The token cache, if it was built, is shipped next to the job to the task working directories
+        if os.path.isdir(TOKEN_CACHE):
+            return ['{}#{}'.format(TOKEN_CACHE, TOKEN_CACHE)]
+        return []
 
-        yield paper_id, paper_summary
+    def mapper_init(self):
+        """
+        This initializer loads the token cache once per mapper
+        """
+        self.tokenizer = CachedTokenizer(TOKEN_CACHE)
 
-    def mapper_compute_cosine_similarity(self, paper_id, paper_summary):
+    def mapper_compute_cosine_similarity(self, _, line):
         """
         This mapper computes the cosine similarity between a random paper (given)
-        and each paper in the JSON and yields the paper id, paper summary
-        :param paper_id: unique id as defined in the input data
-        :param paper_summary: corresponding paper summary
-        :return: None, (cosine_similarity, (paper_id, paper_summary))
+        and each paper in the JSON and yields only the paper id with it; the summaries
+        of the most similar papers are read from the input files once the job is done
+        :param _: None
+        :param line: one line from the input file
+        :return: None, (cosine_similarity, paper_id)
         """
 
-        global random_result
-        paper_summary = paper_summary.replace("\n", " ")
-
-        paper_data = []
-        # Iterate through each sentence in the paper summary
-        for i in sent_tokenize(paper_summary):
-            temp = []
+        # For input file type JSON, get the id and the summary of all the papers
+        paper = json.loads(line)
+        paper_id = paper["id"]
+        paper_summary = paper["summary"]
 
-            # Tokenize the sentence into words
-            for j in word_tokenize(i):
-                temp.append(j.lower())
+        global random_result
 
-            paper_data.append(temp)
+        # Tokenize each sentence of the paper summary into lowercased words, or read them from the cache
+        paper_data = self.tokenizer.sentences(paper_summary)
 
         # Compute the dictionary of words for each paper
         paper_dictionary = corpora.Dictionary(paper_data)
@@ -175,31 +176,73 @@ class SimilarPaperRecommendations(MRJob):
             else:
                 cosine_similarity = round(float(numerator) / denominator, 3)
 
-            yield None, (cosine_similarity, (paper_id, paper_summary))
+            yield None, (cosine_similarity, paper_id)
+
+    def mapper_final(self):
+        """
+        This finalizer reports how many summaries were read from the token cache
+        """
+        self.increment_counter('token_cache', 'hits', self.tokenizer.hits)
+        self.increment_counter('token_cache', 'misses', self.tokenizer.misses)
+
+    def combiner_find_highest_similarity(self, _, similarity_paper_pair):
+        """
+        This combiner keeps only the paper which is most similar to the randomly selected paper
+        among the papers of its mapper
+        :param _: None
+        :param similarity_paper_pair: (cosine_similarity, paper_id)
+        :return: None, (cosine_similarity, paper_id) once
+        """
+        for pair in top_k(similarity_paper_pair, TOP_PAPERS):
+            yield None, pair
 
     def reducer_find_highest_similarity(self, _, similarity_paper_pair):
         """
-        This reducer orders the list of papers by their similarity compared with
-        the randomly selected paper and returns the paper which is most similar
-        to the randomly selected paper
+        This reducer selects, among the papers kept by the combiners, the paper which is most similar
+        to the randomly selected paper, without sorting the whole list of papers
         :param _: None
-        :param similarity_paper_pair:(cosine_similarity, (paper_id, paper_summary))
-        :return: sorted_similarity_paper_pairs[0]:
-        the (cosine_similarity, (paper_id, paper_summary)) construct for the paper
+        :param similarity_paper_pair: (cosine_similarity, paper_id)
+        :return: the (cosine_similarity, paper_id) construct for the paper
         with the highest similarity compared to the randomly selected paper
         """
 
-        # Sort by cosine similarity of the paper
-        sorted_similarity_paper_pairs = sorted(similarity_paper_pair, key=lambda x: x[0], reverse=True)
-        yield sorted_similarity_paper_pairs[0]
+        # Keep only the highest cosine similarity
+        for pair in top_k(similarity_paper_pair, TOP_PAPERS):
+            yield pair
 
     def steps(self):
         return [
-            MRStep(mapper=self.mapper_paper_summary),
-            MRStep(mapper=self.mapper_compute_cosine_similarity,
+            MRStep(mapper_init=self.mapper_init,
+                   mapper=self.mapper_compute_cosine_similarity,
+                   mapper_final=self.mapper_final,
+                   combiner=self.combiner_find_highest_similarity,
                    reducer=self.reducer_find_highest_similarity)
         ]
 
+    def run_job(self):
+        """
+        Runs the job and prints each paper of its output as (cosine_similarity, (paper_id, paper_summary)); the
+        summaries are read from the local input files, through their offsets files if json_converter.py wrote them.
+        The papers are printed whether or not the output is written to --output-dir or --no-cat-output is given,
+        the output of the job only has the ids.
+        """
+        self.set_up_logging(quiet=self.options.quiet, verbose=self.options.verbose,
+                            stream=codecs.getwriter('utf_8')(self.stderr))
+
+        with self.make_runner() as runner:
+            try:
+                runner.run()
+            except StepFailedException as e:
+                log.error(str(e))
+                sys.exit(1)
+            pairs = list(self.parse_output(runner.cat_output()))
+
+        papers = find_papers(self.options.args, [paper_id for _, paper_id in pairs])
+        for cosine_similarity, paper_id in pairs:
+            paper_summary = papers[paper_id]["summary"].replace("\n", " ") if paper_id in papers else None
+            self.stdout.write((json.dumps(cosine_similarity) + '\t' + json.dumps([paper_id, paper_summary]) + '\n')
+                              .encode('utf-8'))
+        self.stdout.flush()
 
 if __name__ == '__main__':
     compute_random_paper_aspects()
@@ -0,0 +1,283 @@
+"""
+Use this script to build a TF-IDF index of all the paper summaries once and to find the papers most similar to a
+paper from it. The summaries are tokenized once, a single vocabulary and the inverse document frequencies are fitted
+on the whole corpus (idf = log2(number of papers / document frequency), as gensim's TfidfModel computes it), and the
+L2-normalised TF-IDF vectors of the papers are stored as the arrays of a CSR matrix in a folder:
+- data.npy, indices.npy, indptr.npy: the CSR matrix, one row per paper and one column per term
+- idf.npy: inverse document frequency of each term
+- vocabulary.json and papers.json: the terms of the columns and the paper ids of the rows
+The arrays are memory-mapped when the index is loaded. The cosine similarities of query papers with all the others are
+sparse matrix products: the index is read block of papers by block of papers and each block is multiplied once by the
+matrix of all the queries, so many query papers share a single pass over the index. Example:
+python tfidf_index.py build arxivData_lines.json --index arxiv_index
+python tfidf_index.py query --index arxiv_index --paper-id 1802.00209v1
+python tfidf_index.py batch queries.txt --index arxiv_index --top-papers 10
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from array import array
+from collections import Counter
+
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+
+from paper_tokens import summary_tokens
+
+INPUT_FILE = 'arxivData_lines.json'
+DEFAULT_INDEX = 'arxiv_index'
+
+# Number of most similar papers in the result, as in task 5
+DEFAULT_TOP_PAPERS = 1
+
+# Number of decimals of the similarities, as in task 5
+DECIMALS = 3
+
+# Default number of papers of the index scored together against all the query papers
+DEFAULT_BLOCK_ROWS = 8192
+
+
+def tfidf_vector(term_counts, idf):
+    """
+    :param term_counts: Counter of term index -> number of occurrences
+    :param idf: array of the inverse document frequency of each term
+    :return: (sorted array of the term indices with a weight, array of their L2-normalised TF-IDF weights)
+    """
+    terms = np.array(sorted(term_counts), dtype=np.int64)
+    weights = np.array([term_counts[term] for term in terms.tolist()], dtype=float) * idf[terms]
+    norm = math.sqrt(float(np.dot(weights, weights)))
+    kept = weights > 0
+    return terms[kept], weights[kept] / (norm or 1.0)
+
+
+def build_index(input_file=INPUT_FILE, index_path=DEFAULT_INDEX):
+    """
+    Tokenizes the summaries of the input file once and writes the TF-IDF index
+    :param input_file: file with a paper per line, as written by json_converter.py
+    :param index_path: folder of the index, created if needed
+    :return: (number of papers, number of terms)
+    """
+    vocabulary = {}
+    paper_ids = []
+    term_counts = []
+    with open(input_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            paper = json.loads(line)
+            paper_ids.append(paper["id"])
+
+            counts = Counter(vocabulary.setdefault(token, len(vocabulary)) for token in summary_tokens(paper["summary"]))
+            term_counts.append((array('i', counts.keys()), array('d', counts.values())))
+
+    # Document frequency of each term, each paper counts a term once
+    document_frequency = np.zeros(len(vocabulary))
+    for terms, _ in term_counts:
+        document_frequency[np.frombuffer(terms, dtype=np.int32)] += 1
+    idf = np.log2(len(paper_ids) / np.maximum(document_frequency, 1))
+
+    indptr = [0]
+    indices = []
+    data = []
+    for terms, counts in term_counts:
+        paper_terms, paper_weights = tfidf_vector(dict(zip(terms, counts)), idf)
+        indices.append(paper_terms)
+        data.append(paper_weights)
+        indptr.append(indptr[-1] + len(paper_terms))
+
+    # The column indices and row pointers get the same type, so that scipy does not copy them when they are loaded
+    index_dtype = np.int32 if indptr[-1] < 2 ** 31 else np.int64
+    os.makedirs(index_path, exist_ok=True)
+    np.save(os.path.join(index_path, 'data.npy'), np.concatenate(data or [np.zeros(0)]).astype(np.float32))
+    np.save(os.path.join(index_path, 'indices.npy'),
+            np.concatenate(indices or [np.zeros(0, dtype=np.int64)]).astype(index_dtype))
+    np.save(os.path.join(index_path, 'indptr.npy'), np.array(indptr, dtype=index_dtype))
+    np.save(os.path.join(index_path, 'idf.npy'), idf)
+    with open(os.path.join(index_path, 'vocabulary.json'), 'w') as f:
+        json.dump(sorted(vocabulary, key=vocabulary.get), f)
+    with open(os.path.join(index_path, 'papers.json'), 'w') as f:
+        json.dump(paper_ids, f)
+    return len(paper_ids), len(vocabulary)
+
+
+class TfidfIndex:
+    """
+    Memory-mapped TF-IDF index written by build_index()
+    """
+
+    def __init__(self, index_path=DEFAULT_INDEX):
+        def load(name):
+            return np.load(os.path.join(index_path, name), mmap_mode='r')
+
+        with open(os.path.join(index_path, 'vocabulary.json')) as f:
+            self.terms = json.load(f)
+        with open(os.path.join(index_path, 'papers.json')) as f:
+            self.paper_ids = json.load(f)
+        self.idf = load('idf.npy')
+        self.matrix = csr_matrix((load('data.npy'), load('indices.npy'), load('indptr.npy')),
+                                 shape=(len(self.paper_ids), len(self.terms)), copy=False)
+        self._vocabulary = None
+        self._rows = None
+
+    def row(self, paper_id):
+        """
+        :param paper_id: id of a paper of the index
+        :return: index of its row, None if the paper is not in the index
+        """
+        if self._rows is None:
+            self._rows = {paper_id: row for row, paper_id in enumerate(self.paper_ids)}
+        return self._rows.get(paper_id)
+
+    def summary_vector(self, summary):
+        """
+        :param summary: summary of any paper; its words which are not in the vocabulary are left out
+        :return: 1 x number of terms CSR matrix of its L2-normalised TF-IDF vector
+        """
+        if self._vocabulary is None:
+            self._vocabulary = {term: index for index, term in enumerate(self.terms)}
+        term_counts = Counter(self._vocabulary[token] for token in summary_tokens(summary)
+                              if token in self._vocabulary)
+        terms, weights = tfidf_vector(term_counts, self.idf)
+        return csr_matrix((weights, terms, [0, len(terms)]), shape=(1, len(self.terms)))
+
+    def paper_vector(self, paper_id):
+        """
+        :param paper_id: id of a paper of the index
+        :return: 1 x number of terms CSR matrix of its TF-IDF vector
+        """
+        return self.matrix[self.row(paper_id)]
+
+    def most_similar(self, vector, n=DEFAULT_TOP_PAPERS, exclude=None):
+        """
+        :param vector: 1 x number of terms CSR matrix of an L2-normalised TF-IDF vector
+        :param n: number of papers in the result
+        :param exclude: id of a paper left out of the result, e.g. the paper of the vector
+        :return: list of at most n (cosine_similarity, paper_id), highest first
+        """
+        return self.most_similar_batch(vector, n, [exclude])[0]
+
+    def most_similar_batch(self, vectors, n=DEFAULT_TOP_PAPERS, exclude=None, block_rows=DEFAULT_BLOCK_ROWS):
+        """
+        Scores all the query vectors together: each block of rows of the index is multiplied once by the matrix of
+        the queries, and only the n best papers of each query are kept between the blocks
+        :param vectors: number of queries x number of terms CSR matrix of L2-normalised TF-IDF vectors
+        :param n: number of papers in the result of each query
+        :param exclude: list of the id of a paper left out of the result of each query, or None
+        :param block_rows: number of papers of the index scored together
+        :return: list of the list of at most n (cosine_similarity, paper_id) of each query, highest first
+        """
+        queries = vectors.shape[0]
+        excluded_rows = np.array([-1 if paper_id is None or self.row(paper_id) is None else self.row(paper_id)
+                                  for paper_id in (exclude or [None] * queries)], dtype=np.int64)
+        query_terms = vectors.T.tocsr()
+        best_scores = np.zeros((queries, 0))
+        best_rows = np.zeros((queries, 0), dtype=np.int64)
+
+        for start in range(0, self.matrix.shape[0], block_rows):
+            block = self.matrix[start:start + block_rows]
+            scores = block.dot(query_terms).toarray().T
+            end = start + scores.shape[1]
+            excluded = np.flatnonzero((excluded_rows >= start) & (excluded_rows < end))
+            scores[excluded, excluded_rows[excluded] - start] = -np.inf
+
+            # Select the n highest scores of each query among its best papers so far and the papers of the block
+            scores = np.hstack([best_scores, scores])
+            rows = np.hstack([best_rows, np.broadcast_to(np.arange(start, end), (queries, end - start))])
+            if scores.shape[1] > n:
+                top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1).tolist()
+        best_rows = np.take_along_axis(best_rows, order, axis=1).tolist()
+        return [[(round(score, DECIMALS), self.paper_ids[row]) for score, row in zip(scores, rows)
+                 if score != -np.inf]
+                for scores, rows in zip(best_scores, best_rows)]
+
+    def query_vectors(self, queries):
+        """
+        :param queries: list of (paper_id, summary); the vector of a paper of the index is read from the index when
+                        its summary is None, otherwise the summary is tokenized
+        :return: number of queries x number of terms CSR matrix of their TF-IDF vectors
+        """
+        if not queries:
+            return csr_matrix((0, len(self.terms)))
+        return vstack([self.paper_vector(paper_id) if summary is None else self.summary_vector(summary)
+                       for paper_id, summary in queries], format='csr')
+
+
+def read_queries(query_file):
+    """
+    :param query_file: file with a query per line: the id of a paper of the index or a JSON record of a paper with
+                       its summary, e.g. a line of arxivData_lines.json
+    :return: list of (paper_id, summary), summary is None for the paper ids
+    """
+    queries = []
+    with open(query_file) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith('{'):
+                paper = json.loads(line)
+                queries.append((paper.get("id"), paper["summary"]))
+            elif line:
+                queries.append((line, None))
+    return queries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query a TF-IDF index of the paper summaries')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    build_parser = subparsers.add_parser('build', help='tokenize the summaries and write the index')
+    build_parser.add_argument('input_file', nargs='?', default=INPUT_FILE, help='file written by json_converter.py')
+    build_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+
+    query_parser = subparsers.add_parser('query', help='print the papers most similar to a paper')
+    query_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    query_group = query_parser.add_mutually_exclusive_group(required=True)
+    query_group.add_argument('--paper-id', help='id of a paper of the index, e.g. printed by random_paper_selector.py')
+    query_group.add_argument('--summary', help='summary of any paper')
+    query_parser.add_argument('--top-papers', type=int, default=DEFAULT_TOP_PAPERS)
+
+    batch_parser = subparsers.add_parser('batch', help='print the papers most similar to each paper of a file')
+    batch_parser.add_argument('query_file', help='file with a paper id or a JSON record of a paper per line')
+    batch_parser.add_argument('--index', default=DEFAULT_INDEX, help='folder of the index')
+    batch_parser.add_argument('--top-papers', type=int, default=DEFAULT_TOP_PAPERS)
+    batch_parser.add_argument('--block-rows', type=int, default=DEFAULT_BLOCK_ROWS,
+                              help='number of papers of the index scored together against all the queries')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        papers, terms = build_index(args.input_file, args.index)
+        print('{} papers and {} terms written to the index {}'.format(papers, terms, args.index))
+    elif args.command == 'batch':
+        index = TfidfIndex(args.index)
+        batch_queries = []
+        for query_id, query_summary in read_queries(args.query_file):
+            if query_summary is None and index.row(query_id) is None:
+                print('Paper {} is not in the index, skipped'.format(query_id), file=sys.stderr)
+            else:
+                batch_queries.append((query_id, query_summary))
+
+        results = index.most_similar_batch(index.query_vectors(batch_queries), args.top_papers,
+                                           [query_id for query_id, _ in batch_queries], args.block_rows)
+        for (query_id, _), pairs in zip(batch_queries, results):
+            for pair in pairs:
+                print(json.dumps(query_id) + '\t' + json.dumps(list(pair)))
+    else:
+        index = TfidfIndex(args.index)
+        if args.paper_id is not None:
+            if index.row(args.paper_id) is None:
+                parser.error('paper {} is not in the index'.format(args.paper_id))
+            query_vector = index.paper_vector(args.paper_id)
+        else:
+            query_vector = index.summary_vector(args.summary)
+
+        for similarity, paper_id in index.most_similar(query_vector, args.top_papers, args.paper_id):
+            print(json.dumps(similarity) + '\t' + json.dumps(paper_id))
@@ -0,0 +1,186 @@
+"""
+Use this script to cache the tokenized summaries of the papers on disk, so that text_similarity_task5.py does not run
+the NLTK tokenizers again for every paper of every run. Each summary is keyed by a 64 bit hash of the tokenizer
+settings and of its text: a changed summary or a change of the tokenization or of the NLTK version gets a new key
+and misses the cache, and only those summaries are tokenized by NLTK. The cache is a folder of NumPy files:
+- keys.npy: sorted keys of the cached summaries
+- sentence_starts.npy, token_starts.npy: first sentence and first token of each summary, and the totals
+- sentence_lengths.npy: number of words of each sentence
+- tokens.npy: id of each word, in the vocabulary
+- vocabulary.json: the words of the ids
+Building the cache again reuses the tokens of the summaries which did not change and leaves out the others. The new
+cache is written into a separate folder which then replaces the old one, so an interrupted build never leaves files of
+both caches together. Example:
+python token_cache.py arxivData_lines.json --cache token_cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from paper_tokens import summary_sentences, tokenizer_settings
+
+INPUT_FILE = 'arxivData_lines.json'
+DEFAULT_CACHE = 'token_cache'
+
+
+def summary_key(summary):
+    """
+    :param summary: summary of a paper
+    :return: key of the tokens of the summary with the current tokenizer settings
+    """
+    digest = hashlib.blake2b((tokenizer_settings() + '\0' + summary).encode('utf-8'), digest_size=8).digest()
+    return np.frombuffer(digest, dtype=np.uint64)[0]
+
+
+def build_token_cache(input_file=INPUT_FILE, cache_path=DEFAULT_CACHE):
+    """
+    Writes the tokens of the summaries of the input file, tokenizing only the summaries missing from the current cache
+    :param input_file: file with a paper per line, as written by json_converter.py
+    :param cache_path: folder of the cache, created or replaced
+    :return: (number of summaries, number of summaries tokenized by NLTK)
+    """
+    # A build interrupted while replacing the cache leaves the old cache complete in the .old folder
+    old_path = cache_path.rstrip('/\\') + '.old'
+    previous_path = cache_path if os.path.exists(os.path.join(cache_path, 'keys.npy')) else old_path
+    cache = TokenCache(previous_path) if os.path.exists(os.path.join(previous_path, 'keys.npy')) else None
+    sentences_by_key = {}
+    tokenized = 0
+    with open(input_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            summary = json.loads(line)["summary"]
+            key = int(summary_key(summary))
+            if key in sentences_by_key:
+                continue
+
+            sentences = cache.sentences(summary) if cache is not None else None
+            if sentences is None:
+                sentences = summary_sentences(summary)
+                tokenized += 1
+            sentences_by_key[key] = sentences
+
+    vocabulary = {}
+    keys = sorted(sentences_by_key)
+    sentence_starts = [0]
+    token_starts = [0]
+    sentence_lengths = []
+    tokens = []
+    for key in keys:
+        for sentence in sentences_by_key[key]:
+            sentence_lengths.append(len(sentence))
+            tokens.extend(vocabulary.setdefault(word, len(vocabulary)) for word in sentence)
+        sentence_starts.append(len(sentence_lengths))
+        token_starts.append(len(tokens))
+
+    # The files of the old cache are still mapped, the new cache is written next to it
+    new_path = cache_path.rstrip('/\\') + '.new'
+    if os.path.exists(new_path):
+        shutil.rmtree(new_path)
+    os.makedirs(new_path)
+    np.save(os.path.join(new_path, 'keys.npy'), np.array(keys, dtype=np.uint64))
+    np.save(os.path.join(new_path, 'sentence_starts.npy'), np.array(sentence_starts, dtype=np.int64))
+    np.save(os.path.join(new_path, 'token_starts.npy'), np.array(token_starts, dtype=np.int64))
+    np.save(os.path.join(new_path, 'sentence_lengths.npy'), np.array(sentence_lengths, dtype=np.int32))
+    np.save(os.path.join(new_path, 'tokens.npy'), np.array(tokens, dtype=np.int32))
+    with open(os.path.join(new_path, 'vocabulary.json'), 'w') as f:
+        json.dump(sorted(vocabulary, key=vocabulary.get), f)
+
+    # The old cache is unmapped and moved away before the new one takes its name, which also works on Windows
+    if cache is not None:
+        cache.close()
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    if os.path.exists(cache_path):
+        os.rename(cache_path, old_path)
+    os.rename(new_path, cache_path)
+    if os.path.exists(old_path):
+        shutil.rmtree(old_path)
+    return len(keys), tokenized
+
+
+class TokenCache:
+    """
+    Memory-mapped tokens of the summaries written by build_token_cache()
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE):
+        def load(name):
+            return np.load(os.path.join(cache_path, name), mmap_mode='r')
+
+        self.keys = load('keys.npy')
+        self.sentence_starts = load('sentence_starts.npy')
+        self.token_starts = load('token_starts.npy')
+        self.sentence_lengths = load('sentence_lengths.npy')
+        self.tokens = load('tokens.npy')
+        with open(os.path.join(cache_path, 'vocabulary.json')) as f:
+            self.vocabulary = json.load(f)
+
+    def close(self):
+        """
+        Releases the memory-mapped files, e.g. before they are replaced; the cache cannot be read anymore
+        """
+        self.keys = self.sentence_starts = self.token_starts = self.sentence_lengths = self.tokens = None
+
+    def sentences(self, summary):
+        """
+        :param summary: summary of a paper
+        :return: list of the sentences of the summary, each a list of its lowercased words, None if it is not cached
+        """
+        key = summary_key(summary)
+        position = int(np.searchsorted(self.keys, key))
+        if position == len(self.keys) or self.keys[position] != key:
+            return None
+
+        vocabulary = self.vocabulary
+        words = [vocabulary[token] for token in
+                 self.tokens[self.token_starts[position]:self.token_starts[position + 1]].tolist()]
+        sentences = []
+        start = 0
+        for length in self.sentence_lengths[self.sentence_starts[position]:self.sentence_starts[position + 1]].tolist():
+            sentences.append(words[start:start + length])
+            start += length
+        return sentences
+
+
+class CachedTokenizer:
+    """
+    Tokenizes the summaries like summary_sentences(), reading the cached tokens when the cache folder exists.
+    hits summaries were read from the cache and misses were tokenized by NLTK.
+    """
+
+    def __init__(self, cache_path=DEFAULT_CACHE):
+        """
+        :param cache_path: folder of the cache, ignored if it does not exist
+        """
+        self.cache = TokenCache(cache_path) if os.path.exists(os.path.join(cache_path, 'keys.npy')) else None
+        self.hits = 0
+        self.misses = 0
+
+    def sentences(self, summary):
+        """
+        :param summary: summary of a paper
+        :return: list of the sentences of the summary, each a list of its lowercased words
+        """
+        sentences = self.cache.sentences(summary) if self.cache is not None else None
+        if sentences is None:
+            self.misses += 1
+            return summary_sentences(summary)
+        self.hits += 1
+        return sentences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Cache the tokenized summaries of the papers')
+    parser.add_argument('input_file', nargs='?', default=INPUT_FILE,
+                        help='file with a JSON record of a paper per line')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help='folder of the cache')
+    args = parser.parse_args()
+
+    summaries, tokenized = build_token_cache(args.input_file, args.cache)
+    print('{} summaries written to the cache {}, {} of them tokenized'.format(summaries, args.cache, tokenized))
@@ -1,15 +1,41 @@
+import sys
+
 import numpy as np
+from scipy.sparse import random as sparse_random
 
 """
-Use this script to generate input matrices and their cross product and save these data into separate files
+Use this script to generate input matrices and their cross product and save these data into separate files.
+With a density, the matrices are sparse and saved as COO text files of "row column value" lines for the sparse mode
+of matrix_task6.py; the product is still saved as a dense matrix for result_validator.py.
+Example:
+python i.py
+python i.py 5000 300 4000
+python i.py 2000 3000 1000 0.01
 """
 
-A = np.random.rand(1000, 50)
+# Default shapes of the matrices: A is ROWS x SHARED and B is SHARED x COLUMNS
+ROWS = 1000
+SHARED = 50
+COLUMNS = 2000
+
+rows, shared, columns = (int(size) for size in sys.argv[1:4]) if len(sys.argv) > 3 else (ROWS, SHARED, COLUMNS)
+density = float(sys.argv[4]) if len(sys.argv) > 4 else None
+
+if density is None:
+    A = np.random.rand(rows, shared)
+
+    B = np.random.rand(shared, columns)
+
+    # The "# rows columns" headers give the shapes to matrix_task6.py without a pass over the files
+    np.savetxt('A.txt', A, header='{} {}'.format(rows, shared))
+    np.savetxt('B.txt', B, header='{} {}'.format(shared, columns))
+else:
+    A = sparse_random(rows, shared, density, format='coo')
 
-B = np.random.rand(50, 2000)
+    B = sparse_random(shared, columns, density, format='coo')
 
-np.savetxt('A.txt', A)
-np.savetxt('B.txt', B)
+    np.savetxt('A.coo', np.column_stack([A.row, A.col, A.data]), fmt=['%d', '%d', '%.18e'])
+    np.savetxt('B.coo', np.column_stack([B.row, B.col, B.data]), fmt=['%d', '%d', '%.18e'])
 
-C = np.dot(A, B)
-np.savetxt('C.txt', C)
+C = A.dot(B)
+np.savetxt('C.txt', C.toarray() if density is not None else C)
@@ -1,125 +1,346 @@
 import os
+from itertools import chain, islice
 
 import numpy as np
+from mrjob.compat import jobconf_from_env
 from mrjob.job import MRJob
 from mrjob.step import MRStep
+from scipy.sparse import coo_matrix, load_npz
 
-# Constants regarding the input matrices
+# Names of the input matrices, taken from the file names: the job computes A x B
 A_NAME = 'A'
-A_ROWS = 1000
-A_COLUMNS = 50
-
 B_NAME = 'B'
-B_ROWS = 50
-B_COLUMNS = 2000
+
+# Default number of rows and columns of the blocks the matrices are split into
+DEFAULT_BLOCK_SIZE = 100
+
+# Number of lines of a COO text file read at once in the sparse mode
+SPARSE_CHUNK_LINES = 1000000
+
+# Extension of the CSR matrices saved by scipy.sparse.save_npz(), the other files of the sparse mode are COO text
+CSR_EXTENSION = '.npz'
+
+# Start of the optional "# rows columns" header line of a dense input file, as written by np.savetxt(header=...)
+HEADER_PREFIX = '#'
+
+# Jobconf keys passing the shapes found before the job runs to the mappers
+A_ROWS_JOBCONF = 'matrix.a.rows'
+B_COLUMNS_JOBCONF = 'matrix.b.columns'
+
+
+def sparse_blocks(rows, columns, values, block_size):
+    """
+    Splits the non-zero elements of a sparse matrix into square blocks
+    :param rows: array of the rows of the elements
+    :param columns: array of their columns
+    :param values: array of their values, the zeros are left out
+    :param block_size: number of rows and columns of the blocks
+    :return: generator of ((row_block, column_block), (rows, columns, values)) for each block with non-zero elements,
+             the rows and columns relative to the block as lists
+    """
+    kept = values != 0
+    rows, columns, values = rows[kept], columns[kept], values[kept]
+    if not len(values):
+        return
+    row_blocks, column_blocks = rows // block_size, columns // block_size
+
+    # Sort the elements by block and cut the sorted arrays where the block changes
+    order = np.lexsort((column_blocks, row_blocks))
+    row_blocks, column_blocks = row_blocks[order], column_blocks[order]
+    rows, columns, values = rows[order] % block_size, columns[order] % block_size, values[order]
+    starts = np.concatenate([[0], np.flatnonzero((np.diff(row_blocks) != 0) | (np.diff(column_blocks) != 0)) + 1])
+    ends = np.concatenate([starts[1:], [len(values)]])
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        yield (int(row_blocks[start]), int(column_blocks[start])), \
+              (rows[start:end].tolist(), columns[start:end].tolist(), values[start:end].tolist())
+
+
+def input_matrix_name(input_uri):
+    """
+    For identifying purposes, the file name is the name of the matrix, ex. .../A.txt -> 'A'
+    :param input_uri: path or URI of the input file as given on the command line, the runners may rename the local copy
+    :return: name of the matrix
+    """
+    name = os.path.splitext(os.path.basename(input_uri))[0]
+    assert name in (A_NAME, B_NAME), "Matrix " + name + " is neither " + A_NAME + " nor " + B_NAME
+    return name
+
+
+def matrix_shape(input_path):
+    """
+    Finds the shape of a dense matrix from the first line of its input file only, so the launcher never scans the
+    whole matrix
+    :param input_path: path to the input file of the matrix
+    :return: (rows, columns) of the matrix from its "# rows columns" header written by i.py, or (None, columns) from
+             its first row without a header
+    """
+    with open(input_path) as f:
+        first_line = f.readline()
+    if first_line.startswith(HEADER_PREFIX):
+        rows, columns = first_line[len(HEADER_PREFIX):].split()
+        return int(rows), int(columns)
+    return None, len(first_line.split())
 
 
 class MatrixMatrixMultiplication(MRJob):
+    """
+    Multiplies the matrices block by block. Both matrices are split into square blocks of --block-size rows and
+    columns and the blocks are keyed by the tile (I, K) of the result they are needed for: block (I, J) of A is sent
+    to every tile of row I of the result and block (J, K) of B to every tile of column K. The reducer of (I, K)
+    multiplies the blocks of A and B of each J and adds up the products, so the work is spread over as many reducers
+    as there are tiles in the result, whatever the shared dimension. The number of rows of A and of columns of B are
+    taken from --a-rows and --b-columns, or else from the first line of the input files by matrix_shape(), before the
+    job runs, and passed to the mappers in the jobconf.
+    In the sparse mode, only the non-zero elements of the blocks are sent, as (rows, columns, values) lists, and they
+    are keyed by J instead, so that no block is sent more than once: the reducer of J multiplies the non-zero elements
+    of column J of A with those of row J of B as sparse matrices and emits the non-zero part of each tile it
+    contributes to, and the next step adds the parts of each tile. The output has only the non-zero elements of the
+    result.
+    """
+
+    def configure_args(self):
+        super(MatrixMatrixMultiplication, self).configure_args()
+        self.add_passthru_arg('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                              help='Number of rows and columns of the blocks of the matrices')
+        self.add_passthru_arg('--sparse', action='store_true',
+                              help='Read sparse matrices, COO text files of "row column value" lines or CSR .npz '
+                                   'files, and write only the non-zero elements of the result')
+        self.add_passthru_arg('--a-rows', type=int,
+                              help='Number of rows of A, read from the "# rows columns" header of its file if not set')
+        self.add_passthru_arg('--b-columns', type=int,
+                              help='Number of columns of B, read from the first line of its file if not set')
+
+    def jobconf(self):
+        """
+        Adds the number of rows of A and of columns of B to the jobconf when the job is launched, so the mappers of
+        the dense mode know how many tiles of the result each block is sent to. They come from --a-rows and
+        --b-columns, or else from the first line of the input files
+        """
+        jobconf = super(MatrixMatrixMultiplication, self).jobconf()
+        if self.options.sparse:
+            return jobconf
+        a_rows, b_columns = self.options.a_rows, self.options.b_columns
+        for input_path in self.options.args:
+            name = input_matrix_name(input_path)
+            if name == A_NAME and a_rows is None:
+                a_rows = matrix_shape(input_path)[0]
+                assert a_rows is not None, \
+                    "The file of " + A_NAME + " has no \"# rows columns\" header, its number of rows must be " \
+                    "given with --a-rows"
+            elif name == B_NAME and b_columns is None:
+                b_columns = matrix_shape(input_path)[1]
+        if a_rows is not None:
+            jobconf[A_ROWS_JOBCONF] = str(a_rows)
+        if b_columns is not None:
+            jobconf[B_COLUMNS_JOBCONF] = str(b_columns)
+        return jobconf
+
+    def tile_counts(self):
+        """
+        :return: (number of tiles of the result along its rows, along its columns)
+        """
+        a_rows, b_columns = jobconf_from_env(A_ROWS_JOBCONF), jobconf_from_env(B_COLUMNS_JOBCONF)
+        assert a_rows is not None and b_columns is not None, \
+            "The shapes of " + A_NAME + " and " + B_NAME + " are missing from the jobconf, both files are needed"
+        block_size = self.options.block_size
+        return (int(a_rows) + block_size - 1) // block_size, (int(b_columns) + block_size - 1) // block_size
 
     def mapper_raw(self, input_path, input_uri):
         """
-        This mapper is needed to be able to read the input file at once
-        and give the result to the next mapper as a whole.
+        This mapper reads the input file a block of rows at a time, so the whole matrix never has to fit
+        in memory, and splits each block of rows into blocks of columns. A "# rows columns" header line is skipped.
         This is overriding the default implementation from MRJob.
         :param input_path: path to the input file, will be received from command line
-        :param input_uri: URI for HDFS, S3 etc., not relevant for us
-        :return: (matrix_name, matrix) matrix name extracted from file name, and
-                 matrix elements as a list of lists
-        """
-        # Using numpy we can directly construct the matrix from the txt files
-        matrix = np.loadtxt(input_path)
-
-        # For identifying purposes, get the file name as the name of the matrix
-        # ex. .../A.txt -> 'A'
-        matrix_name = os.path.splitext(os.path.basename(input_path))[0]
-
-        # Checking if the input matrices have the defined shapes in the section "CONSTANTS" above
-        if matrix_name == A_NAME:
-            assert matrix.shape == (A_ROWS, A_COLUMNS), "Matrix " + A_NAME + " with shape " + str(matrix.shape) + \
-                                                        " does not fit the defined shape " + str((A_ROWS, A_COLUMNS))
-
-        if matrix_name == B_NAME:
-            assert matrix.shape == (B_ROWS, B_COLUMNS), "Matrix " + B_NAME + " with shape " + str(matrix.shape) + \
-                                                        " does not fit the defined shape " + str((B_ROWS, B_COLUMNS))
-
-        yield matrix_name, matrix.tolist()
-
-    def mapper_matrix_elements(self, matrix_name, matrix):
-        """
-        According to the algorithm from the course, this mapper splits the matrices onto elements
-        and associates identifying values to them for later processing
-        :param matrix_name: 'A' or 'B' from previous mapper (can be else if code is modified accordingly)
-        :param matrix: matrix elements in list representation
-        :return: ((i, k), (name, j, element))
-                 i - row in resulting matrix on which the element will be relevant
-                 k - column in resulting matrix on which the element will be relevant
-                 name - matrix name as defined
-                 j - iterating element for later processing
-                 element - the matrix element value
-        """
-        if matrix_name == A_NAME:
-            for k in range(B_COLUMNS):
-                for i in range(A_ROWS):
-                    for j in range(A_COLUMNS):
-                        yield (i, k), (A_NAME, j, matrix[i][j])
-
-        if matrix_name == B_NAME:
-            for i in range(A_ROWS):
-                for j in range(B_ROWS):
-                    for k in range(B_COLUMNS):
-                        yield (i, k), (B_NAME, j, matrix[j][k])
-
-    def reducer_matrix_prod_elements(self, key_pair, matrix_element_combined):
-        """
-        This reducer creates a list from all element constructs with the same key
-        :param key_pair: (i, k) the row and column of resulting matrix
-        :param matrix_element_combined: (name, j, element), a construct composed by the matrix name,
-               an integer and a matrix element value
-        :return: ((i, k), [(name, j, element), ...])
-        """
-        result = []
-        for matrix_element_tuple in matrix_element_combined:
-            result.append(matrix_element_tuple)
-        yield key_pair, result
-
-    def reducer_multiply_elements(self, key_pair, matrix_elements):
-        """
-        This reducer calculates the resulting matrix element value by position
-        :param key_pair: (i, k) the position of the result value in the resulting matrix
-        :param matrix_elements: [(name, j, element), ...]
-        :return: ((i, k), value) where (i, k) is the same as the parameter and value is the
-                 resulting computed element
-        """
-        # The parameter matrix_elements is a generator in MRJob's definition and the sorted()
-        # method returns us a list of a sorted list, so we take the first (0) value, which is
-        # the desired list
-        sorted_by_matrix_name = sorted(matrix_elements, key=lambda x: x[0])[0]
-
-        # Separate the elements belonging to the two matrices
-        list_A = []
-        list_B = []
-        for element in sorted_by_matrix_name:
-            if element[0] == A_NAME:
-                list_A.append(element)
-            if element[0] == B_NAME:
-                list_B.append(element)
-
-        # Sort the elements by the iterating value j
-        list_A.sort(key=lambda x: x[1])
-        list_B.sort(key=lambda x: x[1])
-
-        ret = 0
-        for j in range(A_COLUMNS):
-            ret += list_A[j][2] * list_B[j][2]
-
-        yield key_pair, ret
+        :param input_uri: URI of the input file as given on the command line, the matrix name is extracted from it
+        :return: ((I, K), (matrix_name, J, block)) matrix name extracted from file name,
+                 (I, K) - index of a tile of the result the block is needed for
+                 J - index of the block along the shared dimension
+                 block - block elements as a list of lists
+        """
+        name = input_matrix_name(input_uri)
+        row_tiles, column_tiles = self.tile_counts()
+        block_size = self.options.block_size
+        with open(input_path) as f:
+            # The header must not count in the first block of rows, otherwise the blocks would not line up
+            first_line = f.readline()
+            matrix_lines = f if first_line.startswith(HEADER_PREFIX) else chain([first_line], f)
+            row_block = 0
+            while True:
+                lines = list(islice(matrix_lines, block_size))
+                if not lines:
+                    break
+
+                # Using numpy we can directly construct the rows from the txt lines
+                rows = np.loadtxt(lines, ndmin=2)
+                for column_block in range(0, (rows.shape[1] + block_size - 1) // block_size):
+                    block = rows[:, column_block * block_size:(column_block + 1) * block_size].tolist()
+
+                    # A block (I, J) goes to the tiles (I, K) and B block (J, K) to the tiles (I, K) of every K or I
+                    if name == A_NAME:
+                        for k in range(column_tiles):
+                            yield (row_block, k), (A_NAME, column_block, block)
+                    else:
+                        for i in range(row_tiles):
+                            yield (i, column_block), (B_NAME, row_block, block)
+                row_block += 1
+
+    def reducer_multiply_blocks(self, tile, matrix_blocks):
+        """
+        This reducer multiplies each block of row I of A with the block of column K of B with the same index J,
+        and adds up the products
+        :param tile: (I, K) index of the tile in the resulting matrix
+        :param matrix_blocks: (name, J, block) for the blocks of row I of A and of column K of B
+        :return: ((i, k), value) where (i, k) is the position of the value in the resulting matrix
+        """
+        a_blocks = {}
+        b_blocks = {}
+        for matrix_name, shared_block, block in matrix_blocks:
+            if matrix_name == A_NAME:
+                a_blocks[shared_block] = np.array(block)
+            else:
+                b_blocks[shared_block] = np.array(block)
+
+        i, k = tile
+        assert sorted(a_blocks) == sorted(b_blocks), \
+            "The blocks " + str(sorted(a_blocks)) + " of row " + str(i) + " of " + A_NAME + \
+            " do not fit the blocks " + str(sorted(b_blocks)) + " of column " + str(k) + " of " + B_NAME
+        result = None
+        for shared_block in sorted(a_blocks):
+            a_block, b_block = a_blocks[shared_block], b_blocks[shared_block]
+            assert a_block.shape[1] == b_block.shape[0], \
+                "Block " + str((i, shared_block)) + " of " + A_NAME + " with shape " + str(a_block.shape) + \
+                " does not fit block " + str((shared_block, k)) + " of " + B_NAME + " with shape " + \
+                str(b_block.shape)
+            part = np.dot(a_block, b_block)
+            result = part if result is None else result + part
+        if result is None:
+            return
+
+        block_size = self.options.block_size
+        for row, values in enumerate(result.tolist(), i * block_size):
+            for column, value in enumerate(values, k * block_size):
+                yield (row, column), value
+
+    def mapper_raw_sparse(self, input_path, input_uri):
+        """
+        This mapper reads a sparse matrix, a CSR matrix at once or a COO text file a chunk of lines at a time,
+        and emits the non-zero elements of each block
+        :param input_path: path to the input file, will be received from command line
+        :param input_uri: URI of the input file as given on the command line, the matrix name is extracted from it
+        :return: (J, (matrix_name, I or K, (rows, columns, values)))
+        """
+        name = input_matrix_name(input_uri)
+
+        for rows, columns, values in self.read_sparse_elements(input_path):
+            for (row_block, column_block), elements in sparse_blocks(rows, columns, values, self.options.block_size):
+                # A block (I, J) and B block (J, K) are both keyed by J
+                if name == A_NAME:
+                    yield column_block, (A_NAME, row_block, elements)
+                else:
+                    yield row_block, (B_NAME, column_block, elements)
+
+    def read_sparse_elements(self, input_path):
+        """
+        Reads a CSR matrix at once, or a COO text file a chunk of lines at a time
+        :param input_path: path to the input file
+        :return: generator of (rows, columns, values) arrays of elements of the matrix
+        """
+        if input_path.endswith(CSR_EXTENSION):
+            matrix = load_npz(input_path).tocoo()
+            yield matrix.row.astype(np.int64), matrix.col.astype(np.int64), matrix.data.astype(float)
+            return
+
+        with open(input_path) as f:
+            while True:
+                lines = list(islice(f, SPARSE_CHUNK_LINES))
+                if not lines:
+                    break
+                elements = np.loadtxt(lines, ndmin=2)
+                yield elements[:, 0].astype(np.int64), elements[:, 1].astype(np.int64), elements[:, 2]
+
+    def reducer_multiply_sparse_blocks(self, shared_block, matrix_blocks):
+        """
+        This reducer multiplies the non-zero elements of column J of A with those of row J of B as sparse matrices
+        :param shared_block: J, index of the blocks along the shared dimension
+        :param matrix_blocks: (name, I or K, (rows, columns, values)) for the blocks of column J of A and of row J of B
+        :return: ((I, K), (rows, columns, values)) the non-zero elements of the part of each result tile
+        """
+        block_size = self.options.block_size
+        elements = {A_NAME: ([], [], []), B_NAME: ([], [], [])}
+        for matrix_name, index, (rows, columns, values) in matrix_blocks:
+            # The elements of A get their row in the matrix and those of B their column
+            if matrix_name == A_NAME:
+                rows = [index * block_size + row for row in rows]
+            else:
+                columns = [index * block_size + column for column in columns]
+            elements[matrix_name][0].extend(rows)
+            elements[matrix_name][1].extend(columns)
+            elements[matrix_name][2].extend(values)
+
+        a_rows, a_columns, a_values = elements[A_NAME]
+        b_rows, b_columns, b_values = elements[B_NAME]
+        if not a_values or not b_values:
+            return
+
+        # Only the rows of A and the columns of B with non-zero elements are kept, so the memory depends on those only
+        a_row_ids, a_rows = np.unique(a_rows, return_inverse=True)
+        b_column_ids, b_columns = np.unique(b_columns, return_inverse=True)
+        a_strip = coo_matrix((a_values, (a_rows, a_columns)), shape=(len(a_row_ids), block_size)).tocsr()
+        b_strip = coo_matrix((b_values, (b_rows, b_columns)), shape=(block_size, len(b_column_ids))).tocsr()
+        product = a_strip.dot(b_strip).tocoo()
+        for tile, tile_elements in sparse_blocks(a_row_ids[product.row], b_column_ids[product.col], product.data,
+                                                 block_size):
+            yield tile, tile_elements
+
+    def sum_sparse_parts(self, parts):
+        """
+        :param parts: parts of a result tile as (rows, columns, values) lists
+        :return: COO matrix of the sum of the parts, without zeros
+        """
+        rows, columns, values = [], [], []
+        for part_rows, part_columns, part_values in parts:
+            rows.extend(part_rows)
+            columns.extend(part_columns)
+            values.extend(part_values)
+        block_size = self.options.block_size
+        tile = coo_matrix((values, (rows, columns)), shape=(block_size, block_size)).tocsr()
+        tile.eliminate_zeros()
+        return tile.tocoo()
+
+    def combiner_sum_sparse_parts(self, tile, parts):
+        """
+        This combiner adds the sparse parts of a result tile computed by the reducers of the same task
+        :param tile: (I, K) index of the tile in the resulting matrix
+        :param parts: parts of the tile as (rows, columns, values) lists
+        :return: ((I, K), (rows, columns, values)) the non-zero elements of the sum of the parts
+        """
+        tile_sum = self.sum_sparse_parts(parts)
+        yield tile, (tile_sum.row.tolist(), tile_sum.col.tolist(), tile_sum.data.tolist())
+
+    def reducer_sum_sparse_parts(self, tile, parts):
+        """
+        This reducer adds the sparse parts of a result tile and yields its non-zero elements
+        :param tile: (I, K) index of the tile in the resulting matrix
+        :param parts: parts of the tile as (rows, columns, values) lists
+        :return: ((i, k), value) where (i, k) is the position of a non-zero value in the resulting matrix
+        """
+        i, k = tile
+        block_size = self.options.block_size
+        tile_sum = self.sum_sparse_parts(parts)
+        for row, column, value in zip(tile_sum.row.tolist(), tile_sum.col.tolist(), tile_sum.data.tolist()):
+            yield (i * block_size + row, k * block_size + column), value
 
     def steps(self):
+        if self.options.sparse:
+            return [
+                MRStep(mapper_raw=self.mapper_raw_sparse,
+                       reducer=self.reducer_multiply_sparse_blocks),
+                MRStep(combiner=self.combiner_sum_sparse_parts,
+                       reducer=self.reducer_sum_sparse_parts),
+            ]
         return [
-            MRStep(mapper_raw=self.mapper_raw),
-            MRStep(mapper=self.mapper_matrix_elements,
-                   reducer=self.reducer_matrix_prod_elements),
-            MRStep(reducer=self.reducer_multiply_elements),
+            MRStep(mapper_raw=self.mapper_raw,
+                   reducer=self.reducer_multiply_blocks),
         ]
 
 
@@ -0,0 +1,98 @@
+"""
+In-mapper combining for the counting jobs. The values of each key are summed in a dict inside the mapper instead of
+being emitted one record at a time, so that far fewer records are serialized, sorted and sent to the combiners and
+reducers. The dict is spilled (emitted and emptied) early when it holds too many keys or takes too much memory.
+"""
+
+import sys
+
+# Default limits of the dict before it is spilled
+DEFAULT_MAX_KEYS = 500000
+DEFAULT_MAX_MEMORY_MB = 256
+
+# Approximate size in bytes of a dict entry and of its summed value, besides the key itself
+ENTRY_OVERHEAD = 100
+
+
+def estimate_size(key):
+    """
+    :param key: a string or a tuple of strings and numbers
+    :return: approximate memory taken by the key in bytes
+    """
+    if isinstance(key, tuple):
+        return sys.getsizeof(key) + sum(estimate_size(part) for part in key)
+    return sys.getsizeof(key)
+
+
+class InMapperCombiner:
+    """
+    Sums values by key and keeps track of how much the shuffle was cut:
+    records_in values were added, records_out (key, total) pairs were emitted in spills spills.
+    """
+
+    def __init__(self, max_keys=DEFAULT_MAX_KEYS, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+        """
+        :param max_keys: maximum number of distinct keys held before spilling
+        :param max_memory_mb: maximum approximate memory of the held keys before spilling, in megabytes
+        """
+        self.max_keys = max_keys
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self.totals = {}
+        self.memory = 0
+        self.records_in = 0
+        self.records_out = 0
+        self.spills = 0
+
+    def add(self, key, value):
+        """
+        :param key: hashable key
+        :param value: number added to the total of the key
+        """
+        self.records_in += 1
+        totals = self.totals
+        if key in totals:
+            totals[key] += value
+        else:
+            totals[key] = value
+            self.memory += estimate_size(key) + ENTRY_OVERHEAD
+
+    def add_totals(self, key_total_pairs, records):
+        """
+        Adds totals which were already summed before, e.g. over a block of input rows
+        :param key_total_pairs: iterable of (key, total) pairs
+        :param records: number of values the totals were summed from
+        """
+        self.records_in += records
+        totals = self.totals
+        for key, value in key_total_pairs:
+            if key in totals:
+                totals[key] += value
+            else:
+                totals[key] = value
+                self.memory += estimate_size(key) + ENTRY_OVERHEAD
+
+    def is_full(self):
+        """
+        :return: True if one of the limits is reached
+        """
+        return len(self.totals) >= self.max_keys or self.memory >= self.max_memory
+
+    def spill_if_full(self):
+        """
+        :return: list of (key, total) pairs if one of the limits is reached, otherwise an empty list
+        """
+        if self.is_full():
+            return self.spill()
+        return []
+
+    def spill(self):
+        """
+        Empties the dict, e.g. from mapper_final
+        :return: list of (key, total) pairs
+        """
+        pairs = list(self.totals.items())
+        self.totals = {}
+        self.memory = 0
+        self.records_out += len(pairs)
+        self.spills += 1
+        return pairs
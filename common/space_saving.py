@@ -0,0 +1,187 @@
+"""
+Approximate heavy hitters for the counting jobs with bounded memory (Space-Saving, Metwally et al. 2005).
+A sketch monitors at most capacity items with a counter each. The counter of a new item replaces the smallest one
+and starts from its value, which is kept as the error of the new counter, so every counter overestimates the total of
+its item by at most its error and any item which is not monitored has a total of at most the floor of the sketch.
+Sketches of different mappers are merged by adding their counters (Agarwal et al. 2012, mergeable summaries):
+an item missing from a sketch is counted with the floor of that sketch. Only positive weights can be counted.
+"""
+
+import heapq
+from operator import itemgetter
+
+# Default number of counters of each sketch
+DEFAULT_SKETCH_SIZE = 10000
+
+
+class SpaceSaving:
+    """
+    Space-Saving sketch of the heaviest items of a stream of (item, weight) pairs
+    """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_SIZE):
+        """
+        :param capacity: maximum number of monitored items
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        self.floor = 0
+        self.evictions = 0
+
+        # Min-heap of (count, arrival number, item); the counts of the entries may be lower than the current ones
+        self._heap = []
+        self._pushed = 0
+
+    def _push(self, item):
+        heapq.heappush(self._heap, (self.counts[item], self._pushed, item))
+        self._pushed += 1
+
+    def _evict(self):
+        """
+        Stops monitoring the item with the smallest count
+        :return: its count
+        """
+        heap = self._heap
+        while True:
+            count, _, item = heap[0]
+
+            # The counts only grow, an outdated entry is pushed again with the current count
+            if self.counts[item] != count:
+                heapq.heapreplace(heap, (self.counts[item], self._pushed, item))
+                self._pushed += 1
+                continue
+
+            heapq.heappop(heap)
+            del self.counts[item]
+            del self.errors[item]
+            self.evictions += 1
+            return count
+
+    def add(self, item, weight):
+        """
+        :param item: hashable item
+        :param weight: positive number added to the total of the item
+        """
+        counts = self.counts
+        if item in counts:
+            counts[item] += weight
+            return
+
+        error = 0
+        if len(counts) >= self.capacity:
+            error = self.floor = self._evict()
+        counts[item] = error + weight
+        self.errors[item] = error
+        self._push(item)
+
+    def state(self):
+        """
+        :return: [floor, list of [item, count, error]], serializable to JSON
+        """
+        return [self.floor, [[item, count, self.errors[item]] for item, count in self.counts.items()]]
+
+    @classmethod
+    def merge(cls, states, capacity=DEFAULT_SKETCH_SIZE):
+        """
+        :param states: iterable of sketch states returned by state()
+        :param capacity: maximum number of monitored items of the merged sketch
+        :return: SpaceSaving sketch of the union of the streams of the sketches
+        """
+        # Every item starts from the sum of the floors; a sketch which monitors it adds the rest of its counter
+        floor = 0
+        counts = {}
+        errors = {}
+        for sketch_floor, counters in states:
+            floor += sketch_floor
+            for item, count, error in counters:
+                counts[item] = counts.get(item, 0) + count - sketch_floor
+                errors[item] = errors.get(item, 0) + error - sketch_floor
+
+        sketch = cls(capacity)
+        kept = heapq.nlargest(capacity + 1, counts.items(), key=itemgetter(1))
+        sketch.floor = floor
+        if len(kept) > capacity:
+            # The items left out are not monitored anymore, their totals are at most the largest count left out
+            sketch.floor += kept.pop()[1]
+        for item, count in kept:
+            sketch.counts[item] = floor + count
+            sketch.errors[item] = floor + errors[item]
+            sketch._push(item)
+        return sketch
+
+    def top(self, n):
+        """
+        :param n: number of items in the result
+        :return: (list of at most n (count, item) pairs, highest count first and equal counts by item,
+                  number of items of the list which are certainly among the n heaviest items,
+                  maximum overestimation of the count of any item)
+        """
+        # Equal counts are ordered by item, so the result does not depend on the order the items were added in
+        ranked = sorted(sorted(self.counts.items()), key=itemgetter(1), reverse=True)
+        pairs = [(count, item) for item, count in ranked[:n]]
+
+        # An item is certainly in the top n if its lowest possible total is above the count of any item left out
+        threshold = max([self.floor] + [count for _, count in ranked[n:n + 1]])
+        guaranteed = sum(1 for count, item in pairs if count - self.errors[item] >= threshold)
+        return pairs, guaranteed, max([self.floor] + [self.errors[item] for _, item in pairs])
+
+
+class HeavyHitterSketches:
+    """
+    Space-Saving sketches of the heaviest items of each result, e.g. of each genre or period,
+    kept in a mapper instead of the exact in-mapper sums; the memory does not grow with the number of items.
+    records_in weights were added, records_skipped negative weights were left out, evictions counters were replaced.
+    """
+
+    def __init__(self, capacity=DEFAULT_SKETCH_SIZE):
+        """
+        :param capacity: maximum number of monitored items of each sketch
+        """
+        self.capacity = capacity
+        self.sketches = {}
+        self.records_in = 0
+        self.records_skipped = 0
+        self.evictions = 0
+
+    def add(self, result, item, weight):
+        """
+        :param result: hashable key of the sketch, e.g. None, a genre or a period
+        :param item: hashable item
+        :param weight: number added to the total of the item, skipped if negative
+        """
+        if weight < 0:
+            self.records_skipped += 1
+            return
+        self.records_in += 1
+        if weight == 0:
+            return
+        if result not in self.sketches:
+            self.sketches[result] = SpaceSaving(self.capacity)
+        self.sketches[result].add(item, weight)
+
+    def add_totals(self, result_item_totals, records, skipped):
+        """
+        Adds totals which were already summed before, e.g. over the rows of a block with the negative weights left out
+        :param result_item_totals: iterable of ((result, item), total) pairs, the totals are not negative
+        :param records: number of weights the totals were summed from
+        :param skipped: number of negative weights left out before summing
+        """
+        self.records_in += records
+        self.records_skipped += skipped
+        for (result, item), total in result_item_totals:
+            if total == 0:
+                continue
+            if result not in self.sketches:
+                self.sketches[result] = SpaceSaving(self.capacity)
+            self.sketches[result].add(item, total)
+
+    def spill(self):
+        """
+        Emits the sketches, e.g. from mapper_final, and counts their replaced counters in evictions
+        :return: list of (result, sketch state) pairs
+        """
+        pairs = [(result, sketch.state()) for result, sketch in self.sketches.items()]
+        self.evictions += sum(sketch.evictions for sketch in self.sketches.values())
+        self.sketches = {}
+        return pairs
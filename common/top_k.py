@@ -0,0 +1,55 @@
+"""
+Bounded top-K aggregation for the final steps of the jobs. Instead of sorting every (score, item) pair of a key,
+only the K best pairs are kept, so memory is O(K) and time O(N log K). Partial top-K lists computed by
+combiners and reducers can be merged by the next step, since the top K of the union is within the union of the top Ks.
+"""
+
+import heapq
+from operator import itemgetter
+
+
+def top_k(score_item_pairs, k):
+    """
+    Selects the k pairs with the highest scores from a stream of (score, item) pairs.
+    Ties keep their order of arrival, so the result is the same as
+    sorted(score_item_pairs, key=lambda x: x[0], reverse=True)[:k]
+    :param score_item_pairs: iterable of (score, item)
+    :param k: number of pairs to keep
+    :return: list of at most k (score, item) pairs, highest score first
+    """
+    return heapq.nlargest(k, score_item_pairs, key=itemgetter(0))
+
+
+class TopK:
+    """
+    Streaming version of top_k() for reducers that see many keys: (score, item) pairs are pushed one by one,
+    e.g. from the reducer, and the k best are read once, e.g. from reducer_final.
+    """
+
+    def __init__(self, k):
+        """
+        :param k: number of pairs to keep
+        """
+        self.k = k
+        self._heap = []
+        self._pushed = 0
+
+    def push(self, score, item):
+        """
+        :param score: number the pairs are ranked by
+        :param item: any value, never compared
+        """
+        # The arrival number breaks ties in favour of the earlier pair and keeps items from being compared
+        entry = (score, -self._pushed, item)
+        self._pushed += 1
+
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, entry)
+
+    def pairs(self):
+        """
+        :return: list of at most k (score, item) pairs, highest score first
+        """
+        return [(score, item) for score, _, item in sorted(self._heap, key=itemgetter(0, 1), reverse=True)]